@@ -25,6 +25,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.metrics.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -115,3 +116,103 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+
+# FACE RECOGNITION
+# Storage precision of Register.face_embedding ("float16" or "float32")
+FACE_EMBEDDING_DTYPE = os.getenv("FACE_EMBEDDING_DTYPE", "float16")
+
+# Micro-batching of concurrent embedding requests (max size 1 disables it)
+FACE_BATCH_MAX_SIZE = int(os.getenv("FACE_BATCH_MAX_SIZE", "8"))
+FACE_BATCH_MAX_WAIT_MS = float(os.getenv("FACE_BATCH_MAX_WAIT_MS", "5"))
+
+# Optional out-of-process inference server (manage.py run_inference_server).
+# When set, face/emotion inference goes over this Unix socket and falls back
+# to in-process models if the server is unreachable.
+INFERENCE_SOCKET_PATH = os.getenv("INFERENCE_SOCKET_PATH") or None
+INFERENCE_SOCKET_TIMEOUT = float(os.getenv("INFERENCE_SOCKET_TIMEOUT", "10"))
+
+# Load models in a background thread at startup (readiness: /accounts/api/ready/)
+FACE_MODELS_WARMUP = os.getenv("FACE_MODELS_WARMUP", "0") == "1"
+
+# Embedding network backend: "eager", "torchscript" or "quantized" (int8).
+# Exported backends are cached in FACE_MODEL_CACHE_DIR (manage.py export_face_model)
+FACE_EMBEDDING_BACKEND = os.getenv("FACE_EMBEDDING_BACKEND", "eager")
+FACE_MODEL_CACHE_DIR = os.getenv("FACE_MODEL_CACHE_DIR", str(BASE_DIR / "model_cache"))
+FACE_BACKEND_MIN_COSINE = float(os.getenv("FACE_BACKEND_MIN_COSINE", "0.99"))
+# ...and may change at most this many pairwise match decisions on the stored face photos
+FACE_BACKEND_MAX_DECISION_FLIPS = int(os.getenv("FACE_BACKEND_MAX_DECISION_FLIPS", "0"))
+
+# Frames are decoded (JPEG draft mode) straight down to this longest edge
+FACE_DECODE_MAX_EDGE = int(os.getenv("FACE_DECODE_MAX_EDGE", "640"))
+
+# Largest accepted frame upload (raw/multipart bytes; base64 bodies are allowed 4/3 of this).
+# Keep it under DATA_UPLOAD_MAX_MEMORY_SIZE so base64 JSON bodies still fit.
+# Advertised to clients with FACE_DECODE_MAX_EDGE at /accounts/api/face-config/
+FACE_UPLOAD_MAX_BYTES = int(os.getenv("FACE_UPLOAD_MAX_BYTES", str(1536 * 1024)))
+
+# EMOTION CAPTURE
+# One Emotion row per staff member per interval; clients are told when to send the next frame
+EMOTION_CAPTURE_INTERVAL = int(os.getenv("EMOTION_CAPTURE_INTERVAL", "3600"))
+# Wait after a frame that failed verification/detection before trying again
+EMOTION_RETRY_INTERVAL = int(os.getenv("EMOTION_RETRY_INTERVAL", "30"))
+
+# Async emotion processing: record_emotion queues frames (202) for
+# `manage.py process_emotion_jobs`; queue depth at /accounts/api/emotion-queue/
+EMOTION_ASYNC = os.getenv("EMOTION_ASYNC", "0") == "1"
+# Pending frames above this are rejected with 503 (clients retry later)
+EMOTION_QUEUE_MAX_DEPTH = int(os.getenv("EMOTION_QUEUE_MAX_DEPTH", "500"))
+# Jobs left in Processing this long (crashed worker) are picked up again
+EMOTION_JOB_TIMEOUT = int(os.getenv("EMOTION_JOB_TIMEOUT", "300"))
+EMOTION_JOB_MAX_ATTEMPTS = int(os.getenv("EMOTION_JOB_MAX_ATTEMPTS", "3"))
+
+# Frame quality pre-filter (runs before MTCNN): grayscale copy scaled to FACE_QUALITY_EDGE,
+# rejected when too dark/bright, too flat or too blurry (variance of the Laplacian)
+FACE_QUALITY_CHECK = os.getenv("FACE_QUALITY_CHECK", "1") == "1"
+FACE_QUALITY_EDGE = int(os.getenv("FACE_QUALITY_EDGE", "256"))
+FACE_QUALITY_MIN_BRIGHTNESS = float(os.getenv("FACE_QUALITY_MIN_BRIGHTNESS", "40"))
+FACE_QUALITY_MAX_BRIGHTNESS = float(os.getenv("FACE_QUALITY_MAX_BRIGHTNESS", "220"))
+FACE_QUALITY_MIN_CONTRAST = float(os.getenv("FACE_QUALITY_MIN_CONTRAST", "15"))
+FACE_QUALITY_MIN_SHARPNESS = float(os.getenv("FACE_QUALITY_MIN_SHARPNESS", "15"))
+# Also require an OpenCV Haar-cascade face (cheap, but misses some poses)
+FACE_QUALITY_HAAR = os.getenv("FACE_QUALITY_HAAR", "0") == "1"
+
+# 1:N face index used by face login: "brute" (exact scan) or "ivf" (inverted lists
+# of int8/fp16 codes, re-ranked at full precision). IVF is only used from
+# FACE_INDEX_IVF_MIN_ROWS embeddings; compare with `manage.py benchmark_face_index`
+FACE_INDEX_BACKEND = os.getenv("FACE_INDEX_BACKEND", "brute")
+FACE_INDEX_IVF_MIN_ROWS = int(os.getenv("FACE_INDEX_IVF_MIN_ROWS", "2000"))
+FACE_INDEX_NLIST = int(os.getenv("FACE_INDEX_NLIST", "0"))  # 0 = sqrt(rows)
+FACE_INDEX_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "8"))
+FACE_INDEX_RERANK = int(os.getenv("FACE_INDEX_RERANK", "32"))
+FACE_INDEX_QUANTIZATION = os.getenv("FACE_INDEX_QUANTIZATION", "int8")  # "int8" or "fp16"
+
+# Face templates: besides the enrollment capture, keep up to FACE_TEMPLATES_MAX_LOGIN
+# embeddings from recent logins; matching uses the best template. A login is kept only
+# when it matched with at least MIN similarity and is not a near duplicate (>= MAX)
+FACE_TEMPLATES_MAX_LOGIN = int(os.getenv("FACE_TEMPLATES_MAX_LOGIN", "4"))
+FACE_TEMPLATE_MIN_SIMILARITY = float(os.getenv("FACE_TEMPLATE_MIN_SIMILARITY", "0.70"))
+FACE_TEMPLATE_MAX_SIMILARITY = float(os.getenv("FACE_TEMPLATE_MAX_SIMILARITY", "0.92"))
+
+# Inference threads and admission control. Size them so that
+# (web workers) x INFERENCE_MAX_CONCURRENCY x TORCH_NUM_THREADS ~= CPU cores.
+# 0 keeps torch's default (one intra-op thread per core, per process)
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", "0"))
+# Face/emotion inferences running at once per process (0 = unlimited). Callers beyond
+# that wait up to INFERENCE_QUEUE_TIMEOUT seconds, at most INFERENCE_MAX_WAITING of them
+# (0 = fail fast); the rest get 503 + Retry-After. Counters at /accounts/api/inference-stats/
+INFERENCE_MAX_CONCURRENCY = int(os.getenv("INFERENCE_MAX_CONCURRENCY", "2"))
+INFERENCE_QUEUE_TIMEOUT = float(os.getenv("INFERENCE_QUEUE_TIMEOUT", "2.0"))
+INFERENCE_MAX_WAITING = int(os.getenv("INFERENCE_MAX_WAITING", "8"))
+
+# Per-stage timings of the face/emotion pipelines: Prometheus histograms at
+# /accounts/metrics/ (per worker process) and a Server-Timing header on responses
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+# /accounts/metrics/, api/inference-stats/ and api/emotion-queue/ answer logged-in
+# admins, and scrapers sending "Authorization: Bearer <METRICS_TOKEN>" if set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "1") == "1"
+
+# Staff rows per page on the admin Emotion Management reports table
+ADMIN_REPORTS_PER_PAGE = int(os.getenv("ADMIN_REPORTS_PER_PAGE", "25"))
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        # Keep the in-memory face index and the daily summaries in sync
+        from . import signals  # noqa: F401
+
+        # Load the face/emotion models up front instead of on the first request
+        if getattr(settings, 'FACE_MODELS_WARMUP', False) and not getattr(settings, 'INFERENCE_SOCKET_PATH', None):
+            from .model_registry import start_background_warmup
+            start_background_warmup()
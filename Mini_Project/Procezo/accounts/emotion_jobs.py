@@ -0,0 +1,180 @@
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from . import rollups
+from .face_templates import best_similarity, templates_by_staff
+from .models import Emotion, EmotionJob
+from .utils import FACE_MATCH_THRESHOLD, detect_emotion_from_frame, face_region
+from .utils_face import analyze_faces_local, decode_image_bytes
+
+logger = logging.getLogger(__name__)
+
+# ================= ASYNC EMOTION QUEUE =================
+# With EMOTION_ASYNC on, record_emotion only stores the uploaded frame as an
+# EmotionJob and answers 202. `manage.py process_emotion_jobs` workers claim
+# jobs in batches, verify + classify them and bulk-insert the Emotion rows.
+# When the queue is deeper than EMOTION_QUEUE_MAX_DEPTH new frames are turned
+# away with 503, so a CPU spike delays emotion data instead of page loads.
+
+QUEUE_DEPTH_CACHE_KEY = 'accounts:emotion:queue_depth'
+
+
+def is_enabled():
+    return getattr(settings, 'EMOTION_ASYNC', False)
+
+
+def max_queue_depth():
+    return getattr(settings, 'EMOTION_QUEUE_MAX_DEPTH', 500)
+
+
+def pending_count():
+    """Pending jobs; cached for a few seconds so busy endpoints don't COUNT(*) every request."""
+    return cache.get_or_set(
+        QUEUE_DEPTH_CACHE_KEY,
+        lambda: EmotionJob.objects.filter(status=EmotionJob.STATUS_PENDING).count(),
+        timeout=5,
+    )
+
+
+def queue_full():
+    return pending_count() >= max_queue_depth()
+
+
+def enqueue(staff_id, frame_bytes):
+    job = EmotionJob.objects.create(staff_id=staff_id, frame=frame_bytes, captured_at=timezone.now())
+    try:
+        cache.incr(QUEUE_DEPTH_CACHE_KEY)
+    except ValueError:
+        pass
+    return job
+
+
+def queue_stats():
+    """Queue depth per status and the age of the oldest pending frame."""
+    stats = {'pending': 0, 'processing': 0, 'failed': 0}
+    oldest_pending = None
+    rows = EmotionJob.objects.values('status').annotate(count=Count('job_id'), oldest=Min('captured_at'))
+    for row in rows:
+        stats[row['status'].lower()] = row['count']
+        if row['status'] == EmotionJob.STATUS_PENDING:
+            oldest_pending = row['oldest']
+
+    stats['oldest_pending_age_seconds'] = (
+        round((timezone.now() - oldest_pending).total_seconds(), 1) if oldest_pending else 0
+    )
+    stats['max_depth'] = max_queue_depth()
+    stats['accepting'] = stats['pending'] < stats['max_depth']
+    return stats
+
+
+# ================= WORKER =================
+def claim_jobs(batch_size):
+    """
+    Atomically claim up to `batch_size` pending jobs (oldest first). Jobs
+    stuck in Processing longer than EMOTION_JOB_TIMEOUT (a crashed worker)
+    are claimed again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'EMOTION_JOB_TIMEOUT', 300))
+    with transaction.atomic():
+        jobs = list(
+            EmotionJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=EmotionJob.STATUS_PENDING) | Q(status=EmotionJob.STATUS_PROCESSING, claimed_at__lt=stale))
+            .order_by('captured_at')[:batch_size]
+        )
+        if jobs:
+            EmotionJob.objects.filter(job_id__in=[job.job_id for job in jobs]).update(
+                status=EmotionJob.STATUS_PROCESSING, claimed_at=now, attempts=F('attempts') + 1,
+            )
+    return jobs
+
+
+def _fail(job, error):
+    # Keep the row for inspection but drop the frame
+    EmotionJob.objects.filter(job_id=job.job_id).update(status=EmotionJob.STATUS_FAILED, error=error, frame=b'')
+
+
+def process_jobs(jobs):
+    """Verify and classify a batch of claimed jobs; returns the number of Emotion rows created."""
+    templates = templates_by_staff({job.staff_id for job in jobs})
+
+    frames, decoded = [], []
+    for job in jobs:
+        frame = decode_image_bytes(bytes(job.frame))
+        if frame is None:
+            _fail(job, 'Invalid image')
+            continue
+        if not frame.quality.ok:
+            _fail(job, f"Rejected: {frame.quality.reason}")
+            continue
+        frames.append(frame)
+        decoded.append(job)
+
+    # One detection per frame, one embedding forward pass for the whole batch
+    analyses = analyze_faces_local([frame.image for frame in frames])
+
+    emotions, done = [], []
+    for job, frame, analysis in zip(decoded, frames, analyses):
+        saved = templates.get(job.staff_id)
+        if saved is None:
+            _fail(job, 'User not registered')
+            continue
+        if best_similarity(analysis.embedding, saved) < FACE_MATCH_THRESHOLD:
+            _fail(job, 'Face verification failed')
+            continue
+
+        crop, face_rect = face_region(frame, analysis.primary_box)
+        label = detect_emotion_from_frame(crop, face_rect)
+        if not label:
+            _fail(job, 'Detection failed')
+            continue
+        emotions.append(Emotion(staff_id=job.staff_id, emotion_type=label, timestamp=job.captured_at))
+        done.append(job.job_id)
+
+    with transaction.atomic():
+        Emotion.objects.bulk_create(emotions)
+        # bulk_create sends no post_save, so add them to the daily summary here
+        rollups.add_emotions(emotions)
+        EmotionJob.objects.filter(job_id__in=done).delete()
+    return len(emotions)
+
+
+def release_jobs(jobs, error):
+    """Put jobs back after an unexpected error, or fail them after EMOTION_JOB_MAX_ATTEMPTS."""
+    max_attempts = getattr(settings, 'EMOTION_JOB_MAX_ATTEMPTS', 3)
+    ids = [job.job_id for job in jobs]
+    # Only jobs still Processing: completed jobs are already deleted, and Failed ones stay failed
+    EmotionJob.objects.filter(job_id__in=ids, attempts__lt=max_attempts, status=EmotionJob.STATUS_PROCESSING).update(
+        status=EmotionJob.STATUS_PENDING, claimed_at=None, error=error,
+    )
+    EmotionJob.objects.filter(job_id__in=ids, attempts__gte=max_attempts, status=EmotionJob.STATUS_PROCESSING).update(
+        status=EmotionJob.STATUS_FAILED, error=error, frame=b'',
+    )
+
+
+def run_worker(batch_size=8, poll_interval=1.0, once=False):
+    """Drain the queue; sleeps `poll_interval` seconds when it is empty. once=True returns when empty."""
+    while True:
+        jobs = claim_jobs(batch_size)
+        if not jobs:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        started = time.perf_counter()
+        try:
+            created = process_jobs(jobs)
+        except Exception as e:
+            logger.error(f"Emotion batch of {len(jobs)} failed: {e}")
+            release_jobs(jobs, str(e))
+            continue
+        logger.info(
+            f"Processed {len(jobs)} emotion job(s) in {(time.perf_counter() - started) * 1000:.0f} ms, "
+            f"{created} emotion row(s) created"
+        )
@@ -0,0 +1,84 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.timesince import timeuntil
+from .models import Emotion, EmotionJob
+
+# ================= EMOTION CAPTURE CADENCE =================
+# One Emotion row per staff member per EMOTION_CAPTURE_INTERVAL. The time of
+# the next allowed capture is cached per staff member, so record_emotion can
+# turn early uploads away (and answer the eligibility probe) without reading
+# the request body or querying the Emotion table. A capture that looks due is
+# confirmed against the database before a frame is accepted.
+
+NEXT_CAPTURE_CACHE_KEY = 'accounts:emotion:next_capture:{}'
+
+
+def capture_interval():
+    return timedelta(seconds=getattr(settings, 'EMOTION_CAPTURE_INTERVAL', 3600))
+
+
+def retry_interval():
+    """How long a client waits after a frame that did not produce an Emotion row."""
+    return timedelta(seconds=getattr(settings, 'EMOTION_RETRY_INTERVAL', 30))
+
+
+def next_capture_at(staff_id):
+    """
+    When this staff member may submit the next frame. Cooldowns come from the
+    cache; a due capture is always confirmed against the Emotion table (and
+    the async job queue) and is never cached, so every process agrees.
+    """
+    now = timezone.now()
+    next_at = cache.get(NEXT_CAPTURE_CACHE_KEY.format(staff_id))
+    if next_at is not None and next_at > now:
+        return next_at
+
+    last = (
+        Emotion.objects.filter(staff__staff_id=staff_id)
+        .order_by('-timestamp')
+        .values_list('timestamp', flat=True)
+        .first()
+    )
+    next_at = last + capture_interval() if last else now
+    if next_at <= now and EmotionJob.objects.filter(
+        staff__staff_id=staff_id, status__in=[EmotionJob.STATUS_PENDING, EmotionJob.STATUS_PROCESSING]
+    ).exists():
+        # A frame is already queued; check back once it has been processed
+        next_at = now + retry_interval()
+
+    if next_at > now:
+        _set_next(staff_id, next_at)
+    return next_at
+
+
+def _set_next(staff_id, next_at):
+    timeout = max(1, (next_at - timezone.now()).total_seconds())
+    cache.set(NEXT_CAPTURE_CACHE_KEY.format(staff_id), next_at, timeout=timeout)
+    return next_at
+
+
+def mark_captured(staff_id, captured_at):
+    return _set_next(staff_id, captured_at + capture_interval())
+
+
+def mark_queued(staff_id):
+    """A frame was accepted for async processing; ask the client to check back shortly."""
+    return _set_next(staff_id, timezone.now() + retry_interval())
+
+
+def schedule_info(next_at):
+    """JSON fields telling the client when to capture next."""
+    retry_after = max(0, int((next_at - timezone.now()).total_seconds() + 0.999))
+    return {'next_capture_at': next_at.isoformat(), 'retry_after': retry_after}
+
+
+def wait_message(next_at):
+    """'Next update in 42 minutes' style text for a cooldown ending at next_at."""
+    now = timezone.now()
+    if next_at - now < timedelta(minutes=1):
+        seconds = max(1, int((next_at - now).total_seconds() + 0.999))
+        return f"Next update in {seconds} second{'s' if seconds != 1 else ''}"
+    # timeuntil() joins with non-breaking spaces (meant for HTML)
+    return f"Next update in {timeuntil(next_at, now, depth=1)}".replace('\xa0', ' ')
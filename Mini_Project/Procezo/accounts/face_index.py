@@ -0,0 +1,386 @@
+import copy
+import logging
+import threading
+from collections import defaultdict
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from .metrics import timed
+from .utils_face import unpack_embedding
+
+logger = logging.getLogger(__name__)
+
+
+def _unit_vector(raw):
+    """Turn an embedding (packed blob or array) into an L2-normalized float32 vector (or None)."""
+    if raw is None:
+        return None
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        raw = unpack_embedding(raw)
+        if raw is None:
+            return None
+    vec = np.asarray(raw, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vec)
+    if vec.size == 0 or norm == 0:
+        return None
+    return vec / norm
+
+
+def _db_version():
+    """
+    (row count, highest template_id) of FaceTemplate. Templates are only ever
+    inserted or deleted, never edited, so every change made by any process
+    moves one of the two; checking it is one small aggregate query.
+    """
+    from .models import FaceTemplate
+
+    stats = FaceTemplate.objects.aggregate(rows=Count('pk'), last=Max('template_id'))
+    return stats['rows'], stats['last'] or 0
+
+
+# ================= SEARCH BACKENDS =================
+# FaceIndex keeps the full-precision matrix and the register ids; a backend
+# is built from them and answers nearest-neighbour queries. Backends are
+# immutable: a change to the index derives a new backend with updated(),
+# so readers never see a half-updated state.
+
+class BruteForceBackend:
+    """Exact search: cosine similarity against every row."""
+
+    name = 'brute'
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def search(self, query, k):
+        """Return (row positions, similarities) of the k best rows, best first."""
+        sims = self.matrix @ query
+        k = min(k, sims.size)
+        if k < sims.size:
+            top = np.argpartition(-sims, k - 1)[:k]
+        else:
+            top = np.arange(sims.size)
+        top = top[np.argsort(-sims[top])]
+        return top, sims[top]
+
+    def updated(self, matrix, keep=None, added=0):
+        """
+        Backend for `matrix`, derived from this one: `keep` masks the old rows
+        that survived and the last `added` rows of `matrix` are new.
+        """
+        return BruteForceBackend(matrix)
+
+    @property
+    def nbytes(self):
+        return int(self.matrix.nbytes)
+
+
+def _quantize(matrix, quantization):
+    """Compress rows to int8 codes (with a per-row scale) or float16 codes."""
+    if quantization == 'fp16':
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _nearest_centroid(matrix, centroids, chunk=8192):
+    assign = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], chunk):
+        assign[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+    return assign
+
+
+def train_centroids(matrix, nlist, iterations=10, sample_per_list=40, seed=0):
+    """Spherical k-means on a sample of the rows; returns unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    sample = matrix
+    if matrix.shape[0] > nlist * sample_per_list:
+        sample = matrix[rng.choice(matrix.shape[0], nlist * sample_per_list, replace=False)]
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = _nearest_centroid(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        norms = np.linalg.norm(sums, axis=1)
+        empty = norms == 0
+        # Empty lists are re-seeded with random rows
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+            norms[empty] = 1.0
+        centroids = (sums / norms[:, None]).astype(np.float32)
+    return centroids
+
+
+class IVFQuantizedBackend:
+    """
+    Approximate search: rows are assigned to inverted lists around k-means
+    centroids and also kept as int8 (or float16) codes. A query scores the
+    codes of the nprobe closest lists, then re-ranks the best `rerank`
+    candidates against the full-precision matrix.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, matrix, nlist=None, nprobe=8, rerank=32, quantization='int8'):
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.quantization = quantization
+        nlist = min(nlist or max(1, int(np.sqrt(matrix.shape[0]))), matrix.shape[0])
+        self.centroids = train_centroids(matrix, nlist)
+        self.trained_rows = matrix.shape[0]
+        codes, scales = _quantize(matrix, quantization)
+        self._set_rows(matrix, _nearest_centroid(matrix, self.centroids), codes, scales)
+
+    def _set_rows(self, matrix, assign, codes, scales):
+        self.matrix = matrix
+        self.assign = assign
+        self.codes = codes
+        self.scales = scales
+        # Row positions grouped by list; list l is order[offsets[l]:offsets[l + 1]]
+        self.order = np.argsort(assign, kind='stable')
+        self.offsets = np.searchsorted(assign[self.order], np.arange(len(self.centroids) + 1))
+
+    def search(self, query, k):
+        nprobe = min(self.nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+        if not rows.size:
+            return rows, np.zeros(0, dtype=np.float32)
+
+        approx = self.codes[rows].astype(np.float32) @ query
+        if self.scales is not None:
+            approx *= self.scales[rows]
+
+        keep = min(max(k, self.rerank), rows.size)
+        if keep < rows.size:
+            rows = rows[np.argpartition(-approx, keep - 1)[:keep]]
+
+        # Full-precision re-rank of the surviving candidates
+        sims = self.matrix[rows] @ query
+        best = np.argsort(-sims)[:k]
+        return rows[best], sims[best]
+
+    def updated(self, matrix, keep=None, added=0):
+        """Same centroids; only the added rows are assigned and quantized."""
+        assign, codes, scales = self.assign, self.codes, self.scales
+        if keep is not None:
+            assign, codes = assign[keep], codes[keep]
+            scales = scales[keep] if scales is not None else None
+        if added:
+            rows = matrix[-added:]
+            row_codes, row_scales = _quantize(rows, self.quantization)
+            assign = np.concatenate([assign, _nearest_centroid(rows, self.centroids)])
+            codes = np.concatenate([codes, row_codes])
+            if scales is not None:
+                scales = np.concatenate([scales, row_scales])
+
+        backend = copy.copy(self)
+        backend._set_rows(matrix, assign, codes, scales)
+        return backend
+
+    @property
+    def nbytes(self):
+        return int(self.matrix.nbytes + self.codes.nbytes + self.centroids.nbytes)
+
+
+def build_backend(matrix, previous=None, keep=None, added=0):
+    """
+    Search backend for `matrix` per FACE_INDEX_BACKEND. Below
+    FACE_INDEX_IVF_MIN_ROWS the exact scan is cheap enough and always used.
+    After a change to a few rows (see BruteForceBackend.updated) the previous
+    backend is updated instead of rebuilt; IVF centroids are retrained
+    once the index has doubled in size since they were trained.
+    """
+    name = getattr(settings, 'FACE_INDEX_BACKEND', 'brute')
+    if name not in ('brute', 'ivf'):
+        logger.warning(f"Unknown FACE_INDEX_BACKEND {name!r}; using brute force")
+    if name != 'ivf' or matrix.shape[0] < getattr(settings, 'FACE_INDEX_IVF_MIN_ROWS', 2000):
+        return BruteForceBackend(matrix)
+
+    if (
+        isinstance(previous, IVFQuantizedBackend)
+        and (keep is not None or added)
+        and matrix.shape[0] <= 2 * previous.trained_rows
+    ):
+        return previous.updated(matrix, keep=keep, added=added)
+    return IVFQuantizedBackend(
+        matrix,
+        nlist=getattr(settings, 'FACE_INDEX_NLIST', 0) or None,
+        nprobe=getattr(settings, 'FACE_INDEX_NPROBE', 8),
+        rerank=getattr(settings, 'FACE_INDEX_RERANK', 32),
+        quantization=getattr(settings, 'FACE_INDEX_QUANTIZATION', 'int8'),
+    )
+
+
+# ================= FACE INDEX =================
+class FaceIndex:
+    """
+    In-memory 1:N face index: one row per FaceTemplate, labelled with its
+    register_id (a user has several rows). Rows are unit length, so a dot
+    product is the cosine similarity; the search itself is done by the
+    backend chosen in build_backend().
+
+    Every query compares _db_version() with the version the index holds.
+    New templates (logins, enrollments, in any worker) are applied per user
+    by sync(); only changes it cannot account for, such as a deleted
+    Register, cause a full rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (matrix, ids, backend) is swapped as one tuple so readers never need the lock
+        self._data = None
+        # _db_version() the index was loaded at; another worker's change shows up as a mismatch
+        self._version = None
+        # {register_id: rows whose embedding could not be decoded}, so row counts still add up
+        self._skipped = {}
+
+    # ---------- building ----------
+    def _load_rows(self):
+        from .models import FaceTemplate
+
+        ids, vectors, skipped = [], [], defaultdict(int)
+        rows = FaceTemplate.objects.values_list('register_id', 'embedding')
+        for register_id, raw in rows.iterator():
+            vec = _unit_vector(raw)
+            if vec is None:
+                skipped[register_id] += 1
+                continue
+            ids.append(register_id)
+            vectors.append(vec)
+
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64), dict(skipped)
+        return np.vstack(vectors), np.asarray(ids, dtype=np.int64), dict(skipped)
+
+    def rebuild(self):
+        with self._lock:
+            # One transaction, so the version matches the rows read (InnoDB repeatable read)
+            with transaction.atomic():
+                version = _db_version()
+                matrix, ids, self._skipped = self._load_rows()
+            backend = build_backend(matrix)
+            self._data = (matrix, ids, backend)
+            self._version = version
+        logger.info(f"Face index built with {len(ids)} embeddings ({backend.name})")
+
+    def sync(self):
+        """
+        Catch up with the database by reloading only the users that have
+        templates newer than the index. Returns False if that does not
+        account for every change (templates of other users were deleted),
+        in which case the caller rebuilds.
+        """
+        from .models import FaceTemplate
+
+        with self._lock:
+            if self._data is None:
+                return False
+            with transaction.atomic():
+                version = _db_version()
+                if version == self._version:
+                    return True
+                rows, last = version
+                register_ids = set(
+                    FaceTemplate.objects.filter(template_id__gt=self._version[1], template_id__lte=last)
+                    .values_list('register_id', flat=True)
+                )
+                blobs = defaultdict(list)
+                for register_id, raw in (
+                    FaceTemplate.objects.filter(register_id__in=register_ids)
+                    .values_list('register_id', 'embedding').iterator()
+                ):
+                    blobs[register_id].append(raw)
+
+            for register_id in register_ids:
+                self._apply(register_id, blobs[register_id])
+            if self._data is None or int(self._data[1].size) + sum(self._skipped.values()) != rows:
+                return False
+            self._version = version
+        logger.debug(f"Face index synced {len(register_ids)} user(s) to {rows} templates")
+        return True
+
+    def _snapshot(self):
+        if self._data is None or (self._version != _db_version() and not self.sync()):
+            self.rebuild()
+        return self._data
+
+    # ---------- incremental updates (called from signals) ----------
+    def refresh(self, register_id):
+        """Reload one user's templates from the database."""
+        from .models import FaceTemplate
+
+        blobs = FaceTemplate.objects.filter(register_id=register_id).values_list('embedding', flat=True)
+        self.replace(register_id, list(blobs))
+
+    def replace(self, register_id, raw_embeddings):
+        """Swap all rows of `register_id` for `raw_embeddings` (packed blobs or arrays)."""
+        with self._lock:
+            self._apply(register_id, raw_embeddings)
+
+    def _apply(self, register_id, raw_embeddings):
+        """replace() with self._lock held."""
+        raw_embeddings = list(raw_embeddings)
+        vectors = [vec for vec in map(_unit_vector, raw_embeddings) if vec is not None]
+        if self._data is None:
+            return
+
+        matrix, ids, backend = self._data
+        if matrix.size and any(vec.shape[0] != matrix.shape[1] for vec in vectors):
+            logger.warning(f"Embedding size mismatch for register {register_id}; index will be rebuilt")
+            self._data = None
+            return
+
+        self._skipped.pop(register_id, None)
+        if len(vectors) < len(raw_embeddings):
+            self._skipped[register_id] = len(raw_embeddings) - len(vectors)
+        keep = ids != register_id
+        if keep.all():
+            keep = None
+        else:
+            matrix, ids = matrix[keep], ids[keep]
+        if vectors:
+            added = np.vstack(vectors)
+            matrix = np.vstack([matrix, added]) if matrix.size else added
+            ids = np.append(ids, np.full(len(vectors), register_id, dtype=np.int64))
+        if keep is not None or vectors:
+            self._data = (matrix, ids, build_backend(matrix, previous=backend, keep=keep, added=len(vectors)))
+
+    def remove(self, register_id):
+        self.replace(register_id, [])
+
+    # ---------- queries ----------
+    @timed('match')
+    def top_k(self, embedding, k=5):
+        """Return up to k distinct (register_id, best template similarity) pairs, best first."""
+        query = _unit_vector(embedding)
+        matrix, ids, backend = self._snapshot()
+        if query is None or not ids.size or matrix.shape[1] != query.shape[0]:
+            return []
+
+        # A user can fill several of the best rows; ask for enough to find k users
+        per_user = getattr(settings, 'FACE_TEMPLATES_MAX_LOGIN', 4) + 1
+        rows, sims = backend.search(query, k * per_user)
+        matches = {}
+        for row, sim in zip(rows, sims):
+            matches.setdefault(int(ids[row]), float(sim))
+        return list(matches.items())[:k]
+
+    def best_match(self, embedding):
+        """Return (register_id, similarity) of the closest face, or (None, -1.0)."""
+        matches = self.top_k(embedding, k=1)
+        if not matches:
+            return None, -1.0
+        return matches[0]
+
+    def __len__(self):
+        """Number of template rows."""
+        return int(self._snapshot()[1].size)
+
+
+# Per-process singleton used by the views and kept current by signals.py
+face_index = FaceIndex()
@@ -0,0 +1,105 @@
+import logging
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from .face_index import _unit_vector
+from .metrics import timed
+from .models import FaceTemplate
+from .utils_face import pack_embedding
+
+logger = logging.getLogger(__name__)
+
+# ================= FACE TEMPLATES =================
+# Every registered user keeps the enrollment embedding plus up to
+# FACE_TEMPLATES_MAX_LOGIN embeddings from recent confident logins. A face
+# is compared with all of a person's templates in one matrix-vector product
+# and the best similarity counts, so a change of lighting or pose since
+# enrollment no longer drops a genuine user under the match threshold (and
+# into another full inference on retry).
+
+
+def max_login_templates():
+    return getattr(settings, 'FACE_TEMPLATES_MAX_LOGIN', 4)
+
+
+def template_matrix(saved):
+    """
+    Stack templates into a matrix of unit rows, or None if there are none.
+    `saved` is a packed blob, a single vector, a 2-D array or a list of blobs.
+    """
+    if saved is None:
+        return None
+    if isinstance(saved, (bytes, bytearray, memoryview)):
+        saved = [saved]
+    elif isinstance(saved, np.ndarray) and saved.ndim == 1:
+        saved = [saved]
+    vectors = [vec for vec in map(_unit_vector, saved) if vec is not None]
+    if not vectors or len({vec.shape[0] for vec in vectors}) != 1:
+        return None
+    return np.vstack(vectors)
+
+
+@timed('templates')
+def templates_for(register_id):
+    blobs = FaceTemplate.objects.filter(register_id=register_id).values_list('embedding', flat=True)
+    return template_matrix(list(blobs))
+
+
+def templates_by_staff(staff_ids):
+    """{staff_id: template matrix} for several staff members in one query."""
+    blobs = {}
+    rows = FaceTemplate.objects.filter(register__staff_id__in=staff_ids).values_list('register__staff_id', 'embedding')
+    for staff_id, blob in rows:
+        blobs.setdefault(staff_id, []).append(blob)
+    return {staff_id: template_matrix(values) for staff_id, values in blobs.items()}
+
+
+@timed('match')
+def best_similarity(embedding, templates):
+    """Highest cosine similarity between `embedding` and any template (-1.0 if there are none)."""
+    query = _unit_vector(embedding)
+    if query is None or templates is None or templates.shape[1] != query.shape[0]:
+        return -1.0
+    return float((templates @ query).max())
+
+
+def enroll(register, embedding):
+    """A new registration capture replaces all of the user's templates."""
+    with transaction.atomic():
+        FaceTemplate.objects.filter(register=register).delete()
+        return FaceTemplate.objects.create(
+            register=register, embedding=pack_embedding(embedding), source=FaceTemplate.SOURCE_ENROLLMENT,
+        )
+
+
+def remember_login(register_id, embedding, similarity):
+    """
+    Keep the embedding of a successful login as an extra template. Only
+    confident matches are kept (FACE_TEMPLATE_MIN_SIMILARITY) and near
+    duplicates of an existing template are skipped (FACE_TEMPLATE_MAX_SIMILARITY);
+    the oldest login templates beyond FACE_TEMPLATES_MAX_LOGIN are pruned.
+    """
+    limit = max_login_templates()
+    if limit <= 0 or embedding is None:
+        return None
+    if not (
+        getattr(settings, 'FACE_TEMPLATE_MIN_SIMILARITY', 0.70)
+        <= similarity
+        < getattr(settings, 'FACE_TEMPLATE_MAX_SIMILARITY', 0.92)
+    ):
+        return None
+
+    with transaction.atomic():
+        template = FaceTemplate.objects.create(
+            register_id=register_id, embedding=pack_embedding(embedding),
+            source=FaceTemplate.SOURCE_LOGIN, similarity=similarity,
+        )
+        stale = list(
+            FaceTemplate.objects.filter(register_id=register_id, source=FaceTemplate.SOURCE_LOGIN)
+            .order_by('-created_at', '-template_id')
+            .values_list('template_id', flat=True)[limit:]
+        )
+        if stale:
+            FaceTemplate.objects.filter(template_id__in=stale).delete()
+    logger.info(f"Stored login face template for register {register_id} (similarity {similarity:.3f})")
+    return template
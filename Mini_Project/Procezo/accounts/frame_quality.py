@@ -0,0 +1,79 @@
+import numpy as np
+from django.conf import settings
+
+from .metrics import timed
+from .model_registry import get_haar_face_detector
+
+# ================= FRAME QUALITY PRE-FILTER =================
+# A few milliseconds of OpenCV on a small grayscale copy of the frame, run
+# before MTCNN/ResNet. Frames that are too dark, washed out, flat or blurry
+# (and, with FACE_QUALITY_HAAR, frames without any face) are rejected with a
+# reason code instead of going through the neural models.
+
+QUALITY_MESSAGES = {
+    'too_dark': "Image is too dark",
+    'too_bright': "Image is overexposed",
+    'low_contrast': "Image has too little contrast",
+    'blurry': "Image is too blurry",
+    'no_face': "No face found in the image",
+}
+
+
+class FrameQuality:
+    def __init__(self, reason=None, metrics=None):
+        self.reason = reason
+        self.metrics = metrics or {}
+
+    @property
+    def ok(self):
+        return self.reason is None
+
+    @property
+    def message(self):
+        return QUALITY_MESSAGES.get(self.reason, '')
+
+
+@timed('quality')
+def assess_frame(pil_img):
+    """Cheap quality check of an RGB PIL image; returns a FrameQuality."""
+    if not getattr(settings, 'FACE_QUALITY_CHECK', True):
+        return FrameQuality()
+
+    import cv2
+
+    gray = np.asarray(pil_img.convert('L'))
+    height, width = gray.shape
+    scale = getattr(settings, 'FACE_QUALITY_EDGE', 256) / max(height, width)
+    if scale < 1:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    brightness = float(gray.mean())
+    contrast = float(gray.std())
+    # Variance of the Laplacian: low when the image has few sharp edges
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+    metrics = {
+        'brightness': round(brightness, 1),
+        'contrast': round(contrast, 1),
+        'sharpness': round(sharpness, 1),
+    }
+
+    reason = None
+    if brightness < getattr(settings, 'FACE_QUALITY_MIN_BRIGHTNESS', 40):
+        reason = 'too_dark'
+    elif brightness > getattr(settings, 'FACE_QUALITY_MAX_BRIGHTNESS', 220):
+        reason = 'too_bright'
+    elif contrast < getattr(settings, 'FACE_QUALITY_MIN_CONTRAST', 15):
+        reason = 'low_contrast'
+    elif sharpness < getattr(settings, 'FACE_QUALITY_MIN_SHARPNESS', 15):
+        reason = 'blurry'
+    elif getattr(settings, 'FACE_QUALITY_HAAR', False):
+        cascade = get_haar_face_detector()
+        if cascade is not None:
+            min_size = max(12, min(gray.shape) // 8)
+            faces = cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=3, minSize=(min_size, min_size))
+            metrics['haar_faces'] = len(faces)
+            if len(faces) == 0:
+                reason = 'no_face'
+
+    return FrameQuality(reason, metrics)
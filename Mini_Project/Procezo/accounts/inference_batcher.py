@@ -0,0 +1,90 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingItem:
+    __slots__ = ('face_tensor', 'event', 'result', 'error')
+
+    def __init__(self, face_tensor):
+        self.face_tensor = face_tensor
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# ================= MICRO-BATCHING =================
+class EmbeddingBatcher:
+    """
+    Collects aligned face crops from concurrent request threads and runs
+    them through the embedding network as one batch.
+
+    A background thread takes the first waiting crop, then keeps collecting
+    for up to `max_wait_ms` or until `max_batch_size` crops are queued, calls
+    `embed_batch(list_of_tensors)` once, and hands each result back to the
+    thread that submitted it.
+    """
+
+    def __init__(self, embed_batch, max_batch_size=8, max_wait_ms=5.0):
+        self._embed_batch = embed_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        # (Re)start the worker lazily; also after a fork, where threads don't survive
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name='embedding-batcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, face_tensor, timeout=None):
+        """Queue one (3, H, W) crop and block until its embedding is ready."""
+        item = _PendingItem(face_tensor)
+        self._ensure_worker()
+        self._queue.put(item)
+        if not item.event.wait(timeout):
+            raise TimeoutError("Timed out waiting for batched embedding")
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _collect(self, work_queue):
+        batch = [work_queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(work_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, work_queue):
+        while True:
+            batch = self._collect(work_queue)
+            try:
+                results = self._embed_batch([item.face_tensor for item in batch])
+                for item, result in zip(batch, results):
+                    item.result = result
+            except Exception as e:
+                logger.error(f"Batched embedding failed ({len(batch)} items): {e}")
+                for item in batch:
+                    item.error = e
+            finally:
+                for item in batch:
+                    item.event.set()
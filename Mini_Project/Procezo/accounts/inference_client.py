@@ -0,0 +1,171 @@
+import logging
+import socket
+import struct
+import numpy as np
+from django.conf import settings
+from .inference_limiter import InferenceBusy
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# ================= WIRE FORMAT =================
+# Every message is a fixed header followed by a binary payload (no JSON/base64).
+#
+# request  : magic 'PI', version, op, payload length | payload
+# response : status, payload length                  | payload
+#
+# OP_ANALYZE payload  : flags, width, height | raw RGB pixels
+#            response : face count, embedding dim | boxes (f4 n*4), probs (f4 n), embedding (f4 dim)
+# OP_EMOTION payload  : width, height | raw BGR pixels
+#            response : utf-8 emotion label (empty when nothing was detected)
+# OP_EMOTION_FACE     : like OP_EMOTION, with a known face rectangle (x, y, w, h)
+#            payload  : width, height, x, y, w, h | raw BGR pixels (usually just the face region)
+# STATUS_ERROR response payload is a utf-8 error message.
+# STATUS_BUSY response payload: retry_after seconds | utf-8 message (the
+#            sidecar's inference slots are all taken; raised as InferenceBusy).
+
+PROTOCOL_MAGIC = b'PI'
+PROTOCOL_VERSION = 2
+
+OP_PING = 0
+OP_ANALYZE = 1
+OP_EMOTION = 2
+OP_EMOTION_FACE = 3
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_BUSY = 2
+
+FLAG_EMBED = 0x01
+FLAG_REQUIRE_SINGLE = 0x02
+
+REQUEST_HEADER = struct.Struct('<2sBBI')
+RESPONSE_HEADER = struct.Struct('<BI')
+ANALYZE_REQUEST = struct.Struct('<BHH')
+ANALYZE_RESPONSE = struct.Struct('<HH')
+EMOTION_REQUEST = struct.Struct('<HH')
+EMOTION_FACE_REQUEST = struct.Struct('<HHHHHH')
+BUSY_RESPONSE = struct.Struct('<H')
+
+MAX_PAYLOAD_BYTES = 64 * 1024 * 1024
+
+
+class InferenceUnavailable(Exception):
+    """The sidecar could not be reached; callers fall back to in-process inference."""
+
+
+class InferenceError(RuntimeError):
+    """The sidecar was reached but failed to process the request."""
+
+
+def recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Socket closed mid-message")
+        received += n
+    return buf
+
+
+# ================= CLIENT =================
+def is_enabled():
+    return bool(getattr(settings, 'INFERENCE_SOCKET_PATH', None))
+
+
+def _call(op, payload_parts):
+    path = getattr(settings, 'INFERENCE_SOCKET_PATH', None)
+    if not path:
+        raise InferenceUnavailable("No inference socket configured")
+
+    length = sum(len(p) for p in payload_parts)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(getattr(settings, 'INFERENCE_SOCKET_TIMEOUT', 10.0))
+            sock.connect(path)
+            sock.sendall(REQUEST_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, op, length))
+            for part in payload_parts:
+                sock.sendall(part)
+            status, size = RESPONSE_HEADER.unpack(recv_exact(sock, RESPONSE_HEADER.size))
+            if size > MAX_PAYLOAD_BYTES:
+                raise ConnectionError(f"Response too large: {size} bytes")
+            body = recv_exact(sock, size)
+    except (OSError, ConnectionError, struct.error) as e:
+        logger.warning(f"Inference sidecar unavailable at {path}: {e}")
+        raise InferenceUnavailable(str(e)) from e
+
+    if status == STATUS_BUSY:
+        retry_after, = BUSY_RESPONSE.unpack_from(body)
+        raise InferenceBusy(bytes(body[BUSY_RESPONSE.size:]).decode('utf-8', 'replace'), retry_after=retry_after)
+    if status != STATUS_OK:
+        raise InferenceError(bytes(body).decode('utf-8', 'replace'))
+    return body
+
+
+def ping():
+    try:
+        _call(OP_PING, [])
+        return True
+    except (InferenceUnavailable, InferenceError, InferenceBusy):
+        return False
+
+
+@timed('sidecar_analyze')
+def analyze(pil_img, embed=True, require_single=False):
+    """Remote analyze_face; returns (boxes, probs, embedding) with None where absent."""
+    if pil_img.mode != 'RGB':
+        pil_img = pil_img.convert('RGB')
+    flags = (FLAG_EMBED if embed else 0) | (FLAG_REQUIRE_SINGLE if require_single else 0)
+    header = ANALYZE_REQUEST.pack(flags, pil_img.width, pil_img.height)
+    body = _call(OP_ANALYZE, [header, pil_img.tobytes()])
+    return decode_analyze_response(body)
+
+
+@timed('sidecar_emotion')
+def detect_emotion(frame_bgr, face_rect=None):
+    """
+    Remote emotion detection on an (H, W, 3) uint8 BGR frame; returns the label or None.
+    `face_rect` (x, y, w, h) skips face detection in the sidecar.
+    """
+    frame_bgr = np.ascontiguousarray(frame_bgr, dtype=np.uint8)
+    height, width = frame_bgr.shape[:2]
+    if face_rect is None:
+        op, header = OP_EMOTION, EMOTION_REQUEST.pack(width, height)
+    else:
+        op, header = OP_EMOTION_FACE, EMOTION_FACE_REQUEST.pack(width, height, *face_rect)
+    body = _call(op, [header, memoryview(frame_bgr).cast('B')])
+    label = bytes(body).decode('utf-8')
+    return label or None
+
+
+# ================= (DE)SERIALIZATION =================
+def encode_busy_response(error):
+    return BUSY_RESPONSE.pack(min(int(error.retry_after), 0xFFFF)) + str(error).encode('utf-8')
+
+
+def encode_analyze_response(boxes, probs, embedding):
+    count = 0 if boxes is None else len(boxes)
+    dim = 0 if embedding is None else len(embedding)
+    parts = [ANALYZE_RESPONSE.pack(count, dim)]
+    if count:
+        parts.append(np.asarray(boxes, dtype='<f4').tobytes())
+        parts.append(np.asarray(probs, dtype='<f4').tobytes())
+    if dim:
+        parts.append(np.asarray(embedding, dtype='<f4').tobytes())
+    return b''.join(parts)
+
+
+def decode_analyze_response(body):
+    count, dim = ANALYZE_RESPONSE.unpack_from(body)
+    offset = ANALYZE_RESPONSE.size
+    boxes = probs = embedding = None
+    if count:
+        boxes = np.frombuffer(body, dtype='<f4', count=count * 4, offset=offset).reshape(count, 4)
+        offset += count * 16
+        probs = np.frombuffer(body, dtype='<f4', count=count, offset=offset)
+        offset += count * 4
+    if dim:
+        embedding = np.frombuffer(body, dtype='<f4', count=dim, offset=offset)
+    return boxes, probs, embedding
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from .metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+# ================= INFERENCE ADMISSION =================
+# Every local MTCNN / ResNet / FER call runs inside inference_slot(). At most
+# INFERENCE_MAX_CONCURRENCY of them run at once in a process; further callers
+# wait up to INFERENCE_QUEUE_TIMEOUT seconds (at most INFERENCE_MAX_WAITING of
+# them) and otherwise get InferenceBusy, which the views turn into a 503 with
+# Retry-After. Together with TORCH_NUM_THREADS this bounds the number of busy
+# threads per worker, so workers x concurrency x threads can be sized to the
+# cores instead of oversubscribing them. Micro-batched embeddings take their
+# slot in the batcher thread, once per batch (utils_face.embed_faces_in_slot).
+
+
+class InferenceBusy(Exception):
+    """No inference slot became free in time; the client should retry later."""
+
+    def __init__(self, message="Server is busy, please try again", retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class InferenceLimiter:
+    def __init__(self, max_concurrent, queue_timeout=0.0, max_waiting=0):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.max_waiting = max_waiting
+        self._semaphore = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._in_flight = 0
+        self._waiting = 0
+        self._stats = {
+            'admitted': 0,
+            'admitted_after_wait': 0,
+            'rejected_queue_full': 0,
+            'rejected_timeout': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'peak_in_flight': 0,
+            'peak_waiting': 0,
+        }
+
+    @contextmanager
+    def slot(self):
+        """Hold one inference slot; nested calls on the same thread reuse it."""
+        depth = getattr(self._local, 'depth', 0)
+        if depth or self.max_concurrent <= 0:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+
+        self._acquire()
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            self._release()
+
+    def _acquire(self):
+        if self._semaphore.acquire(blocking=False):
+            self._admitted(0.0)
+            return
+
+        with self._lock:
+            if self._waiting >= self.max_waiting:
+                self._stats['rejected_queue_full'] += 1
+                raise InferenceBusy(retry_after=max(1, round(self.queue_timeout)))
+            self._waiting += 1
+            self._stats['peak_waiting'] = max(self._stats['peak_waiting'], self._waiting)
+
+        started = time.perf_counter()
+        try:
+            acquired = self._semaphore.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        waited = time.perf_counter() - started
+        record_stage('inference_wait', waited)
+
+        if not acquired:
+            with self._lock:
+                self._stats['rejected_timeout'] += 1
+            logger.warning(f"Inference rejected after waiting {waited:.2f}s ({self.max_concurrent} slots busy)")
+            raise InferenceBusy(retry_after=max(1, round(self.queue_timeout)))
+        self._admitted(waited)
+
+    def _admitted(self, waited):
+        with self._lock:
+            self._in_flight += 1
+            stats = self._stats
+            stats['admitted'] += 1
+            stats['peak_in_flight'] = max(stats['peak_in_flight'], self._in_flight)
+            if waited:
+                stats['admitted_after_wait'] += 1
+                stats['wait_seconds_total'] += waited
+                stats['wait_seconds_max'] = max(stats['wait_seconds_max'], waited)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats, in_flight=self._in_flight, waiting=self._waiting)
+        data['wait_seconds_total'] = round(data['wait_seconds_total'], 3)
+        data['wait_seconds_max'] = round(data['wait_seconds_max'], 3)
+        data.update(
+            max_concurrent=self.max_concurrent,
+            queue_timeout=self.queue_timeout,
+            max_waiting=self.max_waiting,
+        )
+        return data
+
+
+# Per-process limiter shared by every request thread
+inference_limiter = InferenceLimiter(
+    max_concurrent=getattr(settings, 'INFERENCE_MAX_CONCURRENCY', 2),
+    queue_timeout=getattr(settings, 'INFERENCE_QUEUE_TIMEOUT', 2.0),
+    max_waiting=getattr(settings, 'INFERENCE_MAX_WAITING', 8),
+)
+
+
+def inference_slot():
+    return inference_limiter.slot()
@@ -0,0 +1,108 @@
+import logging
+import os
+import socket
+import numpy as np
+from PIL import Image
+
+from . import inference_client as ipc
+from .inference_limiter import InferenceBusy
+from .process_pool import run_workers
+
+logger = logging.getLogger(__name__)
+
+
+# ================= REQUEST HANDLERS =================
+def _handle_analyze(payload):
+    from .utils_face import analyze_face_local
+
+    flags, width, height = ipc.ANALYZE_REQUEST.unpack_from(payload)
+    pixels = memoryview(payload)[ipc.ANALYZE_REQUEST.size:]
+    img = Image.frombuffer('RGB', (width, height), pixels, 'raw', 'RGB', 0, 1)
+    result = analyze_face_local(
+        img,
+        embed=bool(flags & ipc.FLAG_EMBED),
+        require_single=bool(flags & ipc.FLAG_REQUIRE_SINGLE),
+    )
+    return ipc.encode_analyze_response(result.boxes, result.probs, result.embedding)
+
+
+def _handle_emotion(payload):
+    from .utils import detect_emotion_from_frame
+
+    width, height = ipc.EMOTION_REQUEST.unpack_from(payload)
+    frame = np.frombuffer(payload, dtype=np.uint8, offset=ipc.EMOTION_REQUEST.size).reshape(height, width, 3)
+    label = detect_emotion_from_frame(frame)
+    return (label or '').encode('utf-8')
+
+
+def _handle_emotion_face(payload):
+    from .utils import detect_emotion_from_frame
+
+    width, height, *face_rect = ipc.EMOTION_FACE_REQUEST.unpack_from(payload)
+    frame = np.frombuffer(payload, dtype=np.uint8, offset=ipc.EMOTION_FACE_REQUEST.size).reshape(height, width, 3)
+    label = detect_emotion_from_frame(frame, tuple(face_rect))
+    return (label or '').encode('utf-8')
+
+
+HANDLERS = {
+    ipc.OP_PING: lambda payload: b'',
+    ipc.OP_ANALYZE: _handle_analyze,
+    ipc.OP_EMOTION: _handle_emotion,
+    ipc.OP_EMOTION_FACE: _handle_emotion_face,
+}
+
+
+def handle_connection(conn):
+    """Serve requests on one client connection until it is closed."""
+    while True:
+        try:
+            header = ipc.recv_exact(conn, ipc.REQUEST_HEADER.size)
+        except ConnectionError:
+            return
+        magic, version, op, size = ipc.REQUEST_HEADER.unpack(header)
+        if magic != ipc.PROTOCOL_MAGIC or version != ipc.PROTOCOL_VERSION or size > ipc.MAX_PAYLOAD_BYTES:
+            logger.warning("Dropping connection with an invalid request header")
+            return
+        payload = ipc.recv_exact(conn, size)
+
+        try:
+            handler = HANDLERS[op]
+            status, body = ipc.STATUS_OK, handler(payload)
+        except InferenceBusy as e:
+            # The client answers 503 + Retry-After, as for an in-process busy limiter
+            status, body = ipc.STATUS_BUSY, ipc.encode_busy_response(e)
+        except Exception as e:
+            logger.error(f"Inference op {op} failed: {e}")
+            status, body = ipc.STATUS_ERROR, str(e).encode('utf-8')
+        conn.sendall(ipc.RESPONSE_HEADER.pack(status, len(body)))
+        conn.sendall(body)
+
+
+def serve_forever(listener):
+    while True:
+        conn, _ = listener.accept()
+        with conn:
+            try:
+                handle_connection(conn)
+            except OSError as e:
+                logger.warning(f"Inference connection error: {e}")
+
+
+# ================= PROCESS POOL =================
+def open_listener(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    os.chmod(path, 0o660)
+    listener.listen(128)
+    return listener
+
+
+def run_pool(listener, workers):
+    """
+    Fork `workers` processes that all accept() on the same socket.
+    Models must already be loaded so the children share their weights
+    copy-on-write. Dead children are replaced until SIGTERM/SIGINT.
+    """
+    run_workers(lambda: serve_forever(listener), workers, name='inference worker')
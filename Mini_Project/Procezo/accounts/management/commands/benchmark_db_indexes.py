@@ -0,0 +1,234 @@
+import json
+import random
+import statistics
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Avg, Count
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Attendance, Emotion, GoogleMeet, Productivity, Staff, StaffIdSequence, WorkSchedule
+from accounts.rollups import day_filter, day_range
+
+JOB_TYPES = ['Developer', 'Designer', 'Tester', 'Support', 'Sales']
+EMOTIONS = ['Happy', 'Sad', 'Neutral', 'Angry', 'Tired', 'Focused']
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with a year of attendance / emotion / productivity / "
+        "schedule / meeting data and compare EXPLAIN plans and timings of the dashboard queries "
+        "without and with the composite indexes declared on those models."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--staff', type=int, default=50)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--emotions-per-day', type=int, default=8)
+        parser.add_argument('--productivity-per-day', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per query")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    # ---------- data ----------
+    def _seed(self, staff_count, days, emotions_per_day, productivity_per_day):
+        rng = random.Random(0)
+        today = date.today()
+        staff = [
+            Staff(staff_id=staff_id, name=f"Bench {n}", email=f"bench{n}@example.com",
+                  job_type=JOB_TYPES[n % len(JOB_TYPES)], check_in=dtime(9, 0), check_out=dtime(17, 0))
+            for n, staff_id in enumerate(StaffIdSequence.reserve(staff_count), start=1)
+        ]
+        Staff.objects.bulk_create(staff)
+
+        counts = {'staff': len(staff)}
+        for model, rows in (
+            (Attendance, self._attendance(staff, today, days, rng)),
+            (Emotion, self._emotions(staff, today, days, emotions_per_day, rng)),
+            (Productivity, self._productivity(staff, today, days, productivity_per_day, rng)),
+            (WorkSchedule, self._schedules(staff, today, days, rng)),
+            (GoogleMeet, self._meetings(today, days)),
+        ):
+            batch, total = [], 0
+            for row in rows:
+                batch.append(row)
+                if len(batch) == 5000:
+                    model.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            model.objects.bulk_create(batch)
+            counts[model._meta.model_name] = total + len(batch)
+        return counts
+
+    def _days(self, today, days):
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            if day.weekday() < 5:
+                yield day
+
+    def _attendance(self, staff, today, days, rng):
+        for day in self._days(today, days):
+            for s in staff:
+                check_in = dtime(9, rng.randint(0, 30))
+                late_minutes = check_in.minute if check_in.minute > 10 else 0
+                yield Attendance(staff=s, date=day, check_in=check_in, check_out=dtime(17, rng.randint(0, 59)),
+                                 status='Inactive', is_late=late_minutes > 0, late_minutes=late_minutes,
+                                 overtime_hours=Decimal('0.00'))
+
+    def _emotions(self, staff, today, days, per_day, rng):
+        for day in self._days(today, days):
+            for s in staff:
+                for hour in range(per_day):
+                    yield Emotion(staff=s, emotion_type=rng.choice(EMOTIONS),
+                                  timestamp=datetime.combine(day, dtime(9 + hour % 9, rng.randint(0, 59))))
+
+    def _productivity(self, staff, today, days, per_day, rng):
+        for day in self._days(today, days):
+            for s in staff:
+                for slot in range(per_day):
+                    yield Productivity(staff=s, datetime=datetime.combine(day, dtime(9 + slot * 2 % 9, 0)),
+                                       keystroke=rng.randint(0, 5000), mouse_moves=rng.randint(0, 5000),
+                                       productivity_score=Decimal(rng.randint(0, 10000)) / 100)
+
+    def _schedules(self, staff, today, days, rng):
+        for day in self._days(today, days):
+            for s in staff:
+                start = datetime.combine(day, dtime(rng.randint(9, 15), 0))
+                yield WorkSchedule(staff=s, title='Task', start_time=start, end_time=start + timedelta(hours=2))
+
+    def _meetings(self, today, days):
+        for day in self._days(today, days):
+            for job_type in JOB_TYPES:
+                for hour in (10, 15):
+                    yield GoogleMeet(job_type=job_type, meet_title='Standup',
+                                     meet_time=datetime.combine(day, dtime(hour, 0)))
+
+    # ---------- queries (as issued by the views) ----------
+    def _queries(self):
+        today = date.today()
+        staff = Staff.objects.order_by_staff_id()[Staff.objects.count() // 2]
+        week_start = today - timedelta(days=today.weekday())
+        start_dt, end_dt = day_range(today)
+        first_of_month = today.replace(day=1)
+        return [
+            ('attendance_today_counts (admin_attendance_management)',
+             lambda: Attendance.objects.filter(date=today).status_counts()),
+            ('attendance_staff_month (staff_attendance)',
+             lambda: Attendance.objects.filter(staff=staff, date__gte=first_of_month, date__lte=today).status_counts()),
+            ('attendance_open_session (api_face_logout)',
+             lambda: Attendance.objects.filter(staff=staff, date=today, status='Active', check_out__isnull=True).order_by('-check_in').first()),
+            ('emotion_latest_for_staff (record_emotion)',
+             lambda: Emotion.objects.filter(staff__staff_id=staff.staff_id).order_by('-timestamp').values_list('timestamp', flat=True).first()),
+            ('emotion_staff_today (staff_emotion, range)',
+             lambda: Emotion.objects.filter(staff=staff, **day_filter('timestamp', today)).count()),
+            ('emotion_staff_today (__date lookup)',
+             lambda: Emotion.objects.filter(staff=staff, timestamp__date=today).count()),
+            ('emotion_week_counts (admin_dashboard)',
+             lambda: list(Emotion.objects.filter(**day_filter('timestamp', week_start, week_start + timedelta(days=6)))
+                          .values('emotion_type').annotate(count=Count('emotion_type')))),
+            ('productivity_day_avg (admin_dashboard)',
+             lambda: Productivity.objects.filter(**day_filter('datetime', today)).aggregate(Avg('productivity_score'))),
+            ('productivity_staff_latest (admin_emotion_management)',
+             lambda: Productivity.objects.filter(staff=staff).order_by('-datetime').first()),
+            ('schedule_conflict (has_conflict)',
+             lambda: WorkSchedule.objects.filter(staff=staff, start_time__lt=end_dt, end_time__gt=start_dt).exists()),
+            ('meetings_today_for_job (staff_dashboard)',
+             lambda: list(GoogleMeet.objects.filter(job_type=staff.job_type, **day_filter('meet_time', today)).order_by('meet_time'))),
+        ]
+
+    def _measure(self, repeat):
+        results = {}
+        prefix = connection.ops.explain_query_prefix()
+        for name, run in self._queries():
+            with CaptureQueriesContext(connection) as ctx:
+                run()
+            sql = ctx.captured_queries[-1]['sql']
+            with connection.cursor() as cursor:
+                cursor.execute(f"{prefix} {sql}")
+                plan = [' '.join(str(col) for col in row) for row in cursor.fetchall()]
+
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name] = {
+                'median_ms': round(statistics.median(samples), 3),
+                'max_ms': round(max(samples), 3),
+                'plan': plan,
+            }
+        return results
+
+    # ---------- indexes ----------
+    def _set_indexes(self, present):
+        with connection.schema_editor() as editor:
+            for model, index in self._indexes():
+                if present:
+                    editor.add_index(model, index)
+                else:
+                    editor.remove_index(model, index)
+        self._analyze()
+
+    def _indexes(self):
+        return [
+            (model, index)
+            for model in (Attendance, Emotion, Productivity, WorkSchedule, GoogleMeet)
+            for index in model._meta.indexes
+        ]
+
+    def _analyze(self):
+        tables = [model._meta.db_table for model in (Attendance, Emotion, Productivity, WorkSchedule, GoogleMeet)]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f"ANALYZE TABLE {', '.join(tables)}")
+                cursor.fetchall()
+            elif connection.vendor in ('sqlite', 'postgresql'):
+                cursor.execute("ANALYZE")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        self.stderr.write(f"Creating a test database on {connection.vendor}...")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._set_indexes(False)
+            started = time.perf_counter()
+            counts = self._seed(options['staff'], options['days'], options['emotions_per_day'], options['productivity_per_day'])
+            self.stderr.write(f"Seeded {counts} in {time.perf_counter() - started:.1f}s")
+
+            before = self._measure(options['repeat'])
+            started = time.perf_counter()
+            self._set_indexes(True)
+            build_s = round(time.perf_counter() - started, 2)
+            after = self._measure(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'vendor': connection.vendor,
+            'rows': counts,
+            'index_build_s': build_s,
+            'queries': {
+                name: {
+                    'before': before[name],
+                    'after': after[name],
+                    'speedup': round(before[name]['median_ms'] / max(after[name]['median_ms'], 1e-6), 1),
+                }
+                for name in before
+            },
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{connection.vendor}: {counts} (indexes built in {build_s}s)"))
+        for name, result in report['queries'].items():
+            self.stdout.write(
+                f"{name}\n  {result['before']['median_ms']:8.3f} ms -> {result['after']['median_ms']:8.3f} ms "
+                f"({result['speedup']}x)"
+            )
+            for label in ('before', 'after'):
+                for line in result[label]['plan']:
+                    self.stdout.write(f"    {label:<6} {line}")
@@ -0,0 +1,95 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import model_registry
+from accounts.utils import EMOTION_LABELS, detect_emotion_from_frame, face_region
+from accounts.utils_face import decode_image_bytes, analyze_face_local
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare record_emotion's old two-detector pipeline (decode twice, FER runs its own "
+        "MTCNN) with the shared one (decode once, FER classifies the verified face box)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('image', help="Path to a JPEG/PNG containing one face")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def _time(self, fn, iterations):
+        fn()  # warm
+        samples, label = [], None
+        for _ in range(iterations):
+            started = time.perf_counter()
+            label = fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        return {
+            'mean_ms': round(statistics.mean(samples), 2),
+            'median_ms': round(statistics.median(samples), 2),
+            'max_ms': round(max(samples), 2),
+            'label': label,
+        }
+
+    def handle(self, *args, **options):
+        with open(options['image'], 'rb') as f:
+            data = f.read()
+        if decode_image_bytes(data) is None:
+            raise CommandError(f"Cannot decode {options['image']}")
+
+        # ---- shared pipeline: one decode, one detection ----
+        rss_before = model_registry._rss_bytes()
+        model_registry.get_mtcnn()
+        model_registry.get_resnet()
+        if model_registry.get_emotion_detector() is None:
+            raise CommandError("FER is not available")
+        shared_rss = model_registry._rss_bytes() - rss_before
+
+        def shared():
+            frame = decode_image_bytes(data)
+            analysis = analyze_face_local(frame.image)
+            if analysis.embedding is None:
+                return None
+            crop, face_rect = face_region(frame, analysis.primary_box)
+            return detect_emotion_from_frame(crop, face_rect)
+
+        # ---- old pipeline: decode per stage, FER with its own MTCNN ----
+        from fer.fer import FER
+
+        rss_before = model_registry._rss_bytes()
+        legacy_detector = FER(mtcnn=True)
+        legacy_rss = model_registry._rss_bytes() - rss_before
+
+        def two_detector():
+            frame = decode_image_bytes(data)
+            if analyze_face_local(frame.image).embedding is None:
+                return None
+            results = legacy_detector.detect_emotions(decode_image_bytes(data).bgr)
+            if not results:
+                return 'Neutral'
+            emotions = results[0]['emotions']
+            return EMOTION_LABELS.get(max(emotions.items(), key=lambda x: x[1])[0], 'Neutral')
+
+        report = {
+            'iterations': options['iterations'],
+            'two_detector': dict(self._time(two_detector, options['iterations']), extra_rss_bytes=legacy_rss),
+            'shared_box': dict(self._time(shared, options['iterations']), models_rss_bytes=shared_rss),
+        }
+        report['speedup'] = round(report['two_detector']['mean_ms'] / report['shared_box']['mean_ms'], 2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        old, new = report['two_detector'], report['shared_box']
+        self.stdout.write(
+            f"two-detector : {old['mean_ms']:.1f} ms mean / {old['median_ms']:.1f} ms median "
+            f"(+{old['extra_rss_bytes'] / 2**20:.1f} MiB for FER's own MTCNN), label={old['label']}"
+        )
+        self.stdout.write(
+            f"shared box   : {new['mean_ms']:.1f} ms mean / {new['median_ms']:.1f} ms median, label={new['label']}"
+        )
+        self.stdout.write(self.style.SUCCESS(f"speedup: {report['speedup']:.2f}x"))
@@ -0,0 +1,104 @@
+import json
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from accounts.face_index import BruteForceBackend, IVFQuantizedBackend
+
+
+def _normalize(matrix):
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def synthetic_identities(count, dim, seed=0):
+    """
+    Unit embeddings that cluster like real ones: identities are spread around
+    a few hundred "look-alike" centres instead of being uniformly random.
+    """
+    rng = np.random.default_rng(seed)
+    centres = _normalize(rng.standard_normal((max(1, count // 50), dim), dtype=np.float32))
+    noise = _normalize(rng.standard_normal((count, dim), dtype=np.float32))
+    return _normalize(centres[rng.integers(0, len(centres), count)] + noise).astype(np.float32)
+
+
+def synthetic_queries(identities, count, seed=1):
+    """A second "photo" of random identities (cosine ~0.8 to the enrolled embedding)."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, identities.shape[0], count)
+    noise = _normalize(rng.standard_normal((count, identities.shape[1]), dtype=np.float32))
+    return _normalize(identities[picks] + 0.75 * noise).astype(np.float32)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recall@1 and query latency of the face index backends (exact brute force vs IVF with "
+        "int8/fp16 codes and full-precision re-ranking) on synthetic identities."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--dim', type=int, default=512)
+        parser.add_argument('--nlist', type=int, default=0, help="Inverted lists (0 = sqrt(rows))")
+        parser.add_argument('--nprobe', type=int, default=8)
+        parser.add_argument('--rerank', type=int, default=32)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def _run(self, backend, queries, exact_top):
+        samples, hits = [], 0
+        for query, expected in zip(queries, exact_top):
+            started = time.perf_counter()
+            rows, _ = backend.search(query, 1)
+            samples.append((time.perf_counter() - started) * 1000)
+            hits += int(rows.size > 0 and rows[0] == expected)
+        samples.sort()
+        return {
+            'recall_at_1': round(hits / len(queries), 4),
+            'mean_ms': round(statistics.mean(samples), 3),
+            'p50_ms': round(samples[len(samples) // 2], 3),
+            'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+            'index_bytes': backend.nbytes,
+        }
+
+    def handle(self, *args, **options):
+        report = {'dim': options['dim'], 'queries': options['queries'], 'sizes': []}
+
+        for size in options['sizes']:
+            matrix = synthetic_identities(size, options['dim'])
+            queries = synthetic_queries(matrix, options['queries'])
+
+            brute = BruteForceBackend(matrix)
+            exact_top = [int(brute.search(q, 1)[0][0]) for q in queries]
+            entry = {'rows': size, 'brute': self._run(brute, queries, exact_top)}
+
+            for quantization in ('int8', 'fp16'):
+                started = time.perf_counter()
+                ivf = IVFQuantizedBackend(
+                    matrix, nlist=options['nlist'] or None, nprobe=options['nprobe'],
+                    rerank=options['rerank'], quantization=quantization,
+                )
+                build_s = time.perf_counter() - started
+                result = self._run(ivf, queries, exact_top)
+                result['build_s'] = round(build_s, 2)
+                result['nlist'] = len(ivf.centroids)
+                result['speedup'] = round(entry['brute']['mean_ms'] / result['mean_ms'], 2)
+                entry[f'ivf_{quantization}'] = result
+            report['sizes'].append(entry)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for entry in report['sizes']:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{entry['rows']} identities"))
+            for name in ('brute', 'ivf_int8', 'ivf_fp16'):
+                r = entry[name]
+                line = (
+                    f"  {name:<9}: recall@1 {r['recall_at_1']:.3f}, {r['mean_ms']:.3f} ms mean / "
+                    f"{r['p99_ms']:.3f} ms p99, {r['index_bytes'] / 2**20:.1f} MiB"
+                )
+                if name != 'brute':
+                    line += f", nlist {r['nlist']}, built in {r['build_s']:.2f} s, {r['speedup']:.1f}x"
+                self.stdout.write(line)
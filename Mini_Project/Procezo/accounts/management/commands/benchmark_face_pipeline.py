@@ -0,0 +1,248 @@
+import io
+import json
+import os
+import platform
+import resource
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from accounts import model_registry
+from accounts.face_index import build_backend
+from accounts.face_templates import best_similarity
+from accounts.inference_limiter import InferenceBusy
+from accounts.utils import detect_emotion, detect_emotion_from_frame, face_region
+from accounts.utils_face import FaceAnalysis, analyze_face, decode_image_bytes, embed_faces
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def percentiles(samples):
+    """p50/p95/p99/mean in milliseconds for a list of millisecond samples."""
+    if not samples:
+        return {'count': 0}
+    values = np.asarray(samples)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'count': int(values.size),
+        'mean_ms': round(float(values.mean()), 2),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+    }
+
+
+def load_images(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            files.append(path)
+    images = []
+    for path in files:
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+    return images
+
+
+def synthetic_images(count, size=(1280, 720), seed=0):
+    """Noisy gradients: exercise decode, quality and detection (no faces)."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    ramp = np.linspace(40, 200, width, dtype=np.float32)[None, :, None]
+    images = []
+    for i in range(count):
+        pixels = ramp + rng.normal(0, 25, (height, width, 3)).astype(np.float32)
+        buf = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buf, 'JPEG', quality=85)
+        images.append((f'synthetic-{i}.jpg', buf.getvalue()))
+    return images
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the face-login and emotion pipelines stage by stage (decode, quality, detection, "
+        "alignment, embedding, matching, emotion) and end to end at several concurrency levels. "
+        "Writes a JSON report for comparing model/backend changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Image files or directories (default: static/image)")
+        parser.add_argument('--synthetic', type=int, default=0, help="Add N synthetic frames without faces")
+        parser.add_argument('--iterations', type=int, default=5, help="Passes over the images for stage timings")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--requests', type=int, default=0, help="Frames per concurrency level (default: 4 per thread, at least one pass)")
+        parser.add_argument('--gallery', type=int, default=1000, help="Enrolled identities for the 1:N match stage")
+        parser.add_argument('--no-emotion', action='store_true', help="Skip the emotion stages")
+        parser.add_argument('--output', help="Write the JSON report to this file")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    # ---------- stage timings ----------
+    def _stages(self, images, iterations, gallery, include_emotion):
+        timings = defaultdict(list)
+        outcomes = defaultdict(int)
+
+        def timed(stage, fn, *args):
+            started = time.perf_counter()
+            result = fn(*args)
+            timings[stage].append((time.perf_counter() - started) * 1000)
+            return result
+
+        mtcnn = model_registry.get_mtcnn()
+        for _ in range(iterations):
+            for _, data in images:
+                total = time.perf_counter()
+                frame = timed('decode', decode_image_bytes, data)
+                if frame is None:
+                    outcomes['invalid'] += 1
+                    continue
+                quality = timed('quality', lambda: frame.quality)
+                if not quality.ok:
+                    outcomes[f'rejected_{quality.reason}'] += 1
+                    continue
+
+                boxes, probs = timed('detect', mtcnn.detect, frame.image)
+                if boxes is None:
+                    outcomes['no_face'] += 1
+                    continue
+                analysis = FaceAnalysis(boxes, probs)
+                face = timed('align', model_registry.extract_faces, frame.image, boxes)
+                embedding = timed('embed', lambda: embed_faces([face])[0])
+                if embedding is None:
+                    outcomes['no_embedding'] += 1
+                    continue
+
+                timed('match_1n', gallery.search, embedding, 1)
+                templates = gallery.matrix[:5]
+                timed('verify', best_similarity, embedding, templates)
+
+                if include_emotion:
+                    crop, face_rect = timed('emotion_crop', face_region, frame, analysis.primary_box)
+                    if crop is not None:
+                        timed('emotion_classify', detect_emotion_from_frame, crop, face_rect)
+                timings['total'].append((time.perf_counter() - total) * 1000)
+                outcomes['face'] += 1
+
+        return {stage: percentiles(samples) for stage, samples in timings.items()}, dict(outcomes)
+
+    # ---------- end to end under concurrency ----------
+    def _concurrency(self, images, level, requests, gallery, include_emotion):
+        latencies, lock = [], threading.Lock()
+        outcomes = defaultdict(int)
+
+        def one(index):
+            _, data = images[index % len(images)]
+            started = time.perf_counter()
+            outcome = 'ok'
+            try:
+                frame = decode_image_bytes(data)
+                if frame is None or not frame.quality.ok:
+                    outcome = 'rejected'
+                else:
+                    analysis = analyze_face(frame.image)
+                    if analysis.embedding is None:
+                        outcome = 'no_face'
+                    else:
+                        gallery.search(analysis.embedding, 1)
+                        if include_emotion:
+                            detect_emotion(frame, analysis.primary_box)
+            except InferenceBusy:
+                outcome = 'busy'
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                outcomes[outcome] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - started
+        return dict(
+            percentiles(latencies),
+            concurrency=level,
+            requests=requests,
+            wall_s=round(wall, 3),
+            throughput_fps=round(requests / wall, 2),
+            outcomes=dict(outcomes),
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [os.path.join(settings.BASE_DIR, 'static', 'image')]
+        images = load_images(paths) + synthetic_images(options['synthetic'])
+        if not images:
+            raise CommandError("No images found")
+        include_emotion = not options['no_emotion']
+
+        rss_start = model_registry._rss_bytes()
+        model_registry.warmup(include_emotion=include_emotion)
+
+        # Gallery of enrolled templates for the match stage, searched with the configured index backend
+        rng = np.random.default_rng(0)
+        matrix = rng.standard_normal((max(5, options['gallery']), 512), dtype=np.float32)
+        gallery = build_backend(matrix / np.linalg.norm(matrix, axis=1, keepdims=True))
+
+        stages, outcomes = self._stages(images, options['iterations'], gallery, include_emotion)
+        concurrency = [
+            self._concurrency(
+                images, level, options['requests'] or max(len(images), 4 * level),
+                gallery, include_emotion,
+            )
+            for level in options['concurrency']
+        ]
+
+        report = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'config': {
+                'embedding_backend': getattr(settings, 'FACE_EMBEDDING_BACKEND', 'eager'),
+                'index_backend': gallery.name,
+                'gallery': gallery.matrix.shape[0],
+                'decode_max_edge': getattr(settings, 'FACE_DECODE_MAX_EDGE', 640),
+                'batch_max_size': getattr(settings, 'FACE_BATCH_MAX_SIZE', 8),
+                'inference_max_concurrency': getattr(settings, 'INFERENCE_MAX_CONCURRENCY', 2),
+                'torch_threads': model_registry.torch_threads(),
+                'python': platform.python_version(),
+            },
+            'images': len(images),
+            'iterations': options['iterations'],
+            'outcomes': outcomes,
+            'stages': stages,
+            'concurrency': concurrency,
+            'models': model_registry.model_stats(),
+            'rss_start_bytes': rss_start,
+            'rss_end_bytes': model_registry._rss_bytes(),
+            # ru_maxrss is in KB on Linux
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Stages ({len(images)} images x {options['iterations']}, outcomes {outcomes})"))
+        for stage, r in stages.items():
+            if r['count']:
+                self.stdout.write(
+                    f"  {stage:<17} p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms  (n={r['count']})"
+                )
+        self.stdout.write(self.style.MIGRATE_HEADING("End to end"))
+        for r in concurrency:
+            self.stdout.write(
+                f"  {r['concurrency']:>3} threads: {r['throughput_fps']:7.2f} frames/s, p50 {r['p50_ms']:.1f} ms, "
+                f"p99 {r['p99_ms']:.1f} ms, {r['outcomes']}"
+            )
+        self.stdout.write(f"Peak RSS: {report['peak_rss_bytes'] / 2**20:.0f} MiB")
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
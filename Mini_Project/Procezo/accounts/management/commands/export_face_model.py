@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import model_registry
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the TorchScript / int8 embedding backends to the model cache and compare them with eager "
+        "(speed, and embeddings / match decisions on the stored face photos)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['torchscript', 'quantized', 'all'], default='all')
+        parser.add_argument('--iterations', type=int, default=20, help="Timed forward passes per backend")
+        parser.add_argument('--batch-size', type=int, default=1)
+
+    def _time(self, model, batch, iterations):
+        import torch
+
+        with torch.no_grad():
+            model(batch)  # warm
+            started = time.perf_counter()
+            for _ in range(iterations):
+                model(batch)
+        return (time.perf_counter() - started) * 1000 / iterations
+
+    def handle(self, *args, **options):
+        import torch
+
+        backends = ['torchscript', 'quantized'] if options['backend'] == 'all' else [options['backend']]
+        eager = model_registry._build_eager_resnet()
+        batch = torch.randn(options['batch_size'], 3, 160, 160).to(model_registry.get_device())
+
+        eager_ms = self._time(eager, batch, options['iterations'])
+        self.stdout.write(f"eager: {eager_ms:.1f} ms/forward")
+
+        failed = False
+        for backend in backends:
+            try:
+                path, accuracy = model_registry.export_resnet_backend(backend, eager)
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"{backend}: {e}"))
+                failed = True
+                continue
+            model = torch.jit.load(path, map_location=model_registry.get_device()).eval()
+            ms = self._time(model, batch, options['iterations'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{backend}: {ms:.1f} ms/forward ({eager_ms / ms:.2f}x) -> {path}"
+            ))
+            self.stdout.write(
+                f"  vs eager on {accuracy['samples']} {accuracy['source']} inputs: "
+                f"cosine min {accuracy['min_cosine']:.4f} / mean {accuracy['mean_cosine']:.4f}, "
+                f"{accuracy['decision_flips']} of {accuracy['pairs']} match decisions changed "
+                f"({accuracy['reference_matches']} pairs match with eager)"
+            )
+
+        if failed:
+            raise CommandError("One or more backends failed to export.")
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from accounts import emotion_jobs, model_registry
+from accounts.process_pool import run_workers
+
+
+class Command(BaseCommand):
+    help = "Drain the async emotion queue (EMOTION_ASYNC) with a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help="Worker processes claiming jobs")
+        parser.add_argument('--batch-size', type=int, default=8, help="Jobs claimed and inferred together")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+        parser.add_argument('--stats', action='store_true', help="Print queue depth as JSON and exit")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(emotion_jobs.queue_stats(), indent=2))
+            return
+
+        self.stdout.write("Loading models...")
+        model_registry.get_mtcnn()
+        model_registry.get_resnet()
+        model_registry.get_emotion_detector()
+
+        # Children must not share DB sockets with the parent
+        connections.close_all()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processing emotion jobs with {options['workers']} worker(s), batch size {options['batch_size']}"
+        ))
+        run_workers(
+            lambda: emotion_jobs.run_worker(options['batch_size'], options['poll_interval'], options['once']),
+            options['workers'],
+            name='emotion worker',
+        )
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from accounts import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily attendance / emotion / productivity summaries from the raw tables, "
+        "e.g. after a bulk import or a QuerySet.update() that bypassed the signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--until', help="Last day to rebuild (YYYY-MM-DD, default: no limit)")
+        parser.add_argument('--days', type=int, help="Rebuild only the last N days")
+        parser.add_argument('--kind', choices=sorted(rollups.SOURCES), action='append',
+                            help="Summary to rebuild (repeatable, default: all)")
+
+    def _date(self, value, option):
+        if value is None:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f"{option} must be a date (YYYY-MM-DD), got {value!r}")
+        return parsed
+
+    def handle(self, *args, **options):
+        start = self._date(options['since'], '--since')
+        end = self._date(options['until'], '--until')
+        if options['days']:
+            start = date.today() - timedelta(days=options['days'] - 1)
+
+        written = rollups.rebuild(start, end, kinds=options['kind'])
+        span = f"{start or 'the beginning'} to {end or 'today'}"
+        for kind, rows in written.items():
+            self.stdout.write(f"  {kind:<13} {rows} summary rows")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt daily summaries from {span}"))
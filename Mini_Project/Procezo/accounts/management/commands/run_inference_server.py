@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from accounts import model_registry
+from accounts.inference_server import open_listener, run_pool
+
+
+class Command(BaseCommand):
+    help = "Run the face/emotion inference sidecar on a Unix domain socket."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=getattr(settings, 'INFERENCE_SOCKET_PATH', None),
+                            help="Socket path (default: settings.INFERENCE_SOCKET_PATH)")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Number of model-serving processes sharing the socket")
+        parser.add_argument('--no-emotion', action='store_true',
+                            help="Do not load the FER emotion model")
+
+    def handle(self, *args, **options):
+        path = options['socket']
+        if not path:
+            raise CommandError("No socket path given and INFERENCE_SOCKET_PATH is not set.")
+
+        # The sidecar itself must always run the models in-process
+        settings.INFERENCE_SOCKET_PATH = None
+
+        self.stdout.write("Loading models...")
+        model_registry.get_mtcnn()
+        model_registry.get_resnet()
+        if not options['no_emotion']:
+            model_registry.get_emotion_detector()
+        for name, stats in model_registry.model_stats().items():
+            self.stdout.write(f"  {name}: {stats['load_seconds']}s, {stats['param_bytes'] / 1e6:.1f} MB params")
+
+        # Children must not share DB sockets with the parent
+        connections.close_all()
+
+        listener = open_listener(path)
+        self.stdout.write(self.style.SUCCESS(f"Inference server listening on {path} with {options['workers']} worker(s)"))
+        try:
+            run_pool(listener, options['workers'])
+        finally:
+            listener.close()
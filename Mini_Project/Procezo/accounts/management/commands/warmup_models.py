@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import model_registry
+
+
+class Command(BaseCommand):
+    help = "Load the face/emotion models and report load times and warm inference latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-emotion', action='store_true', help="Skip the FER emotion model")
+
+    def handle(self, *args, **options):
+        status = model_registry.warmup(include_emotion=not options['no_emotion'])
+        report = {'warmup': status, 'models': model_registry.model_stats()}
+        self.stdout.write(json.dumps(report, indent=2))
+        if status['state'] != 'done':
+            raise CommandError(f"Warmup failed: {status.get('error')}")
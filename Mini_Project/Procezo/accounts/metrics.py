@@ -0,0 +1,146 @@
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+# ================= STAGE METRICS =================
+# stage_timer('detect') around each step of the face / emotion pipelines
+# records its duration in an in-process histogram and, while a request is
+# being served, in that request's timings. ServerTimingMiddleware sends the
+# request's timings back as a Server-Timing header; /accounts/metrics/
+# renders all histograms in the Prometheus text format. Histograms are per
+# worker process, so scrape each worker (or sum them in the query).
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# {stage: seconds} of the request being served on this thread, or None
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def is_enabled():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one label."""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_value, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][index] += 1
+            series['sum'] += seconds
+            series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: dict(value, counts=list(value['counts'])) for key, value in self._series.items()}
+        for label_value in sorted(series):
+            data, cumulative = series[label_value], 0
+            label = f'{self.label}="{label_value}"'
+            for bound, count in zip(self.buckets + (float('inf'),), data['counts']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {data['sum']:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {data['count']}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    'procezo_face_stage_seconds', "Time spent in each face/emotion pipeline stage.", 'stage',
+)
+REQUEST_SECONDS = Histogram(
+    'procezo_request_seconds', "Request latency by view.", 'view',
+)
+
+
+def record_stage(name, seconds):
+    if not is_enabled():
+        return
+    STAGE_SECONDS.observe(name, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage_timer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """Decorator form of stage_timer for functions that are one whole stage."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_prometheus():
+    from .inference_limiter import inference_limiter
+
+    lines = STAGE_SECONDS.render() + REQUEST_SECONDS.render()
+    limiter = inference_limiter.stats()
+    for key, kind, help_text in (
+        ('admitted', 'counter', "Inferences admitted by the concurrency limiter."),
+        ('rejected_queue_full', 'counter', "Inferences rejected because too many were waiting."),
+        ('rejected_timeout', 'counter', "Inferences rejected after INFERENCE_QUEUE_TIMEOUT."),
+        ('in_flight', 'gauge', "Inferences running now."),
+        ('waiting', 'gauge', "Inferences waiting for a slot now."),
+    ):
+        name = f"procezo_inference_{key}" + ('_total' if kind == 'counter' else '')
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {limiter[key]}"]
+    return '\n'.join(lines) + '\n'
+
+
+# ================= SERVER-TIMING =================
+class ServerTimingMiddleware:
+    """Times every request and reports its pipeline stages in a Server-Timing header."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_enabled():
+            return self.get_response(request)
+
+        timings = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.url_name:
+            REQUEST_SECONDS.observe(match.url_name, elapsed)
+
+        if timings and getattr(settings, 'SERVER_TIMING_HEADER', True):
+            entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+            entries.append(f"total;dur={elapsed * 1000:.1f}")
+            response['Server-Timing'] = ', '.join(entries)
+        return response
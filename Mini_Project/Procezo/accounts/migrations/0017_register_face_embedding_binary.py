@@ -0,0 +1,68 @@
+import json
+import struct
+
+import numpy as np
+from django.db import migrations, models
+
+# Frozen copy of the format in accounts.utils_face (version 1, VGGFace2, float16)
+HEADER = struct.Struct('<2sBBBxH')
+MAGIC = b'FE'
+VERSION = 1
+MODEL_VGGFACE2 = 1
+DTYPE_FLOAT16 = 2
+DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f2')}
+
+
+def pack(values):
+    vec = np.asarray(values, dtype=DTYPES[DTYPE_FLOAT16]).ravel()
+    return HEADER.pack(MAGIC, VERSION, MODEL_VGGFACE2, DTYPE_FLOAT16, vec.size) + vec.tobytes()
+
+
+def unpack(blob):
+    blob = bytes(blob)
+    magic, version, model, code, dim = HEADER.unpack_from(blob)
+    return np.frombuffer(blob, dtype=DTYPES[code], count=dim, offset=HEADER.size).astype(float).tolist()
+
+
+def json_to_binary(apps, schema_editor):
+    Register = apps.get_model('accounts', 'Register')
+    for reg in Register.objects.exclude(face_embedding__isnull=True).only('register_id', 'face_embedding').iterator():
+        raw = reg.face_embedding
+        try:
+            values = json.loads(raw) if isinstance(raw, str) else raw
+        except ValueError:
+            continue
+        if not values:
+            continue
+        Register.objects.filter(register_id=reg.register_id).update(face_embedding_blob=pack(values))
+
+
+def binary_to_json(apps, schema_editor):
+    Register = apps.get_model('accounts', 'Register')
+    for reg in Register.objects.exclude(face_embedding_blob__isnull=True).only('register_id', 'face_embedding_blob').iterator():
+        Register.objects.filter(register_id=reg.register_id).update(face_embedding=unpack(reg.face_embedding_blob))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_rename_productvity_id_productivity_productivity_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='register',
+            name='face_embedding_blob',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='register',
+            name='face_embedding',
+        ),
+        migrations.RenameField(
+            model_name='register',
+            old_name='face_embedding_blob',
+            new_name='face_embedding',
+        ),
+    ]
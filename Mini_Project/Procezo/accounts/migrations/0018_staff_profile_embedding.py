@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_register_face_embedding_binary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='profile_embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='staff',
+            name='profile_embedding_source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0018_staff_profile_embedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmotionJob',
+            fields=[
+                ('job_id', models.AutoField(primary_key=True, serialize=False)),
+                ('frame', models.BinaryField()),
+                ('captured_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Processing', 'Processing'), ('Failed', 'Failed')], default='Pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('staff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emotion_jobs', to='accounts.staff')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'captured_at'], name='accounts_em_status_127a23_idx')],
+            },
+        ),
+    ]
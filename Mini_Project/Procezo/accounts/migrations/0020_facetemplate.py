@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def enrollment_templates(apps, schema_editor):
+    Register = apps.get_model('accounts', 'Register')
+    FaceTemplate = apps.get_model('accounts', 'FaceTemplate')
+    rows = Register.objects.exclude(face_embedding__isnull=True).values_list('register_id', 'face_embedding')
+    FaceTemplate.objects.bulk_create(
+        [FaceTemplate(register_id=register_id, embedding=bytes(blob), source='Enrollment')
+         for register_id, blob in rows.iterator() if blob],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0019_emotionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceTemplate',
+            fields=[
+                ('template_id', models.AutoField(primary_key=True, serialize=False)),
+                ('embedding', models.BinaryField()),
+                ('source', models.CharField(choices=[('Enrollment', 'Enrollment'), ('Login', 'Login')], default='Enrollment', max_length=20)),
+                ('similarity', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('register', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_templates', to='accounts.register')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['register', 'source', 'created_at'], name='accounts_fa_registe_ebbc3c_idx')],
+            },
+        ),
+        migrations.RunPython(enrollment_templates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0020_facetemplate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['staff', 'date', 'status'], name='accounts_at_staff_i_9cd1cc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['date', 'status'], name='accounts_at_date_bb0c81_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emotion',
+            index=models.Index(fields=['staff', 'timestamp'], name='accounts_em_staff_i_33518d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emotion',
+            index=models.Index(fields=['timestamp'], name='accounts_em_timesta_32661c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='googlemeet',
+            index=models.Index(fields=['job_type', 'meet_time'], name='accounts_go_job_typ_ac13a3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productivity',
+            index=models.Index(fields=['staff', 'datetime'], name='accounts_pr_staff_i_0987a0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productivity',
+            index=models.Index(fields=['datetime'], name='accounts_pr_datetim_9a6d22_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workschedule',
+            index=models.Index(fields=['staff', 'start_time', 'end_time'], name='accounts_wo_staff_i_88ea29_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:21
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_summaries(apps, schema_editor):
+    # Attendance is summarised by 0023 once its rows are folded into sessions
+    Emotion = apps.get_model('accounts', 'Emotion')
+    Productivity = apps.get_model('accounts', 'Productivity')
+    EmotionSummary = apps.get_model('accounts', 'DailyEmotionSummary')
+    ProductivitySummary = apps.get_model('accounts', 'DailyProductivitySummary')
+
+    EmotionSummary.objects.bulk_create([
+        EmotionSummary(day=day, emotion_type=emotion_type, count=count)
+        for day, emotion_type, count in (
+            Emotion.objects.annotate(day=TruncDate('timestamp'))
+            .values_list('day', 'emotion_type').annotate(count=Count('pk')).order_by()
+        )
+    ], batch_size=1000)
+    ProductivitySummary.objects.bulk_create([
+        ProductivitySummary(day=day, samples=samples, score_total=score_total or Decimal('0.00'))
+        for day, samples, score_total in (
+            Productivity.objects.annotate(day=TruncDate('datetime'))
+            .values_list('day').annotate(samples=Count('pk'), score_total=Sum('productivity_score')).order_by()
+        )
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0021_time_range_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProductivitySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('score_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyAttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('Active', 'Active'), ('Inactive', 'Inactive'), ('Late', 'Late')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='unique_attendance_summary')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyEmotionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('emotion_type', models.CharField(choices=[('Happy', 'Happy'), ('Sad', 'Sad'), ('Neutral', 'Neutral'), ('Angry', 'Angry'), ('Tired', 'Tired'), ('Focused', 'Focused')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'emotion_type'), name='unique_emotion_summary')],
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
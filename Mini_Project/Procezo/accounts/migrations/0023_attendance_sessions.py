@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:23
+
+from datetime import datetime
+from itertools import groupby
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def _session_key(row):
+    attendance_id, staff_id, day, check_in = row[:4]
+    # Rows of one session share the check-in time; rows without one stay on their own
+    return (staff_id, day, check_in) if check_in is not None else (staff_id, day, attendance_id)
+
+
+def fold_sessions(apps, schema_editor):
+    """
+    Fold the old Late + Active (+ Inactive on check-out) rows of each session
+    into the session's Active row, moving lateness, check-out and overtime onto it.
+    """
+    Attendance = apps.get_model('accounts', 'Attendance')
+    Staff = apps.get_model('accounts', 'Staff')
+    shift_starts = dict(Staff.objects.values_list('staff_id', 'check_in'))
+
+    sessions, duplicates = [], []
+
+    def flush():
+        Attendance.objects.bulk_update(
+            sessions, ['check_out', 'overtime_hours', 'status', 'is_late', 'late_minutes'], batch_size=500,
+        )
+        Attendance.objects.filter(attendance_id__in=duplicates).delete()
+        sessions.clear()
+        duplicates.clear()
+
+    # One staff member at a time, so the table is not written while a cursor reads it
+    for staff_id, shift_start in shift_starts.items():
+        rows = list(
+            Attendance.objects.filter(staff_id=staff_id)
+            .order_by('date', 'check_in', 'attendance_id')
+            .values_list('attendance_id', 'staff_id', 'date', 'check_in', 'check_out', 'overtime_hours', 'status')
+        )
+        for _, group in groupby(rows, key=_session_key):
+            group = list(group)
+            keep = next((row for row in group if row[6] == 'Active'), group[0])
+            attendance_id, _, day, check_in = keep[:4]
+
+            check_outs = [row[4] for row in group if row[4] is not None]
+            check_out = max(check_outs) if check_outs else None
+            overtime = next((row[5] for row in group if row[6] == 'Inactive' and row[5] is not None), keep[5])
+            is_late = any(row[6] == 'Late' for row in group)
+
+            late_minutes = 0
+            if is_late and check_in and shift_start:
+                late = datetime.combine(day, check_in) - datetime.combine(day, shift_start)
+                late_minutes = max(1, int(late.total_seconds() // 60))
+
+            sessions.append(Attendance(
+                attendance_id=attendance_id, date=day, check_out=check_out, overtime_hours=overtime,
+                status='Inactive' if check_out else 'Active', is_late=is_late, late_minutes=late_minutes,
+            ))
+            duplicates.extend(row[0] for row in group if row[0] != attendance_id)
+        if len(sessions) >= 500:
+            flush()
+    flush()
+
+
+def rebuild_attendance_summary(apps, schema_editor):
+    Attendance = apps.get_model('accounts', 'Attendance')
+    Summary = apps.get_model('accounts', 'DailyAttendanceSummary')
+    Summary.objects.all().delete()
+    summaries = [
+        Summary(day=day, status=status, count=count)
+        for day, status, count in Attendance.objects.values_list('date', 'status').annotate(count=Count('pk')).order_by()
+    ]
+    summaries += [
+        Summary(day=day, status='Late', count=count)
+        for day, count in Attendance.objects.filter(is_late=True).values_list('date').annotate(count=Count('pk')).order_by()
+    ]
+    Summary.objects.bulk_create(summaries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0022_daily_summaries'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='attendance',
+            name='accounts_at_date_bb0c81_idx',
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='is_late',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='late_minutes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fold_sessions, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_attendance_summary, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['date', 'status', 'is_late'], name='accounts_at_date_0367f4_idx'),
+        ),
+    ]
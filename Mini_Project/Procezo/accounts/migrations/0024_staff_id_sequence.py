@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+def seed_staff_sequence(apps, schema_editor):
+    # Continue after the highest existing number (by value: S1000 > S999)
+    Staff = apps.get_model('accounts', 'Staff')
+    StaffIdSequence = apps.get_model('accounts', 'StaffIdSequence')
+    numbers = [
+        int(staff_id[1:]) for staff_id in Staff.objects.values_list('staff_id', flat=True)
+        if staff_id.startswith('S') and staff_id[1:].isdigit()
+    ]
+    StaffIdSequence.objects.create(name='staff', next_value=max(numbers, default=0) + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0023_attendance_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffIdSequence',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('next_value', models.PositiveIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(seed_staff_sequence, migrations.RunPython.noop),
+    ]
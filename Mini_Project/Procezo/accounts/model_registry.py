@@ -0,0 +1,431 @@
+import copy
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# ================= MODEL REGISTRY =================
+# One place that owns every face / emotion model in the process.
+# utils.py and utils_face.py both go through here, so a worker that serves
+# login and emotion capture holds a single copy of each set of weights.
+
+_lock = threading.RLock()
+_models = {}
+_stats = {}
+_device = None
+
+_warmup_lock = threading.Lock()
+_warmup = {'state': 'pending'}
+
+
+def get_device():
+    global _device
+    if _device is None:
+        import torch
+        configure_torch_threads()
+        _device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    return _device
+
+
+def configure_torch_threads():
+    """
+    Apply TORCH_NUM_THREADS / TORCH_INTEROP_THREADS (0 keeps torch's default).
+    Runs before the first model is built: the inter-op pool can only be
+    sized before torch starts using it.
+    """
+    import torch
+
+    num_threads = getattr(settings, 'TORCH_NUM_THREADS', 0)
+    interop_threads = getattr(settings, 'TORCH_INTEROP_THREADS', 0)
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            logger.warning(f"Could not set torch inter-op threads: {e}")
+    return torch_threads()
+
+
+def torch_threads():
+    import torch
+    return {
+        'intra_op': torch.get_num_threads(),
+        'inter_op': torch.get_num_interop_threads(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def _rss_bytes():
+    """Current resident set size of this process (0 if unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is KB on Linux (peak, not current, but better than nothing)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def _param_bytes(model):
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+    except AttributeError:
+        return 0
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def _load(name, factory):
+    """Thread-safe lazy load; the factory runs at most once per process."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(name)
+        if model is not None:
+            return model
+
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        model = factory()
+        elapsed = time.perf_counter() - started
+
+        if model is not None:
+            _models[name] = model
+            _stats[name] = {
+                'load_seconds': round(elapsed, 3),
+                'param_bytes': _param_bytes(model),
+                'rss_delta_bytes': max(0, _rss_bytes() - rss_before),
+                'loaded_at': time.time(),
+            }
+            logger.info(f"Loaded model '{name}' in {elapsed:.2f}s")
+        return model
+
+
+# ================= FACE MODELS =================
+def get_mtcnn():
+    """
+    Shared MTCNN detector. `detect()` always returns every face; use
+    extract_faces(..., keep_all=...) to choose between one or all crops.
+    """
+    def factory():
+        from facenet_pytorch import MTCNN
+        return MTCNN(keep_all=False, device=get_device())
+    return _load('mtcnn', factory)
+
+
+def get_haar_face_detector():
+    """OpenCV Haar cascade used by the frame quality pre-filter (None if it cannot be loaded)."""
+    def factory():
+        import cv2
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml')
+        return None if cascade.empty() else cascade
+    return _load('haar_face', factory)
+
+
+EMBEDDING_BACKENDS = ('eager', 'torchscript', 'quantized')
+
+
+def _build_eager_resnet():
+    from facenet_pytorch import InceptionResnetV1
+    return InceptionResnetV1(pretrained='vggface2').eval().to(get_device())
+
+
+def get_resnet():
+    """
+    Embedding network for the configured FACE_EMBEDDING_BACKEND:
+    'eager' (fp32 PyTorch), 'torchscript' (traced + frozen) or 'quantized'
+    (dynamic int8 Linear layers, traced). Exported backends are only read
+    from the model cache, written once by `manage.py export_face_model`; if
+    the artifact is missing or cannot be loaded, eager is used.
+    """
+    def factory():
+        backend = getattr(settings, 'FACE_EMBEDDING_BACKEND', 'eager')
+        if backend != 'eager':
+            try:
+                return load_resnet_backend(backend)
+            except Exception as e:
+                logger.error(f"Embedding backend '{backend}' unavailable, using eager: {e}")
+        return _build_eager_resnet()
+    return _load('resnet', factory)
+
+
+def extract_faces(img, boxes, keep_all=False):
+    """
+    Crop aligned face tensors for the given MTCNN boxes.
+    keep_all=False returns the largest face as a (3, H, W) tensor;
+    keep_all=True returns all faces as an (N, 3, H, W) tensor.
+    """
+    import numpy as np
+    import torch
+    from facenet_pytorch.models.mtcnn import fixed_image_standardization
+    from facenet_pytorch.models.utils.detect_face import extract_face
+
+    if boxes is None or len(boxes) == 0:
+        return None
+
+    mtcnn = get_mtcnn()
+    if not keep_all:
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        boxes = boxes[[int(np.argmax(areas))]]
+
+    faces = []
+    for box in boxes:
+        face = extract_face(img, box, mtcnn.image_size, mtcnn.margin)
+        if mtcnn.post_process:
+            face = fixed_image_standardization(face)
+        faces.append(face)
+
+    return torch.stack(faces) if keep_all else faces[0]
+
+
+# ================= EXPORTED EMBEDDING BACKENDS =================
+def backend_artifact_path(backend):
+    import torch
+    cache_dir = getattr(settings, 'FACE_MODEL_CACHE_DIR', None) or os.path.join(settings.BASE_DIR, 'model_cache')
+    version = torch.__version__.replace('+', '_')
+    return os.path.join(str(cache_dir), f"resnet_vggface2_{backend}_torch{version}.pt")
+
+
+def build_resnet_backend(backend, eager=None):
+    """Build (but do not cache) the given backend from an eager model."""
+    import torch
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'")
+    eager = eager if eager is not None else _build_eager_resnet()
+    if backend == 'eager':
+        return eager
+
+    # Tracing/quantization happen on CPU; the artifact is moved on load
+    model = copy.deepcopy(eager).cpu().eval()
+    example = torch.zeros(1, 3, 160, 160)
+    with torch.no_grad():
+        if backend == 'quantized':
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            return torch.jit.trace(model, example)
+        return torch.jit.freeze(torch.jit.trace(model, example))
+
+
+def calibration_faces(limit=32):
+    """
+    Aligned face crops (N, 3, 160, 160) for checking exported backends: the
+    stored staff/registration photos, then the bundled static images.
+    None if no face was found.
+    """
+    import glob
+    import torch
+    from .models import Register, Staff
+    from .utils_face import decode_image_bytes
+
+    files = [staff.profile_image for staff in Staff.objects.exclude(profile_image='').exclude(profile_image=None)[:limit]]
+    for register in Register.objects.all()[:limit]:
+        files.extend(f for f in (register.face_capture, register.profile_image) if f)
+
+    def images():
+        for f in files:
+            try:
+                with f.open('rb') as fh:
+                    yield fh.read()
+            except (OSError, ValueError):
+                continue
+        for static_dir in getattr(settings, 'STATICFILES_DIRS', []):
+            for path in sorted(glob.glob(os.path.join(str(static_dir), 'image', '*.jpg'))):
+                with open(path, 'rb') as fh:
+                    yield fh.read()
+
+    faces = []
+    mtcnn = get_mtcnn()
+    for data in images():
+        frame = decode_image_bytes(data)
+        if frame is None:
+            continue
+        boxes, _ = mtcnn.detect(frame.image)
+        crops = extract_faces(frame.image, boxes, keep_all=True)
+        if crops is not None:
+            faces.extend(crops)
+        if len(faces) >= limit:
+            break
+    return torch.stack(faces[:limit]) if faces else None
+
+
+def backend_accuracy(model, reference, inputs=None, samples=8):
+    """
+    Compare model and reference embeddings on aligned face crops (default:
+    calibration_faces(), mirrored copies included so there are same-person
+    pairs). Returns a dict with the min/mean cosine between the two backends
+    and 'decision_flips': face pairs whose match decision at
+    FACE_MATCH_THRESHOLD differs between them.
+    """
+    import torch
+    from .utils import FACE_MATCH_THRESHOLD
+
+    source = 'faces'
+    if inputs is None:
+        inputs = calibration_faces()
+        if inputs is not None:
+            inputs = torch.cat([inputs, inputs.flip(-1)])
+    if inputs is None:
+        # No face photos available: only a numerical sanity check
+        logger.warning("No face images found for the backend accuracy check, using random inputs")
+        source = 'noise'
+        inputs = torch.randn(samples, 3, 160, 160, generator=torch.Generator().manual_seed(0))
+    inputs = inputs.to(get_device())
+    with torch.no_grad():
+        a = torch.nn.functional.normalize(model(inputs).float(), dim=1)
+        b = torch.nn.functional.normalize(reference(inputs).float(), dim=1)
+
+    cosine = (a * b).sum(dim=1)
+    pairs = torch.triu_indices(len(inputs), len(inputs), offset=1)
+    matches_a = (a @ a.T)[pairs[0], pairs[1]] >= FACE_MATCH_THRESHOLD
+    matches_b = (b @ b.T)[pairs[0], pairs[1]] >= FACE_MATCH_THRESHOLD
+    return {
+        'source': source,
+        'samples': len(inputs),
+        'min_cosine': float(cosine.min()),
+        'mean_cosine': float(cosine.mean()),
+        'pairs': pairs.shape[1],
+        'reference_matches': int(matches_b.sum()),
+        'decision_flips': int((matches_a != matches_b).sum()),
+    }
+
+
+def export_resnet_backend(backend, eager=None, inputs=None):
+    """
+    One-time export: build the backend, check it against eager embeddings
+    (see backend_accuracy) and save it to the model cache. Returns (path, accuracy).
+    """
+    import torch
+
+    eager = eager if eager is not None else _build_eager_resnet()
+    model = build_resnet_backend(backend, eager).to(get_device())
+    accuracy = backend_accuracy(model, eager, inputs)
+    threshold = getattr(settings, 'FACE_BACKEND_MIN_COSINE', 0.99)
+    max_flips = getattr(settings, 'FACE_BACKEND_MAX_DECISION_FLIPS', 0)
+    if accuracy['min_cosine'] < threshold:
+        raise ValueError(f"Backend '{backend}' failed accuracy check: min cosine {accuracy['min_cosine']:.4f} < {threshold}")
+    if accuracy['decision_flips'] > max_flips:
+        raise ValueError(
+            f"Backend '{backend}' failed accuracy check: {accuracy['decision_flips']} of {accuracy['pairs']} "
+            f"face pair match decisions differ from eager (allowed {max_flips})"
+        )
+
+    path = backend_artifact_path(backend)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.jit.save(model.cpu(), tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(
+        f"Exported '{backend}' embedding backend to {path} (min cosine {accuracy['min_cosine']:.4f} "
+        f"on {accuracy['samples']} {accuracy['source']} inputs, {accuracy['decision_flips']} decision flips)"
+    )
+    return path, accuracy
+
+
+def load_resnet_backend(backend):
+    import torch
+
+    path = backend_artifact_path(backend)
+    if not os.path.exists(path):
+        # Exporting (tracing, calibration, accuracy check) is too slow for a request
+        raise FileNotFoundError(f"{path} not found; run `manage.py export_face_model --backend {backend}`")
+    return torch.jit.load(path, map_location=get_device()).eval()
+
+
+# ================= EMOTION MODEL =================
+def get_emotion_detector():
+    def factory():
+        try:
+            from fer.fer import FER
+            # No detector of its own: callers pass the shared MTCNN's face box
+            # as face_rectangles (see utils.detect_emotion_from_frame)
+            return FER(mtcnn=False)
+        except Exception as e:
+            logger.error(f"FER init error: {e}")
+            return None
+    return _load('emotion', factory)
+
+
+# ================= WARMUP =================
+def measure_inference_latency(include_emotion=True):
+    """Run one dummy pass through each loaded model; returns milliseconds per model."""
+    import numpy as np
+    import torch
+    from PIL import Image
+
+    latency = {}
+
+    started = time.perf_counter()
+    get_mtcnn().detect(Image.new('RGB', (640, 480)))
+    latency['mtcnn'] = round((time.perf_counter() - started) * 1000, 2)
+
+    started = time.perf_counter()
+    with torch.no_grad():
+        get_resnet()(torch.zeros(1, 3, 160, 160, device=get_device()))
+    latency['resnet'] = round((time.perf_counter() - started) * 1000, 2)
+
+    if include_emotion:
+        detector = get_emotion_detector()
+        if detector is not None:
+            started = time.perf_counter()
+            # Passing the face box skips detection and exercises the classifier only
+            detector.detect_emotions(np.zeros((128, 128, 3), dtype=np.uint8), face_rectangles=[(32, 32, 64, 64)])
+            latency['emotion'] = round((time.perf_counter() - started) * 1000, 2)
+
+    return latency
+
+
+def warmup(include_emotion=True):
+    """
+    Load every model and run one dummy inference, at most once per process.
+    Concurrent callers wait for the first one to finish.
+    """
+    with _warmup_lock:
+        if _warmup['state'] == 'done':
+            return dict(_warmup)
+
+        _warmup.update(state='running', started_at=time.time())
+        try:
+            get_mtcnn()
+            get_resnet()
+            if include_emotion:
+                get_emotion_detector()
+            _warmup['latency_ms'] = measure_inference_latency(include_emotion)
+            _warmup['state'] = 'done'
+            _warmup.pop('error', None)
+        except Exception as e:
+            logger.error(f"Model warmup failed: {e}")
+            _warmup.update(state='failed', error=str(e))
+        _warmup['finished_at'] = time.time()
+        return dict(_warmup)
+
+
+def start_background_warmup(include_emotion=True):
+    """Warm up without blocking startup; readiness reports 'running' until done."""
+    thread = threading.Thread(target=warmup, args=(include_emotion,), name='model-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def warmup_status():
+    return dict(_warmup)
+
+
+# ================= REPORTING =================
+def loaded_models():
+    """Names of the models loaded in this process."""
+    return sorted(_models)
+
+
+def model_stats():
+    """Per-model load time and memory usage, e.g. for logging or a status endpoint."""
+    with _lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
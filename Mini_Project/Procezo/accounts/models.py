@@ -2,7 +2,8 @@
 
 import os
 from decimal import Decimal
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Length
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
 
@@ -33,11 +34,75 @@ def face_upload_to(instance, filename):
 # ============================================================
 #  1) STAFF MODEL
 # ============================================================
+STAFF_ID_PREFIX = 'S'
+
+
+def format_staff_id(number):
+    return f"{STAFF_ID_PREFIX}{number:03d}"
+
+
+def staff_id_number(staff_id):
+    """Numeric part of an 'S012'-style id, or None for ids in another format."""
+    if staff_id and staff_id.startswith(STAFF_ID_PREFIX) and staff_id[len(STAFF_ID_PREFIX):].isdigit():
+        return int(staff_id[len(STAFF_ID_PREFIX):])
+    return None
+
+
+class StaffIdSequence(models.Model):
+    """
+    Next free staff number. reserve() takes numbers with one UPDATE of this
+    row, which holds its lock until the transaction commits, so concurrent
+    sign-ups never get the same id and no staff table scan is needed.
+    """
+    name = models.CharField(max_length=20, primary_key=True)
+    next_value = models.PositiveIntegerField(default=1)
+
+    STAFF = 'staff'
+
+    @classmethod
+    def reserve(cls, count=1):
+        """Reserve `count` consecutive staff ids (e.g. for bulk onboarding) and return them."""
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        with transaction.atomic():
+            if not cls.objects.filter(name=cls.STAFF).update(next_value=models.F('next_value') + count):
+                cls._create_staff_row()
+                cls.objects.filter(name=cls.STAFF).update(next_value=models.F('next_value') + count)
+            end = cls.objects.get(name=cls.STAFF).next_value
+        return [format_staff_id(number) for number in range(end - count, end)]
+
+    @classmethod
+    def _create_staff_row(cls):
+        # First use (or the row was removed): continue after the highest existing number
+        numbers = [staff_id_number(staff_id) for staff_id in Staff.objects.values_list('staff_id', flat=True)]
+        start = max([number for number in numbers if number is not None], default=0) + 1
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=cls.STAFF, next_value=start)
+        except IntegrityError:
+            pass  # created concurrently
+
+    def __str__(self):
+        return f"{self.name}: next {self.next_value}"
+
+
+class StaffQuerySet(models.QuerySet):
+    def order_by_staff_id(self, descending=False):
+        """Numeric id order: S999 before S1000 (a plain order_by('staff_id') is by string)."""
+        length = Length('staff_id')
+        if descending:
+            return self.order_by(length.desc(), '-staff_id')
+        return self.order_by(length, 'staff_id')
+
+
 class Staff(models.Model):
     staff_id = models.CharField(max_length=10, primary_key=True, editable=False)
     name = models.CharField(max_length=255, blank=True)
     email = models.EmailField(unique=True, blank=True, null=True)
     profile_image = models.ImageField(upload_to=profile_upload_to, null=True, blank=True)
+    # Face embedding of profile_image, valid while profile_embedding_source == profile_image.name
+    profile_embedding = models.BinaryField(null=True, blank=True, editable=False)
+    profile_embedding_source = models.CharField(max_length=255, blank=True, default='', editable=False)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='Staff')
     job_type = models.CharField(max_length=100, blank=True, null=True)
     gender = models.CharField(max_length=50, blank=True, null=True)
@@ -47,18 +112,12 @@ class Staff(models.Model):
     check_in = models.TimeField(null=True, blank=True)
     check_out = models.TimeField(null=True, blank=True)
     
-    # Auto-generate S001, S002...
+    objects = StaffQuerySet.as_manager()
+
+    # Auto-generate S001, S002... from the StaffIdSequence row
     def save(self, *args, **kwargs):
         if not self.staff_id:
-            last_staff = Staff.objects.order_by('-staff_id').first()
-
-            if last_staff and last_staff.staff_id.startswith('S'):
-                last_number = int(last_staff.staff_id[1:])
-                new_number = last_number + 1
-            else:
-                new_number = 1
-
-            self.staff_id = f"S{new_number:03d}"
+            self.staff_id = StaffIdSequence.reserve()[0]
 
         super().save(*args, **kwargs)
 
@@ -80,7 +139,7 @@ class Register(models.Model):
 
     # Face recognition
     profile_image = models.ImageField(upload_to=profile_upload_to, null=True, blank=True)
-    face_embedding = models.JSONField(null=True, blank=True) # list of floats
+    face_embedding = models.BinaryField(null=True, blank=True) # packed vector, see utils_face.pack_embedding
     # store the live camera-capture image used at registration/login
     face_capture = models.ImageField(upload_to=face_upload_to, null=True, blank=True)
 
@@ -111,7 +170,32 @@ class Register(models.Model):
 # ==============================================
 #   3) Attendance Model
 # ==============================================
+class AttendanceQuerySet(models.QuerySet):
+    """
+    Keeps the old Active / Inactive / Late vocabulary working on top of
+    sessions: 'Late' is a flag on the session rather than a row of its own.
+    """
+
+    def with_status(self, status):
+        if status == 'Late':
+            return self.filter(is_late=True)
+        return self.filter(status=status)
+
+    def status_counts(self):
+        """{'Active': n, 'Inactive': n, 'Late': n} in a single aggregate."""
+        return self.aggregate(
+            Active=models.Count('pk', filter=models.Q(status='Active')),
+            Inactive=models.Count('pk', filter=models.Q(status='Inactive')),
+            Late=models.Count('pk', filter=models.Q(is_late=True)),
+        )
+
+
 class Attendance(models.Model):
+    """
+    One work session, from check-in to check-out. status is 'Active' while
+    the session is open and 'Inactive' once checked out; a late check-in sets
+    is_late / late_minutes on the same row.
+    """
     attendance_id = models.AutoField(primary_key=True)
     staff = models.ForeignKey(Staff, on_delete=models.CASCADE, related_name='attendances')
     date = models.DateField(default=timezone.localdate)
@@ -119,9 +203,18 @@ class Attendance(models.Model):
     check_out = models.TimeField(null=True, blank=True)
     overtime_hours = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     status = models.CharField(max_length=10, choices=ATTENDANCE_STATUS, default='Inactive')
+    is_late = models.BooleanField(default=False)
+    late_minutes = models.PositiveIntegerField(default=0)
+
+    objects = AttendanceQuerySet.as_manager()
 
     class Meta:
-        pass
+        indexes = [
+            # one staff member's days (staff dashboard / attendance page, check-out)
+            models.Index(fields=['staff', 'date', 'status']),
+            # today's counts per status (admin dashboards), covering the late flag
+            models.Index(fields=['date', 'status', 'is_late']),
+        ]
 
 
 # ==============================================
@@ -135,6 +228,9 @@ class GoogleMeet(models.Model):
     meet_description = models.TextField(blank=True, null=True)
     meet_link = models.CharField(max_length=500, blank=True, null=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['job_type', 'meet_time'])]
+
     def __str__(self):
         return f"{self.meet_title} - {self.job_type}"
 
@@ -184,6 +280,10 @@ class WorkSchedule(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # overlap check in has_conflict, per-staff schedule lists
+        indexes = [models.Index(fields=['staff', 'start_time', 'end_time'])]
+
     def duration_minutes(self):
         if self.start_time and self.end_time:
             delta = self.end_time - self.start_time
@@ -212,6 +312,12 @@ class Emotion(models.Model):
     emotion_type = models.CharField(max_length=20, choices=EMOTION_CHOICES)
     timestamp = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['staff', 'timestamp']),
+            models.Index(fields=['timestamp']),
+        ]
+
     def __str__(self):
         return f"{self.staff} - {self.emotion_type} @ {self.timestamp}"
 
@@ -227,6 +333,12 @@ class Productivity(models.Model):
     mouse_moves = models.IntegerField(default=0, help_text="Total mouse movements or clicks")
     productivity_score = models.DecimalField(default=0.0, max_digits=6, decimal_places=2, help_text="Calculated productivity score")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['staff', 'datetime']),
+            models.Index(fields=['datetime']),
+        ]
+
     def __str__(self):
         return f"Productivity {self.productivity_id} - Staff {self.staff.staff_id}"
 
@@ -257,4 +369,103 @@ class IssueReport(models.Model):
     reviewed = models.BooleanField(default=False)
 
     def __str__(self):
-        return f"Issue: {self.staff} @ {self.created_at}"
\ No newline at end of file
+        return f"Issue: {self.staff} @ {self.created_at}"
+
+# ==============================================
+#   9) EmotionJob Model (async emotion queue)
+# ==============================================
+class EmotionJob(models.Model):
+    """A captured frame waiting for `manage.py process_emotion_jobs` (EMOTION_ASYNC mode)."""
+    STATUS_PENDING = 'Pending'
+    STATUS_PROCESSING = 'Processing'
+    STATUS_FAILED = 'Failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job_id = models.AutoField(primary_key=True)
+    staff = models.ForeignKey(Staff, on_delete=models.CASCADE, related_name='emotion_jobs')
+    frame = models.BinaryField()  # encoded JPEG/PNG bytes as uploaded
+    captured_at = models.DateTimeField(default=timezone.now)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'captured_at'])]
+
+    def __str__(self):
+        return f"EmotionJob {self.job_id} - {self.staff_id} ({self.status})"
+
+
+class FaceTemplate(models.Model):
+    """
+    One face embedding of a registered user: the enrollment capture plus a few
+    recent successful logins (see face_templates.py). Register.face_embedding
+    keeps a copy of the enrollment template.
+    """
+    SOURCE_ENROLLMENT = 'Enrollment'
+    SOURCE_LOGIN = 'Login'
+    SOURCE_CHOICES = [
+        (SOURCE_ENROLLMENT, 'Enrollment'),
+        (SOURCE_LOGIN, 'Login'),
+    ]
+
+    template_id = models.AutoField(primary_key=True)
+    register = models.ForeignKey(Register, on_delete=models.CASCADE, related_name='face_templates')
+    embedding = models.BinaryField()  # packed vector, see utils_face.pack_embedding
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default=SOURCE_ENROLLMENT)
+    similarity = models.FloatField(null=True, blank=True)  # match score of the login that added it
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['register', 'source', 'created_at'])]
+
+    def __str__(self):
+        return f"FaceTemplate {self.template_id} - {self.register_id} ({self.source})"
+
+
+# ==============================================
+#   10) Daily summaries (see rollups.py)
+# ==============================================
+class DailyAttendanceSummary(models.Model):
+    """Attendance sessions per day and status; 'Late' counts the late ones of either status."""
+    day = models.DateField()
+    status = models.CharField(max_length=10, choices=ATTENDANCE_STATUS)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day', 'status'], name='unique_attendance_summary')]
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.count}"
+
+
+class DailyEmotionSummary(models.Model):
+    """Emotion records per day and emotion type."""
+    day = models.DateField()
+    emotion_type = models.CharField(max_length=20, choices=Emotion.EMOTION_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day', 'emotion_type'], name='unique_emotion_summary')]
+
+    def __str__(self):
+        return f"{self.day} {self.emotion_type}: {self.count}"
+
+
+class DailyProductivitySummary(models.Model):
+    """Productivity samples per day; the day's average score is score_total / samples."""
+    day = models.DateField(unique=True)
+    samples = models.PositiveIntegerField(default=0)
+    score_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    @property
+    def average_score(self):
+        return self.score_total / self.samples if self.samples else Decimal('0.00')
+
+    def __str__(self):
+        return f"{self.day}: {self.samples} samples"
@@ -0,0 +1,62 @@
+import logging
+import os
+import signal
+
+logger = logging.getLogger(__name__)
+
+
+# ================= PROCESS POOL =================
+def run_workers(target, workers, name='worker'):
+    """
+    Run `target()` in `workers` forked processes and replace any that crash,
+    until they all return or SIGTERM/SIGINT. Load models (and close DB connections) before
+    calling this so the children share weights copy-on-write and open their
+    own connections. workers <= 1 runs `target` in this process.
+    """
+    if workers <= 1:
+        target()
+        return
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 1
+            try:
+                target()
+                code = 0
+            finally:
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        # A clean exit means target() finished; anything else is a crash
+        if not stopping and status != 0:
+            logger.warning(f"{name.capitalize()} {pid} exited; restarting")
+            spawn()
@@ -0,0 +1,173 @@
+import logging
+import threading
+from collections import Counter
+from decimal import Decimal
+from datetime import datetime, timedelta
+from django.apps import apps as django_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+logger = logging.getLogger(__name__)
+
+# ================= DAILY SUMMARIES =================
+# DailyAttendanceSummary / DailyEmotionSummary / DailyProductivitySummary hold
+# per-day counts so the admin dashboard reads a handful of rows instead of
+# aggregating months of raw events. New rows are added to their day with an
+# F() increment inside the inserting transaction (signals.py, and
+# emotion_jobs for bulk_create). Updates and deletes recompute the affected
+# day once the transaction commits. Writes that bypass signals
+# (QuerySet.update(), raw SQL, imports) are fixed up with
+# `manage.py rebuild_daily_summaries`.
+
+# kind: (summary model, source model, source date/time field, summary key fields)
+SOURCES = {
+    'attendance': ('DailyAttendanceSummary', 'Attendance', 'date', ('day', 'status')),
+    'emotion': ('DailyEmotionSummary', 'Emotion', 'timestamp', ('day', 'emotion_type')),
+    'productivity': ('DailyProductivitySummary', 'Productivity', 'datetime', ('day',)),
+}
+
+# Days with a refresh queued on this thread (Django connections are per thread)
+_pending = threading.local()
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def day_range(start, end=None):
+    """
+    [start 00:00, the day after `end` 00:00): datetime bounds of the days
+    start..end (default: only start). Filtering the column itself rather
+    than __date keeps the (..., time) indexes usable.
+    """
+    end = end or start
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+
+def day_filter(field, start, end=None):
+    """Filter kwargs for rows whose datetime `field` falls on the days start..end (see day_range)."""
+    lower, upper = day_range(start, end)
+    return {f'{field}__gte': lower, f'{field}__lt': upper}
+
+
+def _bump(model, key, **deltas):
+    """Add `deltas` to the summary row for `key`, creating the row if needed."""
+    increments = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Created by a concurrent insert in the meantime
+        model.objects.filter(**key).update(**increments)
+
+
+# ---------- incremental ----------
+def add_attendance(attendance):
+    from .models import DailyAttendanceSummary
+    day = _day(attendance.date)
+    _bump(DailyAttendanceSummary, {'day': day, 'status': attendance.status}, count=1)
+    if attendance.is_late:
+        _bump(DailyAttendanceSummary, {'day': day, 'status': 'Late'}, count=1)
+
+
+def add_emotions(emotions):
+    from .models import DailyEmotionSummary
+    counts = Counter((_day(emotion.timestamp), emotion.emotion_type) for emotion in emotions)
+    for (day, emotion_type), count in sorted(counts.items()):
+        _bump(DailyEmotionSummary, {'day': day, 'emotion_type': emotion_type}, count=count)
+
+
+def add_productivity(records):
+    from .models import DailyProductivitySummary
+    totals = {}
+    for record in records:
+        samples, score = totals.get(_day(record.datetime), (0, Decimal('0')))
+        totals[_day(record.datetime)] = (samples + 1, score + Decimal(str(record.productivity_score or 0)))
+    for day, (samples, score) in sorted(totals.items()):
+        _bump(DailyProductivitySummary, {'day': day}, samples=samples, score_total=score)
+
+
+def refresh_day_on_commit(kind, day):
+    """Recompute one day of a summary after the current transaction commits (once per day)."""
+    key = (kind, _day(day))
+    # Every call queues a callback, and the first one to run for a key does
+    # the work. A rolled-back transaction drops its callbacks but leaves the
+    # key here, and the next commit that touches that day still rebuilds it.
+    pending = getattr(_pending, 'days', None)
+    if pending is None:
+        pending = _pending.days = set()
+    pending.add(key)
+
+    def run():
+        if key in pending:
+            pending.discard(key)
+            rebuild(key[1], key[1], kinds=[kind])
+
+    transaction.on_commit(run)
+
+
+# ---------- rebuild ----------
+def _aggregate(kind, start, end, apps):
+    """{key tuple: values} of one summary computed from the raw rows between start and end."""
+    _, source_name, field, _ = SOURCES[kind]
+    rows = apps.get_model('accounts', source_name).objects.all()
+    if kind == 'attendance':
+        if start:
+            rows = rows.filter(date__gte=start)
+        if end:
+            rows = rows.filter(date__lte=end)
+        # 'Late' counts late sessions, which are also counted under their status
+        counts = {
+            (row['date'], row['status']): {'count': row['count']}
+            for row in rows.values('date', 'status').annotate(count=Count('pk')).order_by()
+        }
+        counts.update(
+            ((row['date'], 'Late'), {'count': row['count']})
+            for row in rows.filter(is_late=True).values('date').annotate(count=Count('pk')).order_by()
+        )
+        return counts
+
+    # Datetime bounds (not __date) so the time indexes are used
+    if start:
+        rows = rows.filter(**{f'{field}__gte': day_range(start)[0]})
+    if end:
+        rows = rows.filter(**{f'{field}__lt': day_range(end)[1]})
+    rows = rows.annotate(day=TruncDate(field))
+    if kind == 'emotion':
+        return {
+            (row['day'], row['emotion_type']): {'count': row['count']}
+            for row in rows.values('day', 'emotion_type').annotate(count=Count('pk')).order_by()
+        }
+    return {
+        (row['day'],): {'samples': row['samples'], 'score_total': row['score_total'] or Decimal('0.00')}
+        for row in rows.values('day').annotate(samples=Count('pk'), score_total=Sum('productivity_score')).order_by()
+    }
+
+
+def rebuild(start=None, end=None, kinds=None, apps=django_apps):
+    """
+    Recompute the summaries for the days between `start` and `end` (inclusive;
+    None means unbounded) from the raw tables. Returns {kind: summary rows written}.
+    """
+    written = {}
+    for kind in kinds or SOURCES:
+        summary_name, _, _, key_fields = SOURCES[kind]
+        summary = apps.get_model('accounts', summary_name)
+        with transaction.atomic():
+            values = _aggregate(kind, start, end, apps)
+            stale = summary.objects.all()
+            if start:
+                stale = stale.filter(day__gte=start)
+            if end:
+                stale = stale.filter(day__lte=end)
+            stale.delete()
+            summary.objects.bulk_create(
+                [summary(**dict(zip(key_fields, key)), **fields) for key, fields in values.items()],
+                batch_size=1000,
+            )
+        written[kind] = len(values)
+    logger.debug(f"Rebuilt daily summaries {start or '...'} to {end or '...'}: {written}")
+    return written
@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from . import rollups
+from .models import Attendance, Emotion, FaceTemplate, Productivity
+from .face_index import face_index
+
+
+# ================= FACE INDEX SYNC =================
+# The index holds one row per FaceTemplate; deleting a Register cascades to
+# its templates, which removes the user from the index.
+@receiver(post_save, sender=FaceTemplate)
+@receiver(post_delete, sender=FaceTemplate)
+def refresh_face_index(sender, instance, **kwargs):
+    register_id = instance.register_id
+    transaction.on_commit(lambda: face_index.refresh(register_id))
+
+
+# ================= DAILY SUMMARIES =================
+# New rows are added to their day's summary in the same transaction; edits
+# and deletes recompute the day after commit (see rollups.py). Saves that only
+# touch other columns (e.g. overtime_hours) leave the summaries alone.
+SUMMARY_FIELDS = {
+    Attendance: ('attendance', 'date', {'date', 'status', 'is_late'}),
+    Emotion: ('emotion', 'timestamp', {'timestamp', 'emotion_type'}),
+    Productivity: ('productivity', 'datetime', {'datetime', 'productivity_score'}),
+}
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_save, sender=Emotion)
+@receiver(post_save, sender=Productivity)
+def update_daily_summary(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    kind, time_field, tracked = SUMMARY_FIELDS[sender]
+    if created:
+        if sender is Attendance:
+            rollups.add_attendance(instance)
+        elif sender is Emotion:
+            rollups.add_emotions([instance])
+        else:
+            rollups.add_productivity([instance])
+    elif update_fields is None or tracked & set(update_fields):
+        rollups.refresh_day_on_commit(kind, getattr(instance, time_field))
+
+
+@receiver(post_delete, sender=Attendance)
+@receiver(post_delete, sender=Emotion)
+@receiver(post_delete, sender=Productivity)
+def remove_from_daily_summary(sender, instance, **kwargs):
+    kind, time_field, _ = SUMMARY_FIELDS[sender]
+    rollups.refresh_day_on_commit(kind, getattr(instance, time_field))
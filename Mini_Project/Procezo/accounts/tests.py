@@ -1,3 +1,295 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import inference_limiter as limiter_module, inference_server, rollups
+from .inference_limiter import InferenceLimiter
+from .models import (
+    Attendance, DailyAttendanceSummary, DailyEmotionSummary, DailyProductivitySummary, Emotion, Feedback,
+    IssueReport, Productivity, Staff, StaffIdSequence,
+)
+
+
+@override_settings(ADMIN_REPORTS_PER_PAGE=10)
+class AdminEmotionManagementTests(TestCase):
+    url = reverse('accounts:admin_emotion_management')
+
+    def add_staff(self, count):
+        now = datetime.now().replace(microsecond=0)
+        for _ in range(count):
+            staff = Staff.objects.create(name=f"Staff {Staff.objects.count() + 1}")
+            Emotion.objects.create(staff=staff, emotion_type='Sad', timestamp=now - timedelta(minutes=30))
+            Emotion.objects.create(staff=staff, emotion_type='Happy', timestamp=now)
+            Emotion.objects.create(staff=staff, emotion_type='Angry', timestamp=now - timedelta(days=7))
+            Productivity.objects.create(staff=staff, datetime=now, productivity_score=50)
+            Feedback.objects.create(staff=staff, message="How are you?")
+            IssueReport.objects.create(staff=staff, current_problem="Slow laptop")
+
+    def count_queries(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_staff(self):
+        for params in ({}, {'status': 'Happy'}, {'staff_name': 'Staff'}):
+            with self.subTest(params=params):
+                Staff.objects.all().delete()
+                self.add_staff(3)
+                small, _ = self.count_queries(params)
+                self.add_staff(27)
+                large, _ = self.count_queries(params)
+                self.assertEqual(small, large)
+
+    def test_reports_show_latest_records_per_staff(self):
+        self.add_staff(12)
+        _, response = self.count_queries()
+
+        self.assertEqual(response.context['emotion_counts']['Happy'], 12)
+        self.assertEqual(response.context['responses_today'], 12)
+        self.assertEqual(response.context['positive_change'], 100)
+
+        reports = response.context['reports']
+        self.assertEqual(len(reports), 10)
+        self.assertEqual(response.context['page_obj'].paginator.count, 12)
+        for report in reports:
+            self.assertEqual(report['emotion'].emotion_type, 'Happy')
+            self.assertEqual(report['emotion'].staff_id, report['staff'].staff_id)
+            self.assertIsNotNone(report['productivity'])
+            self.assertIsNotNone(report['feedback'])
+            self.assertIsNotNone(report['issue'])
+
+        _, response = self.count_queries({'page': 2})
+        self.assertEqual(len(response.context['reports']), 2)
+
+    def test_status_filter_keeps_staff_with_that_emotion(self):
+        self.add_staff(2)
+        Staff.objects.create(name="No emotions")
+
+        _, response = self.count_queries({'status': 'Angry'})
+        reports = response.context['reports']
+        self.assertEqual(len(reports), 2)
+        self.assertTrue(all(report['emotion'].emotion_type == 'Angry' for report in reports))
+
+
+class StaffIdSequenceTests(TestCase):
+    def test_ids_keep_counting_past_s999(self):
+        StaffIdSequence.objects.all().delete()
+        Staff.objects.create(staff_id='S998', name="Earlier")
+        Staff.objects.create(staff_id='S999', name="Last three-digit")
+
+        self.assertEqual(Staff.objects.create(name="Next").staff_id, 'S1000')
+        self.assertEqual(Staff.objects.create(name="After").staff_id, 'S1001')
+        self.assertEqual(
+            list(Staff.objects.order_by_staff_id().values_list('staff_id', flat=True)),
+            ['S998', 'S999', 'S1000', 'S1001'],
+        )
+
+    def test_reserved_block_is_not_handed_out_again(self):
+        first = Staff.objects.create(name="First").staff_id
+        block = StaffIdSequence.reserve(3)
+        Staff.objects.bulk_create([Staff(staff_id=staff_id, name=staff_id) for staff_id in block])
+
+        after = Staff.objects.create(name="After").staff_id
+        numbers = [int(staff_id[1:]) for staff_id in [first, *block, after]]
+        self.assertEqual(numbers, list(range(numbers[0], numbers[0] + 5)))
+
+
+class DailySummaryTests(TestCase):
+    day = date(2026, 10, 1)
+
+    def setUp(self):
+        self.staff = Staff.objects.create(name="Summary")
+
+    def attendance(self):
+        return dict(DailyAttendanceSummary.objects.filter(day=self.day).values_list('status', 'count'))
+
+    def emotions(self):
+        return dict(DailyEmotionSummary.objects.filter(day=self.day).values_list('emotion_type', 'count'))
+
+    def add_attendance(self, status, is_late=False):
+        return Attendance.objects.create(staff=self.staff, date=self.day, check_in=time(9, 30), status=status,
+                                         is_late=is_late, late_minutes=30 if is_late else 0)
+
+    def assert_matches_rebuild(self):
+        incremental = (self.attendance(), self.emotions(), list(DailyProductivitySummary.objects.values_list('day', 'samples', 'score_total')))
+        rollups.rebuild(self.day, self.day)
+        rebuilt = (self.attendance(), self.emotions(), list(DailyProductivitySummary.objects.values_list('day', 'samples', 'score_total')))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_new_rows_are_added_to_their_day(self):
+        self.add_attendance('Active')
+        self.add_attendance('Inactive')
+        noon = datetime.combine(self.day, time(12, 0))
+        for emotion_type in ('Happy', 'Happy', 'Sad'):
+            Emotion.objects.create(staff=self.staff, emotion_type=emotion_type, timestamp=noon)
+        Productivity.objects.create(staff=self.staff, datetime=noon, productivity_score=Decimal('50.00'))
+        Productivity.objects.create(staff=self.staff, datetime=noon, productivity_score=Decimal('70.50'))
+
+        self.assertEqual(self.attendance(), {'Active': 1, 'Inactive': 1})
+        self.assertEqual(self.emotions(), {'Happy': 2, 'Sad': 1})
+        summary = DailyProductivitySummary.objects.get(day=self.day)
+        self.assertEqual((summary.samples, summary.score_total), (2, Decimal('120.50')))
+        self.assertEqual(summary.average_score, Decimal('60.25'))
+        self.assert_matches_rebuild()
+
+    def test_late_session_counts_under_its_status_and_late(self):
+        self.add_attendance('Active', is_late=True)
+        self.add_attendance('Inactive', is_late=True)
+        self.add_attendance('Inactive')
+
+        self.assertEqual(self.attendance(), {'Active': 1, 'Inactive': 2, 'Late': 2})
+        self.assertEqual(self.attendance(), Attendance.objects.filter(date=self.day).status_counts())
+        self.assert_matches_rebuild()
+
+    def test_edits_and_deletes_recompute_the_day(self):
+        session = self.add_attendance('Active', is_late=True)
+        emotion = Emotion.objects.create(staff=self.staff, emotion_type='Happy',
+                                         timestamp=datetime.combine(self.day, time(12, 0)))
+
+        with mock.patch.object(rollups, 'rebuild', wraps=rollups.rebuild) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                session.status = 'Inactive'
+                session.save()
+                session.check_out = time(18, 0)
+                session.save()
+                emotion.delete()
+        # One refresh per summary and day, however many rows changed
+        self.assertEqual(rebuild.call_count, 2)
+        self.assertEqual(self.attendance(), {'Inactive': 1, 'Late': 1})
+        self.assertEqual(self.emotions(), {})
+
+    def test_tracked_field_updates_recompute_the_day(self):
+        session = self.add_attendance('Inactive', is_late=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            session.is_late = False
+            session.save(update_fields=['is_late'])
+        self.assertEqual(self.attendance(), {'Inactive': 1})
+
+    def test_untracked_field_updates_leave_summaries_alone(self):
+        session = self.add_attendance('Active')
+        with self.captureOnCommitCallbacks() as callbacks:
+            session.overtime_hours = Decimal('1.50')
+            session.save(update_fields=['overtime_hours'])
+        self.assertEqual(callbacks, [])
+
+    def test_rolled_back_refresh_is_queued_again(self):
+        session = self.add_attendance('Active')
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    session.status = 'Inactive'
+                    session.save()
+                    raise RuntimeError("rolled back")
+            except RuntimeError:
+                pass
+            self.assertEqual(callbacks, [])
+
+            session.refresh_from_db()
+            session.status = 'Inactive'
+            session.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.attendance(), {'Inactive': 1})
+
+
+class AttendanceSessionTests(TestCase):
+    day = date(2026, 10, 1)
+
+    def setUp(self):
+        self.early = Staff.objects.create(name="Early", check_in=time(9, 0))
+        self.late = Staff.objects.create(name="Late", check_in=time(9, 0))
+
+    def add(self, staff, status, check_in, check_out=None, overtime=Decimal('0.00'), day=None):
+        return Attendance.objects.create(staff=staff, date=day or self.day, check_in=check_in, check_out=check_out,
+                                         status=status, overtime_hours=overtime)
+
+    def test_with_status_and_status_counts(self):
+        Attendance.objects.create(staff=self.early, date=self.day, check_in=time(9, 0), status='Active')
+        Attendance.objects.create(staff=self.late, date=self.day, check_in=time(9, 40), status='Inactive',
+                                  is_late=True, late_minutes=40)
+        Attendance.objects.create(staff=self.late, date=self.day, check_in=time(19, 0), status='Active',
+                                  is_late=True, late_minutes=600)
+
+        today = Attendance.objects.filter(date=self.day)
+        self.assertEqual(today.with_status('Active').count(), 2)
+        self.assertEqual(today.with_status('Inactive').count(), 1)
+        self.assertEqual(set(today.with_status('Late').values_list('staff_id', flat=True)), {self.late.staff_id})
+        self.assertEqual(today.status_counts(), {'Active': 2, 'Inactive': 1, 'Late': 2})
+        self.assertEqual(Attendance.objects.filter(date=self.day + timedelta(days=1)).status_counts(),
+                         {'Active': 0, 'Inactive': 0, 'Late': 0})
+
+    def test_migration_folds_legacy_rows_into_sessions(self):
+        migration = import_module('accounts.migrations.0023_attendance_sessions')
+        # Old layout: a Late row and an Active row at check-in, an Inactive row at check-out
+        self.add(self.late, 'Late', time(9, 30))
+        self.add(self.late, 'Active', time(9, 30), check_out=time(18, 0))
+        self.add(self.late, 'Inactive', time(9, 30), check_out=time(18, 0), overtime=Decimal('1.00'))
+        self.add(self.late, 'Active', time(19, 0))
+        self.add(self.early, 'Active', time(9, 0), check_out=time(17, 0))
+        self.add(self.early, 'Inactive', time(9, 0), check_out=time(17, 0), overtime=None)
+        self.add(self.early, 'Late', time(10, 0), day=self.day + timedelta(days=1))
+        self.add(self.early, 'Active', time(10, 0), day=self.day + timedelta(days=1))
+
+        migration.fold_sessions(apps, None)
+        migration.rebuild_attendance_summary(apps, None)
+
+        sessions = Attendance.objects.order_by('staff_id', 'date', 'check_in').values_list(
+            'staff_id', 'date', 'check_in', 'check_out', 'status', 'is_late', 'late_minutes', 'overtime_hours')
+        self.assertEqual(list(sessions), [
+            (self.early.staff_id, self.day, time(9, 0), time(17, 0), 'Inactive', False, 0, Decimal('0.00')),
+            (self.early.staff_id, self.day + timedelta(days=1), time(10, 0), None, 'Active', True, 60, Decimal('0.00')),
+            (self.late.staff_id, self.day, time(9, 30), time(18, 0), 'Inactive', True, 30, Decimal('1.00')),
+            (self.late.staff_id, self.day, time(19, 0), None, 'Active', False, 0, Decimal('0.00')),
+        ])
+        self.assertEqual(
+            dict(DailyAttendanceSummary.objects.filter(day=self.day).values_list('status', 'count')),
+            {'Active': 1, 'Inactive': 2, 'Late': 1},
+        )
+
+
+class SidecarBusyTests(TestCase):
+    """A busy inference sidecar must look like a busy local limiter: 503 + Retry-After."""
+
+    def setUp(self):
+        self.socket_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.socket_dir.name, 'inference.sock')
+        self.listener = inference_server.open_listener(path)
+        threading.Thread(target=self.serve, daemon=True).start()
+        self.settings = override_settings(INFERENCE_SOCKET_PATH=path)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.listener.close()
+        self.socket_dir.cleanup()
+
+    def serve(self):
+        try:
+            inference_server.serve_forever(self.listener)
+        except OSError:
+            pass  # listener closed by tearDown
+
+    def test_check_face_returns_503_when_sidecar_is_saturated(self):
+        # No free slot and no room to wait: the sidecar rejects at admission, before any model runs
+        saturated = InferenceLimiter(max_concurrent=1, queue_timeout=3, max_waiting=0)
+        with open(os.path.join(settings.BASE_DIR, 'static', 'image', 'Picture4.jpg'), 'rb') as f:
+            image = f.read()
+
+        with mock.patch.object(limiter_module, 'inference_limiter', saturated), saturated.slot():
+            response = self.client.post(reverse('accounts:api_check_face'), image, content_type='image/jpeg')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(saturated.stats()['rejected_queue_full'], 1)
@@ -16,6 +16,11 @@ urlpatterns = [
     path('api_login_with_password/', views.api_login_with_password, name='api_login_with_password'),
 
     path('api/face_logout/', views.api_face_logout, name='api_face_logout'),
+    path('api/face-config/', views.api_face_config, name='api_face_config'),
+    path('api/ready/', views.api_ready, name='api_ready'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('api/inference-stats/', views.api_inference_stats, name='api_inference_stats'),
+    path('api/emotion-queue/', views.api_emotion_queue, name='api_emotion_queue'),
 
     # ..............................................................
     # -------------------- Admin Dashboard URLs --------------------
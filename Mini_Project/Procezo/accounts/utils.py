@@ -1,118 +1,158 @@
-import cv2
 import numpy as np
-import base64
-import io
-import torch
 import logging
-from PIL import Image
-from fer.fer import FER
-from facenet_pytorch import MTCNN, InceptionResnetV1
+from . import inference_client
+from .model_registry import get_emotion_detector, get_mtcnn
+from .face_templates import template_matrix, best_similarity
+from .inference_limiter import InferenceBusy, inference_slot
+from .metrics import stage_timer
+from .utils_face import analyze_face, decode_data_url, DecodedFrame
 
 logger = logging.getLogger(__name__)
 
-# Device setup (use GPU if available)
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-
-# Declare models globally
-_mtcnn = None
-_resnet = None
-_emotion_detector = None
-
-def get_mtcnn():
-    global _mtcnn
-    if _mtcnn is None:
-        _mtcnn = MTCNN(keep_all=False, device=device)
-    return _mtcnn
-
-def get_resnet():
-    global _resnet
-    if _resnet is None:
-        _resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
-    return _resnet
-
-def get_emotion_detector():
-    global _emotion_detector
-    if _emotion_detector is None:
-        try:
-            _emotion_detector = FER(mtcnn=True)
-        except Exception as e:
-            logger.error(f"FER init error: {e}")
-    return _emotion_detector
-
 # ================= FACE VERIFICATION =================
 
-def verify_face_with_embedding(base64_image_data, saved_embedding_list):
+# Cosine similarity at or above which two embeddings are the same person
+FACE_MATCH_THRESHOLD = 0.60
+
+def verify_face_with_embedding(image, saved_embedding):
     """
     Checks whether the logged-in staff’s embedding matches the current photo.
+    `image` is a DecodedFrame (or a base64 data URL); `saved_embedding` is the
+    packed Register.face_embedding blob or the user's face templates
+    (face_templates.templates_for), matched on the best template.
+    """
+    matched, _ = verify_face(image, saved_embedding)
+    return matched
+
+def verify_face(image, saved_embedding):
+    """
+    Like verify_face_with_embedding, but also returns the FaceAnalysis so the
+    caller can reuse the detected face box (e.g. for emotion detection).
+    Returns (matched, analysis); analysis is None if nothing could be analysed.
     """
     try:
-        if "," in base64_image_data:
-            base64_image_data = base64_image_data.split(",", 1)[1]
-        
-        # Base64 to PIL Image
-        img_bytes = base64.b64decode(base64_image_data)
-        pil_img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
-
-        mtcnn = get_mtcnn()
-        resnet = get_resnet()
-
-        # Detect the face
-        face_tensor = mtcnn(pil_img)
-        if face_tensor is None:
-            return False
-
-        # Generate the embedding
-        face_tensor = face_tensor.unsqueeze(0).to(device)
-        with torch.no_grad():
-            emb = resnet(face_tensor)
-
-        # Normalize current embedding
-        current_emb = emb.cpu().numpy().flatten()
-        current_emb = current_emb / np.linalg.norm(current_emb)
-
-        # Normalize saved embedding from DB
-        saved_emb = np.array(saved_embedding_list)
-        saved_emb = saved_emb / np.linalg.norm(saved_emb)
-
-        # Cosine Similarity (If similarity > 0.60, it is the same person)
-        similarity = float(np.dot(current_emb, saved_emb))
+        templates = template_matrix(saved_embedding)
+        if templates is None:
+            return False, None
+
+        frame = image if isinstance(image, DecodedFrame) else decode_data_url(image)
+        if frame is None:
+            return False, None
+
+        # Blurry/dark frames never reach the neural models
+        if not frame.quality.ok:
+            logger.info(f"Verification skipped, frame rejected: {frame.quality.reason}")
+            return False, None
+
+        # Detect + embed the face in a single MTCNN pass
+        analysis = analyze_face(frame.image)
+        current_emb = analysis.embedding
+        if current_emb is None:
+            return False, analysis
+
+        # Best cosine similarity over all templates (If similarity > 0.60, it is the same person)
+        similarity = best_similarity(current_emb, templates)
         logger.info(f"Verification Similarity: {similarity:.4f}")
 
-        return similarity >= 0.60
+        return similarity >= FACE_MATCH_THRESHOLD, analysis
 
+    except InferenceBusy:
+        raise
     except Exception as e:
         logger.error(f"Verification failed: {e}")
-        return False
+        return False, None
 
 # ================= EMOTION DETECTION =================
 
+EMOTION_LABELS = {
+    'happy': 'Happy',
+    'neutral': 'Neutral',
+    'sad': 'Sad',
+    'angry': 'Angry',
+    'fear': 'Sad',
+    'disgust': 'Angry',
+    'surprise': 'Focused'
+}
+
 def detect_emotion_from_base64_image(base64_image_data):
+    frame = decode_data_url(base64_image_data)
+    if frame is None:
+        return None
+    return detect_emotion(frame)
+
+def face_region(frame, box):
+    """
+    Cut the area FER classifies around an MTCNN (x1, y1, x2, y2) box out of a
+    DecodedFrame. Returns (bgr_crop, (x, y, w, h)) with the rectangle relative
+    to the crop, or (None, None) for an empty box. FER squares the box and adds
+    small offsets, so half the box size on every side is enough context.
+    """
+    width, height = frame.image.size
+    x1, y1, x2, y2 = (int(round(float(v))) for v in box)
+    x1, y1, x2, y2 = max(0, x1), max(0, y1), min(width, x2), min(height, y2)
+    if x2 <= x1 or y2 <= y1:
+        return None, None
+
+    margin = max(x2 - x1, y2 - y1) // 2 + 16
+    cx1, cy1 = max(0, x1 - margin), max(0, y1 - margin)
+    cx2, cy2 = min(width, x2 + margin), min(height, y2 + margin)
+    # Crop before converting so only the face region is copied to BGR
+    crop = np.ascontiguousarray(np.asarray(frame.image.crop((cx1, cy1, cx2, cy2)))[:, :, ::-1])
+    return crop, (x1 - cx1, y1 - cy1, x2 - x1, y2 - y1)
+
+def detect_emotion(frame, box=None):
+    """
+    Emotion label for an already decoded frame (shared with face verification).
+    With `box` (the face found during verification) FER only classifies that
+    face instead of running its own detector over the whole frame.
+    """
+    face_rect = None
+    if box is not None:
+        image, face_rect = face_region(frame, box)
+    if face_rect is None:
+        image = frame.bgr
+
+    # Prefer the inference sidecar when configured
+    if inference_client.is_enabled():
+        try:
+            return inference_client.detect_emotion(image, face_rect)
+        except inference_client.InferenceUnavailable:
+            pass
+        except inference_client.InferenceError:
+            return None
+    return detect_emotion_from_frame(image, face_rect)
+
+def largest_face_rect(frame):
+    """(x, y, w, h) of the largest face the shared MTCNN finds in a BGR frame, or None."""
+    boxes, _ = get_mtcnn().detect(np.ascontiguousarray(frame[:, :, ::-1]))
+    if boxes is None or len(boxes) == 0:
+        return None
+    x1, y1, x2, y2 = max(boxes, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]))
+    x1, y1 = max(0, int(x1)), max(0, int(y1))
+    return (x1, y1, int(x2) - x1, int(y2) - y1)
+
+def detect_emotion_from_frame(frame, face_rect=None):
+    """
+    Run FER on a decoded BGR frame and map its label to our Emotion choices.
+    FER has no detector of its own: without `face_rect` (x, y, w, h) the face
+    is found with the shared MTCNN first.
+    """
     detector = get_emotion_detector()
     if not detector: return 'Neutral'
-        
+
     try:
-        if "," in base64_image_data:
-            base64_image_data = base64_image_data.split(",", 1)[1]
-            
-        img_bytes = base64.b64decode(base64_image_data)
-        np_arr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-        results = detector.detect_emotions(frame)
+        with inference_slot(), stage_timer('emotion'):
+            if face_rect is None:
+                face_rect = largest_face_rect(frame)
+            if face_rect is None:
+                return 'Neutral'
+            results = detector.detect_emotions(frame, face_rectangles=[face_rect])
         if results:
             emotions = results[0].get('emotions', {})
             top_emotion_raw = max(emotions.items(), key=lambda x: x[1])[0]
-            
-            mapping = {
-                'happy': 'Happy', 
-                'neutral': 'Neutral', 
-                'sad': 'Sad',
-                'angry': 'Angry', 
-                'fear': 'Sad', 
-                'disgust': 'Angry', 
-                'surprise': 'Focused'
-            }
-            return mapping.get(top_emotion_raw, 'Neutral')
+            return EMOTION_LABELS.get(top_emotion_raw, 'Neutral')
         return 'Neutral'
+    except InferenceBusy:
+        raise
     except:
-        return None
\ No newline at end of file
+        return None
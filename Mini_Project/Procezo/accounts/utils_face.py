@@ -1,45 +1,218 @@
 import base64
+import binascii
 import io
 import json
+import struct
 import numpy as np
 from PIL import Image
+from django.conf import settings
 from django.core.files.base import ContentFile
 
-# facenet imports
-from facenet_pytorch import MTCNN, InceptionResnetV1
-import torch
+from . import inference_client
+from .model_registry import get_mtcnn, get_resnet, get_device, extract_faces
+from .inference_batcher import EmbeddingBatcher
+from .inference_limiter import inference_slot
+from .metrics import stage_timer, timed
 
-# initialize once (CPU if no GPU available)
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-_mtcnn = None
-_resnet = None
+# ================= EMBEDDING STORAGE =================
+# Register.face_embedding holds a packed binary vector instead of a JSON list:
+#   8-byte header (magic, format version, model tag, dtype code, dimension)
+#   followed by the raw little-endian float16/float32 values.
+EMBEDDING_MAGIC = b'FE'
+EMBEDDING_FORMAT_VERSION = 1
+EMBEDDING_MODEL_VGGFACE2 = 1
 
+_EMBEDDING_HEADER = struct.Struct('<2sBBBxH')
+_EMBEDDING_DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f2')}
+_EMBEDDING_DTYPE_CODES = {'float32': 1, 'float16': 2}
 
-def get_mtcnn():
-    global _mtcnn
-    if _mtcnn is None:
-        _mtcnn = MTCNN(keep_all=True, device=device)
-    return _mtcnn
 
+def pack_embedding(emb, dtype=None, model=EMBEDDING_MODEL_VGGFACE2):
+    """Serialize an embedding (list or array) into the compact binary format."""
+    if emb is None:
+        return None
+    dtype_name = dtype or getattr(settings, 'FACE_EMBEDDING_DTYPE', 'float16')
+    code = _EMBEDDING_DTYPE_CODES[dtype_name]
+    vec = np.asarray(emb, dtype=_EMBEDDING_DTYPES[code]).ravel()
+    header = _EMBEDDING_HEADER.pack(EMBEDDING_MAGIC, EMBEDDING_FORMAT_VERSION, model, code, vec.size)
+    return header + vec.tobytes()
 
-def get_resnet():
-    global _resnet
-    if _resnet is None:
-        _resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
-    return _resnet
 
+def unpack_embedding(blob):
+    """
+    Return the stored embedding as a read-only NumPy view over the blob
+    (no copy), or None if the value is empty or not in the binary format.
+    """
+    if not blob or len(blob) < _EMBEDDING_HEADER.size:
+        return None
+    magic, version, model, code, dim = _EMBEDDING_HEADER.unpack_from(blob)
+    if magic != EMBEDDING_MAGIC or version != EMBEDDING_FORMAT_VERSION or code not in _EMBEDDING_DTYPES:
+        return None
+    dtype = _EMBEDDING_DTYPES[code]
+    if len(blob) != _EMBEDDING_HEADER.size + dim * dtype.itemsize:
+        return None
+    return np.frombuffer(blob, dtype=dtype, count=dim, offset=_EMBEDDING_HEADER.size)
 
-# ================= BASE64 <-> PIL =================
-def pil_from_base64(b64str):
+
+# ================= FRAME DECODING =================
+class DecodedFrame:
+    """
+    A webcam frame decoded once and shared by the face and emotion pipelines.
+    `image` is an RGB PIL image (used by MTCNN); `bgr` is the same pixels as a
+    contiguous uint8 array for OpenCV/FER, built on first access.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self._bgr = None
+        self._quality = None
+
+    @property
+    def bgr(self):
+        if self._bgr is None:
+            self._bgr = np.ascontiguousarray(np.asarray(self.image)[:, :, ::-1])
+        return self._bgr
+
+    @property
+    def quality(self):
+        """Cheap blur/exposure pre-check (frame_quality.FrameQuality), computed once."""
+        if self._quality is None:
+            from .frame_quality import assess_frame
+            self._quality = assess_frame(self.image)
+        return self._quality
+
+
+@timed('decode')
+def decode_image_bytes(data, max_edge=None):
+    """
+    Decode JPEG/PNG bytes into a DecodedFrame no larger than `max_edge` pixels
+    on its longest side. For JPEGs the downscale happens inside the decoder
+    (draft mode, 1/2-1/8 DCT scaling), so large frames are never fully decoded.
+    """
+    if not data:
+        return None
+    if max_edge is None:
+        max_edge = getattr(settings, 'FACE_DECODE_MAX_EDGE', 640)
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        target = None
+        if max_edge and max(img.size) > max_edge:
+            scale = max_edge / max(img.size)
+            target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            if img.format == 'JPEG':
+                # decoder picks the largest 1/2^n scale still >= target
+                img.draft('RGB', target)
+        img = img.convert('RGB') if img.mode != 'RGB' else img
+        img.load()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    if target and img.size != target:
+        import cv2
+        # After draft mode at most a 2x step is left, where bilinear is enough
+        # (and much cheaper than PIL's filtered resize); INTER_AREA for the rest
+        interpolation = cv2.INTER_LINEAR if img.width <= 2 * target[0] else cv2.INTER_AREA
+        img = Image.fromarray(cv2.resize(np.asarray(img), target, interpolation=interpolation))
+    return DecodedFrame(img)
+
+
+def decode_base64_payload(b64str):
+    """Base64 (optionally a data URL) to bytes without splitting/copying the string first."""
+    data = b64str.encode('ascii') if isinstance(b64str, str) else b64str
+    comma = data.find(b',', 0, 100)
+    return binascii.a2b_base64(memoryview(data)[comma + 1:])
+
+
+def decode_data_url(b64str, max_edge=None):
     if not b64str:
         return None
-    if "," in b64str:
-        b64str = b64str.split(",", 1)[1]
-    b = base64.b64decode(b64str)
-    buf = io.BytesIO(b)
-    img = Image.open(buf).convert('RGB')
-    return img
+    try:
+        data = decode_base64_payload(b64str)
+    except (binascii.Error, UnicodeEncodeError, ValueError):
+        return None
+    return decode_image_bytes(data, max_edge)
+
+
+# ================= FRAME UPLOADS =================
+# Face endpoints take the frame as either
+#   - a raw image body (Content-Type: image/jpeg, other fields in the query string),
+#   - multipart/form-data with the frame as a file field, or
+#   - the original JSON / form body with a base64 data URL.
+FRAME_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+
+
+class FrameUploadError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def frame_upload_limits():
+    """What clients should downscale/compress to before uploading a frame."""
+    return {
+        'max_edge': getattr(settings, 'FACE_DECODE_MAX_EDGE', 640),
+        'max_bytes': getattr(settings, 'FACE_UPLOAD_MAX_BYTES', 1536 * 1024),
+        'content_types': list(FRAME_CONTENT_TYPES),
+    }
+
+
+@timed('upload')
+def read_frame_upload(request, field='image'):
+    """
+    Return (fields, image_bytes) for any of the supported upload formats.
+    image_bytes is None when no frame was sent; raises FrameUploadError for
+    unsupported, oversized or undecodable uploads.
+    """
+    max_bytes = frame_upload_limits()['max_bytes']
+    content_type = request.content_type or ''
+
+    if content_type.startswith('image/'):
+        if content_type not in FRAME_CONTENT_TYPES:
+            raise FrameUploadError(f"Unsupported image type: {content_type}", status=415)
+        if int(request.META.get('CONTENT_LENGTH') or 0) > max_bytes:
+            raise FrameUploadError("Frame too large", status=413)
+        return request.GET, request.body or None
+
+    if content_type == 'multipart/form-data':
+        fields = request.POST
+        upload = request.FILES.get(field)
+        if upload is not None:
+            if upload.size > max_bytes:
+                raise FrameUploadError("Frame too large", status=413)
+            return fields, upload.read()
+        image = fields.get(field)
+    elif content_type == 'application/x-www-form-urlencoded':
+        fields = request.POST
+        image = fields.get(field)
+    else:
+        try:
+            fields = json.loads(request.body or b'{}')
+        except ValueError:
+            raise FrameUploadError("Invalid JSON")
+        if not isinstance(fields, dict):
+            raise FrameUploadError("Invalid JSON")
+        image = fields.get(field)
+
+    if not image:
+        return fields, None
+    # base64 inflates by 4/3, so compare against the encoded length
+    if len(image) > max_bytes * 4 // 3 + 100:
+        raise FrameUploadError("Frame too large", status=413)
+    try:
+        data = decode_base64_payload(image)
+    except (binascii.Error, UnicodeEncodeError, ValueError):
+        data = None
+    if not data:
+        raise FrameUploadError("Invalid image")
+    return fields, data
+
+
+# ================= BASE64 <-> PIL =================
+def pil_from_base64(b64str):
+    frame = decode_data_url(b64str)
+    return None if frame is None else frame.image
 
 
 def save_base64_to_contentfile(b64str, filename):
@@ -50,53 +223,152 @@ def save_base64_to_contentfile(b64str, filename):
 
 
 # ================= FACE UTILS =================
-def count_faces(pil_img):
-    mtcnn = get_mtcnn()
-    boxes, probs = mtcnn.detect(pil_img)
-    if boxes is None:
-        return 0
-    return len(boxes)
+class FaceAnalysis:
+    """
+    Everything the face endpoints need from one MTCNN pass:
+    boxes/probs for all detected faces, plus the aligned crop and
+    unit-length embedding of the largest face.
+    """
 
+    def __init__(self, boxes=None, probs=None, face_tensor=None, embedding=None):
+        self.boxes = boxes
+        self.probs = probs
+        self.face_tensor = face_tensor
+        self.embedding = embedding
 
-def get_embedding_from_pil(pil_img):
-    mtcnn = get_mtcnn()
-    resnet = get_resnet()
+    @property
+    def face_count(self):
+        return 0 if self.boxes is None else len(self.boxes)
 
-    boxes, probs = mtcnn.detect(pil_img)
-    if boxes is None:
-        return None
+    @property
+    def primary_box(self):
+        """(x1, y1, x2, y2) of the largest face, the one that was embedded."""
+        if not self.face_count:
+            return None
+        boxes = np.asarray(self.boxes)
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        return boxes[int(np.argmax(areas))]
 
-    areas = [(b[2] - b[0]) * (b[3] - b[1]) for b in boxes]
-    idx = int(np.argmax(areas))
 
-    try:
-        faces = mtcnn.extract(pil_img, boxes, save_path=None)
-        face_tensor = faces[idx].unsqueeze(0).to(device)
-    except:
-        face_tensor = mtcnn(pil_img)
-        if face_tensor is None:
-            return None
-        if isinstance(face_tensor, list):
-            face_tensor = face_tensor[0].unsqueeze(0).to(device)
-        else:
-            face_tensor = face_tensor.unsqueeze(0).to(device)
+@timed('embed_forward')
+def embed_faces(face_tensors):
+    """Run InceptionResnetV1 once over a list of aligned (3, H, W) crops; returns unit float32 vectors (None if degenerate)."""
+    import torch
 
+    batch = torch.stack(list(face_tensors)).to(get_device())
     with torch.no_grad():
-        emb = resnet(face_tensor)
+        embs = get_resnet()(batch).cpu().numpy()
 
-    emb = emb.cpu().numpy().flatten()
-    norm = np.linalg.norm(emb)
-    if norm == 0:
-        return None
+    results = []
+    for emb in embs:
+        norm = np.linalg.norm(emb)
+        results.append(None if norm == 0 else emb / norm)
+    return results
+
+
+def embed_faces_in_slot(face_tensors):
+    """embed_faces() inside an inference slot, taken by whichever thread runs the forward pass."""
+    with inference_slot():
+        return embed_faces(face_tensors)
+
+
+# Concurrent requests share forward passes through this batcher. Request
+# threads wait for it without holding an inference slot; the batcher thread
+# takes one per batch, so a batch can hold more crops than there are slots.
+embedding_batcher = EmbeddingBatcher(
+    embed_faces_in_slot,
+    max_batch_size=getattr(settings, 'FACE_BATCH_MAX_SIZE', 8),
+    max_wait_ms=getattr(settings, 'FACE_BATCH_MAX_WAIT_MS', 5),
+)
+
+
+@timed('embed')
+def embed_face(face_tensor):
+    """
+    Embed one aligned (3, H, W) crop, micro-batched with other requests when
+    enabled. Call it without holding an inference slot.
+    """
+    if embedding_batcher.max_batch_size > 1:
+        return embedding_batcher.submit(face_tensor)
+    return embed_faces_in_slot([face_tensor])[0]
+
+
+def analyze_face(pil_img, embed=True, require_single=False):
+    """
+    Detect faces once and reuse the result for counting, cropping and embedding.
+    embed=False stops after detection; require_single=True skips the embedding
+    when the image does not contain exactly one face.
+
+    Runs in the inference sidecar when INFERENCE_SOCKET_PATH is set (the
+    aligned crop then stays in the sidecar), otherwise in this process.
+    Either way a saturated limiter raises InferenceBusy.
+    """
+    if inference_client.is_enabled():
+        try:
+            boxes, probs, embedding = inference_client.analyze(pil_img, embed, require_single)
+            return FaceAnalysis(boxes, probs, embedding=embedding)
+        except inference_client.InferenceUnavailable:
+            pass
+    return analyze_face_local(pil_img, embed, require_single)
 
-    return (emb / norm).tolist()
+
+def analyze_face_local(pil_img, embed=True, require_single=False):
+    # Admission control: raises InferenceBusy when every slot stays busy.
+    # The slot covers detection and alignment; the embedding takes its own (see embed_face)
+    with inference_slot():
+        with stage_timer('detect'):
+            boxes, probs = get_mtcnn().detect(pil_img)
+        result = FaceAnalysis(boxes, probs)
+
+        if boxes is None or not embed:
+            return result
+        if require_single and result.face_count != 1:
+            return result
+
+        with stage_timer('align'):
+            result.face_tensor = extract_faces(pil_img, boxes)
+
+    result.embedding = embed_face(result.face_tensor)
+    return result
+
+
+def analyze_faces_local(pil_imgs):
+    """
+    analyze_face_local for a batch of images (background jobs): one MTCNN
+    pass per image, then a single embedding forward pass for all faces.
+    """
+    results = []
+    with inference_slot():
+        for img in pil_imgs:
+            with stage_timer('detect'):
+                boxes, probs = get_mtcnn().detect(img)
+            result = FaceAnalysis(boxes, probs)
+            if boxes is not None:
+                with stage_timer('align'):
+                    result.face_tensor = extract_faces(img, boxes)
+            results.append(result)
+
+        with_faces = [r for r in results if r.face_tensor is not None]
+        if with_faces:
+            for result, emb in zip(with_faces, embed_faces([r.face_tensor for r in with_faces])):
+                result.embedding = emb
+    return results
+
+
+def count_faces(pil_img):
+    return analyze_face(pil_img, embed=False).face_count
+
+
+def get_embedding_from_pil(pil_img):
+    emb = analyze_face(pil_img).embedding
+    return None if emb is None else emb.tolist()
 
 
 def cosine_similarity_vec(a, b):
     if a is None or b is None:
         return -1.0
-    a = np.array(a)
-    b = np.array(b)
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
 
     if np.linalg.norm(a) == 0 or np.linalg.norm(b) == 0:
         return -1.0
@@ -114,3 +386,35 @@ def compare_two_images(img1_pil, img2_pil, threshold=0.60):
         return False
     sim = cosine_similarity_vec(emb1, emb2)
     return sim >= threshold
+
+
+# ================= PROFILE PHOTO EMBEDDINGS =================
+# Staff.profile_embedding caches the embedding of Staff.profile_image so
+# registration only has to embed the live capture. The cache is keyed by the
+# image's storage name: a new upload gets a new name and invalidates it.
+def compute_profile_embedding(staff):
+    """Embed staff.profile_image and store it on the row; returns the embedding (None if no face)."""
+    embedding = None
+    if staff.profile_image:
+        with staff.profile_image.open('rb') as f:
+            frame = decode_image_bytes(f.read())
+        if frame is not None:
+            embedding = analyze_face(frame.image).embedding
+
+    staff.profile_embedding = pack_embedding(embedding)
+    staff.profile_embedding_source = staff.profile_image.name or ''
+    # update() rather than save(): no signals, no re-upload of the image
+    type(staff).objects.filter(pk=staff.pk).update(
+        profile_embedding=staff.profile_embedding,
+        profile_embedding_source=staff.profile_embedding_source,
+    )
+    return embedding
+
+
+def get_profile_embedding(staff):
+    """Cached profile-photo embedding, recomputed if the photo changed since it was stored."""
+    if not staff.profile_image:
+        return None
+    if staff.profile_embedding_source == staff.profile_image.name:
+        return unpack_embedding(staff.profile_embedding)
+    return compute_profile_embedding(staff)
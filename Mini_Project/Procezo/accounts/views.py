@@ -2,11 +2,11 @@ import pytz
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
-import uuid, json
+import functools, hmac, uuid, json, time
 from tkinter import Image
 from PIL import Image
 from django.shortcuts import render, redirect
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
@@ -14,7 +14,13 @@ from django.urls import reverse
 from datetime import datetime, timedelta
 from .models import Staff, Register, Attendance
 # Import the utility function
-from .utils_face import pil_from_base64, count_faces, get_embedding_from_pil, save_base64_to_contentfile, cosine_similarity_vec, compare_two_images
+from django.core.files.base import ContentFile
+from .utils_face import decode_image_bytes, read_frame_upload, frame_upload_limits, FrameUploadError, analyze_face, get_profile_embedding, cosine_similarity_vec, pack_embedding
+from .face_index import face_index
+from .inference_limiter import InferenceBusy, inference_limiter
+from .metrics import is_enabled as metrics_enabled, record_stage, render_prometheus, stage_timer
+from . import emotion_jobs, face_templates, inference_client, model_registry
+from django.conf import settings
 
 # ---------------- Timezone helpers ----------------
 INDIA_TZ = pytz.timezone("Asia/Kolkata")
@@ -57,20 +63,30 @@ def get_staff_details(request):
     except Staff.DoesNotExist:
         return JsonResponse({"exists": False})
 
+def busy_response(data, error):
+    """503 with Retry-After when every inference slot is taken (InferenceBusy)."""
+    response = JsonResponse(data, status=503)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
 # Basic face check API
 @csrf_exempt
 def api_check_face(request):
     try:
-        body = request.body.decode('utf-8') or "{}"
-        data = json.loads(body)
-        img_b64 = data.get('image')
-        if not img_b64:
+        _, image = read_frame_upload(request)
+        if not image:
             return JsonResponse({"error": "No image received", "face_count": 0}, status=400)
-        pil = pil_from_base64(img_b64)
-        if pil is None:
+        frame = decode_image_bytes(image)
+        if frame is None:
             return JsonResponse({"error": "Invalid image", "face_count": 0}, status=400)
-        fc = count_faces(pil)
+        if not frame.quality.ok:
+            return JsonResponse({"error": frame.quality.message, "reason": frame.quality.reason, "face_count": 0}, status=422)
+        fc = analyze_face(frame.image, embed=False).face_count
         return JsonResponse({"error": None, "face_count": fc})
+    except FrameUploadError as e:
+        return JsonResponse({"error": str(e), "face_count": 0, **frame_upload_limits()}, status=e.status)
+    except InferenceBusy as e:
+        return busy_response({"error": str(e), "face_count": 0}, e)
     except Exception as e:
         return JsonResponse({"error": str(e), "face_count": 0}, status=500)
 
@@ -79,19 +95,19 @@ def api_check_face(request):
 def register_staff(request):
     is_ajax = request.headers.get("X-Requested-With") == "XMLHttpRequest"
 
-    # Parse JSON for AJAX
-    if is_ajax:
-        try:
-            data = json.loads(request.body)
-        except:
-            return JsonResponse({"success": False, "error": "Invalid JSON"})
-    else:
-        data = request.POST
-
     if request.method != "POST":
         error_msg = {"success": False, "error": "POST required"}
         return JsonResponse(error_msg) if is_ajax else HttpResponseBadRequest("POST required")
 
+    # JSON (AJAX), multipart (AJAX with a binary frame) or a plain form POST
+    try:
+        data, face_image = read_frame_upload(request)
+    except FrameUploadError as e:
+        if is_ajax:
+            return JsonResponse({"success": False, "error": str(e), **frame_upload_limits()}, status=e.status)
+        messages.error(request, str(e))
+        return redirect("accounts:login_register")
+
     try:
         # ------------------------------------------------------------
         # EXTRACT FIELDS
@@ -103,8 +119,6 @@ def register_staff(request):
         job_type = data.get("job_type")
         gender = data.get("gender")
 
-        face_image_b64 = data.get("image")
-        profile_image_b64 = data.get("profile_image")
 
         if not email:
             return JsonResponse({"success": False, "error": "Email is required"})
@@ -117,21 +131,24 @@ def register_staff(request):
 
         # ---------- Face Embedding ----------
         emb = None
-        if face_image_b64:
-            pil = pil_from_base64(face_image_b64)
-            if not pil:
+        if face_image:
+            frame = decode_image_bytes(face_image)
+            if frame is None:
                 return JsonResponse({"success": False, "error": "Invalid face image"})
+            if not frame.quality.ok:
+                return JsonResponse({"success": False, "error": frame.quality.message, "reason": frame.quality.reason})
 
-            if count_faces(pil) != 1:
+            analysis = analyze_face(frame.image, require_single=True)
+            if analysis.face_count != 1:
                 return JsonResponse({"success": False, "error": "❌ Image must contain exactly 1 face"})
 
-            emb = get_embedding_from_pil(pil)
+            emb = analysis.embedding
 
         # -------- Face Match with Staff Profile --------
-        if face_image_b64 and staff_obj.profile_image:
-            stored = Image.open(staff_obj.profile_image.path).convert("RGB")
+        if face_image and staff_obj.profile_image:
+            stored_emb = get_profile_embedding(staff_obj)
 
-            if not compare_two_images(pil, stored):
+            if emb is None or stored_emb is None or cosine_similarity_vec(emb, stored_emb) < 0.60:
                 return JsonResponse({"success": False, "error": "❌ Face mismatch! Profile image & captured face do not match."})
 
 
@@ -149,12 +166,11 @@ def register_staff(request):
             register_obj.set_password(password)
 
         # ---------- Save Face Data ----------
-        if emb:
-            register_obj.face_embedding = emb
+        if emb is not None:
+            register_obj.face_embedding = pack_embedding(emb)
 
             filename = f"{staff_obj.staff_id}_{uuid.uuid4().hex[:8]}.jpg"
-            face_file = save_base64_to_contentfile(face_image_b64, filename)
-            register_obj.face_capture.save(filename, face_file, save=False)
+            register_obj.face_capture.save(filename, ContentFile(face_image), save=False)
 
         # PROFILE IMAGE → COPY FROM STAFF
         if staff_obj.profile_image:
@@ -162,6 +178,10 @@ def register_staff(request):
 
         register_obj.save()
 
+        # The new capture replaces the user's face templates
+        if emb is not None:
+            face_templates.enroll(register_obj, emb)
+
         # ------------------------------------------------------------
         # SUCCESS
         # ------------------------------------------------------------
@@ -171,6 +191,11 @@ def register_staff(request):
         messages.success(request, "Registration successful.")
         return redirect("accounts:login_register")
 
+    except InferenceBusy as e:
+        if is_ajax:
+            return busy_response({"success": False, "error": str(e)}, e)
+        messages.error(request, str(e))
+        return redirect("accounts:login_register")
     except Exception as e:
         if is_ajax:
             return JsonResponse({"success": False, "error": str(e)})
@@ -182,23 +207,27 @@ def register_staff(request):
 @csrf_exempt
 def api_face_login(request):
     try:
-        body = request.body.decode('utf-8') or "{}"
-        data = json.loads(body)
-        img_b64 = data.get('image')
+        try:
+            data, image = read_frame_upload(request)
+        except FrameUploadError as e:
+            return JsonResponse({"success": False, "error": str(e), **frame_upload_limits()}, status=e.status)
         email = data.get('email')
 
-        if not img_b64:
+        if not image:
             return JsonResponse({"success": False, "error": "No image provided"})
 
-        pil = pil_from_base64(img_b64)
-        if pil is None:
+        frame = decode_image_bytes(image)
+        if frame is None:
             return JsonResponse({"success": False, "error": "Invalid image"})
+        if not frame.quality.ok:
+            return JsonResponse({"success": False, "error": frame.quality.message, "reason": frame.quality.reason})
 
-        faces = count_faces(pil)
+        analysis = analyze_face(frame.image, require_single=True)
+        faces = analysis.face_count
         if faces != 1:
             return JsonResponse({"success": False, "error": f"Require exactly 1 face. Found: {faces}"})
 
-        emb = get_embedding_from_pil(pil)
+        emb = analysis.embedding
         if emb is None:
             return JsonResponse({"success": False, "error": "Could not compute embedding"})
 
@@ -213,83 +242,59 @@ def api_face_login(request):
             except Register.DoesNotExist:
                 return JsonResponse({"success": False, "error": "No account with that email"})
 
-            if not getattr(register_instance, "face_embedding", None):
+            # Best match over all of the user's templates (one matrix-vector product)
+            templates = face_templates.templates_for(register_instance.register_id)
+            if templates is None:
                 return JsonResponse({"success": False, "error": "No face registered for this account"})
 
-            raw_emb = register_instance.face_embedding
-            stored = json.loads(raw_emb) if isinstance(raw_emb, str) else raw_emb
-            sim = cosine_similarity_vec(emb, stored)
+            register_id = register_instance.register_id
+            sim = face_templates.best_similarity(emb, templates)
             if sim < threshold:
                 return JsonResponse({"success": False, "error": "Face did not match."})
 
         else:
-            candidates = Register.objects.exclude(face_embedding__isnull=True).exclude(face_embedding__exact='')
-            best_staff_register = None
-            best_sim = -1.0
-            for r in candidates:
-                raw_emb = r.face_embedding
-                try:
-                    stored = json.loads(raw_emb) if isinstance(raw_emb, str) else raw_emb
-                except Exception:
-                    continue
-                sim = cosine_similarity_vec(emb, stored)
-                if sim > best_sim:
-                    best_sim = sim
-                    best_staff_register = r
-
-            if best_staff_register and best_sim >= threshold:
-                staff = best_staff_register.staff
-            else:
+            # 1:N search against the in-memory template index
+            register_id, sim = face_index.best_match(emb)
+            if register_id is None or sim < threshold:
                 return JsonResponse({"success": False, "error": "No matching user found."})
 
+            try:
+                staff = Register.objects.select_related('staff').get(register_id=register_id).staff
+            except Register.DoesNotExist:
+                return JsonResponse({"success": False, "error": "No matching user found."})
+
+        # Keep this capture as an extra template so the next login under similar conditions matches first time
+        with stage_timer('template_update'):
+            face_templates.remember_login(register_id, emb, sim)
+
         # Attendance Logic (Check-In)
+        attendance_started = time.perf_counter()
         current_time = time_india()         # India-local time
         today = today_india()
 
         # Determine Late: compare staff.check_in (admin-set schedule) with current_time
-        is_late = False
+        late_minutes = 0
         if staff.check_in:  # admin-set required check_in time
             # give 10 minute grace
             req_dt = datetime.combine(today, staff.check_in).astimezone(INDIA_TZ)
             actual_dt = datetime.combine(today, current_time).astimezone(INDIA_TZ)
             grace_end = req_dt + timedelta(minutes=10)
             if actual_dt > grace_end:
-                is_late = True
-
-        # Create rows per the rules:
-        # - Late: create a 'Late' row (with check_in), then create 'Active' row (check_out null)
-        # - On-time: create only an 'Active' row
-        if is_late:
-            # Late incident row
-            Attendance.objects.create(
-                staff=staff,
-                date=today,
-                check_in=current_time,
-                check_out=None,
-                status='Late',
-                overtime_hours=Decimal('0.00')
-            )
-
-            # Active session row
-            att = Attendance.objects.create(
-                staff=staff,
-                date=today,
-                check_in=current_time,
-                check_out=None,
-                status='Active',
-                overtime_hours=Decimal('0.00')
-            )
-            final_status = 'Late/Active'
-        else:
-            att = Attendance.objects.create(
-                staff=staff,
-                date=today,
-                check_in=current_time,
-                check_out=None,
-                status='Active',
-                overtime_hours=Decimal('0.00')
-            )
-            final_status = 'Active'
+                late_minutes = max(1, int((actual_dt - req_dt).total_seconds() // 60))
+
+        # One row per session; lateness is stored on it instead of a separate 'Late' row
+        att = Attendance.objects.create(
+            staff=staff,
+            date=today,
+            check_in=current_time,
+            check_out=None,
+            status='Active',
+            is_late=late_minutes > 0,
+            late_minutes=late_minutes,
+            overtime_hours=Decimal('0.00')
+        )
+        final_status = 'Late/Active' if att.is_late else 'Active'
+        record_stage('attendance', time.perf_counter() - attendance_started)
 
         # store session info for convenience
         request.session['staff_id'] = staff.staff_id
@@ -300,10 +305,92 @@ def api_face_login(request):
 
         return JsonResponse({"success": True, "redirect": redirect_url, "name": staff.name, "status": final_status})
 
+    except InferenceBusy as e:
+        return busy_response({"success": False, "error": str(e)}, e)
     except Exception as e:
         return JsonResponse({"success": False, "error": str(e)})
 
 
+# ---------------- Frame upload limits (clients downscale to these) ----------------
+def api_face_config(request):
+    return JsonResponse(frame_upload_limits())
+
+
+# ---------------- Monitoring endpoints access ----------------
+def monitoring_access(view):
+    """
+    Restrict a monitoring endpoint to logged-in admins, or to scrapers that
+    send `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set.
+    """
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if token and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            return view(request, *args, **kwargs)
+        if request.session.get('staff_role') == 'admin':
+            return view(request, *args, **kwargs)
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    return wrapped
+
+
+# ---------------- Async emotion queue depth ----------------
+@monitoring_access
+def api_emotion_queue(request):
+    return JsonResponse({"enabled": emotion_jobs.is_enabled(), **emotion_jobs.queue_stats()})
+
+
+# ---------------- Inference admission (concurrency limiter) ----------------
+@monitoring_access
+def api_inference_stats(request):
+    data = {"limiter": inference_limiter.stats(), "models": model_registry.loaded_models()}
+    # Thread pools are only configured (and worth reporting) once a model is loaded
+    if data["models"]:
+        data["torch_threads"] = model_registry.torch_threads()
+    return JsonResponse(data)
+
+
+# ---------------- Metrics (Prometheus text format) ----------------
+@monitoring_access
+def metrics(request):
+    if not metrics_enabled():
+        return HttpResponse("Metrics are disabled (METRICS_ENABLED=0)", status=404, content_type='text/plain')
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ---------------- Readiness (load balancer probe) ----------------
+def api_ready(request):
+    """
+    200 once the face/emotion models are loaded and warm, 503 before that.
+    ?probe=1 also times a fresh dummy inference on this worker.
+    """
+    if inference_client.is_enabled():
+        ready = inference_client.ping()
+        return JsonResponse({"ready": ready, "backend": "sidecar"}, status=200 if ready else 503)
+
+    if getattr(settings, 'FACE_MODELS_WARMUP', False):
+        warmup = model_registry.warmup_status()
+        ready = warmup['state'] == 'done'
+    else:
+        # No startup warmup configured: models load lazily on first use
+        warmup = {"state": "disabled"}
+        ready = True
+
+    data = {
+        "ready": ready,
+        "backend": "in-process",
+        "warmup": warmup,
+        "models": model_registry.model_stats(),
+    }
+    if ready and request.GET.get('probe'):
+        try:
+            data["latency_ms"] = model_registry.measure_inference_latency()
+        except Exception as e:
+            data["ready"] = False
+            data["error"] = str(e)
+
+    return JsonResponse(data, status=200 if data["ready"] else 503)
+
+
 # Password login (POST)
 @csrf_exempt
 def api_login_with_password(request):
@@ -416,22 +503,11 @@ def api_face_logout(request):
                 diff_seconds = (checkout_dt - required_dt).total_seconds()
                 overtime_amount = round(Decimal(diff_seconds) / Decimal(3600), 2)  # hours (decimal)
 
-        # 1) Create NEW 'Inactive' row
-        new_att = Attendance.objects.create(
-            staff=staff,
-            date=today,
-            check_in=active_att.check_in,
-            check_out=current_time,
-            status='Inactive',
-            overtime_hours=overtime_amount  # store None when no overtime
-        )
-
-        # 2) ALSO update the Active row's check_out so both rows show check_out (user wanted that)
-        #    (This preserves the original 'Active' row but records its check_out timestamp.)
+        # Close the session row
         active_att.check_out = current_time
-        # Optionally you might want to keep Active status (still 'Active') or mark something else.
-        # We'll leave its status as 'Active' but now with a check_out for visibility.
-        active_att.save(update_fields=['check_out'])
+        active_att.status = 'Inactive'
+        active_att.overtime_hours = overtime_amount  # store None when no overtime
+        active_att.save(update_fields=['check_out', 'status', 'overtime_hours'])
 
         # Clear session variables
         for key in ('staff_id', 'staff_role', 'is_active'):
@@ -440,10 +516,10 @@ def api_face_logout(request):
 
         return JsonResponse({
             "success": True,
-            "message": f"Checked out at {new_att.check_out}. Overtime: {new_att.overtime_hours} hours.",
-            "checkout_time": str(new_att.check_out),
-            "status": new_att.status,
-            "overtime_hours": float(new_att.overtime_hours)
+            "message": f"Checked out at {active_att.check_out}. Overtime: {active_att.overtime_hours} hours.",
+            "checkout_time": str(active_att.check_out),
+            "status": active_att.status,
+            "overtime_hours": float(active_att.overtime_hours or 0)
         })
 
     except Staff.DoesNotExist:
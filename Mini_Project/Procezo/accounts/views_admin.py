@@ -10,18 +10,24 @@ from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-from django.utils import timezone
 from django.urls import reverse
 from django.core.mail import EmailMultiAlternatives
 from django.utils.html import strip_tags
 from django.db.models import Q
-from datetime import datetime, timedelta, time as dtime
-from django.db.models import Count, Avg
+from datetime import time as dtime
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.core.paginator import Paginator
 from django.utils.dateparse import parse_date, parse_time
 from django.middleware.csrf import get_token
 from django.core.serializers.json import DjangoJSONEncoder
 from .models import Staff, Register, Attendance, GoogleMeet, WorkSchedule, Emotion, Feedback, IssueReport, Productivity
+from .models import DailyAttendanceSummary, DailyEmotionSummary, DailyProductivitySummary
 from .models import EVENT_TYPE_CHOICES
+from .utils_face import compute_profile_embedding
+from .rollups import day_filter
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 # ---------------- Timezone helpers ----------------
@@ -83,9 +89,11 @@ def admin_dashboard(request):
     # ---------------------------------------------
     # ATTENDANCE COUNTS
     # ---------------------------------------------
-    active_count = Attendance.objects.filter(date=today, status='Active').count()
-    inactive_count = Attendance.objects.filter(date=today, status='Inactive').count()
-    late_count = Attendance.objects.filter(date=today, status='Late').count()
+    # From the daily summaries (rollups.py) instead of counting raw rows
+    attendance_counts = dict(DailyAttendanceSummary.objects.filter(day=today).values_list('status', 'count'))
+    active_count = attendance_counts.get('Active', 0)
+    inactive_count = attendance_counts.get('Inactive', 0)
+    late_count = attendance_counts.get('Late', 0)
     
     register_list = Register.objects.select_related("staff").all()
 
@@ -96,10 +104,10 @@ def admin_dashboard(request):
     week_end = week_start + timedelta(days=6)              # Sunday
 
     emotion_qs = (
-        Emotion.objects
-        .filter(timestamp__date__range=(week_start, week_end))
+        DailyEmotionSummary.objects
+        .filter(day__range=(week_start, week_end))
         .values('emotion_type')
-        .annotate(count=Count('emotion_type'))
+        .annotate(count=Sum('count'))
     )
 
     emotion_data = {
@@ -119,9 +127,14 @@ def admin_dashboard(request):
     # ---------------------------------------------
     prod_labels = []
     prod_values = []
+    prod_days = {
+        summary.day: summary
+        for summary in DailyProductivitySummary.objects.filter(day__range=(today - timedelta(days=6), today))
+    }
     for i in range(6, -1, -1):
         day = today - timedelta(days=i)
-        avg_score = Productivity.objects.filter(datetime__date=day).aggregate(Avg('productivity_score'))['productivity_score__avg'] or 0
+        summary = prod_days.get(day)
+        avg_score = summary.average_score if summary else 0
         prod_labels.append(day.strftime('%a')) # 'Mon', 'Tue' etc.
         prod_values.append(round(float(avg_score), 2))
 
@@ -249,6 +262,16 @@ def admin_staff_management(request):
 # ---------------------------------------------------------
 # ADD / UPDATE STAFF
 # ---------------------------------------------------------
+def refresh_profile_embedding(staff):
+    # Precompute the photo's embedding for registration face matching.
+    # A failure here must not block saving the staff member; registration
+    # recomputes it on demand.
+    try:
+        compute_profile_embedding(staff)
+    except Exception as e:
+        logger.error(f"Profile embedding failed for {staff.staff_id}: {e}")
+
+
 def add_new_staff(request, staff_id=None):
     staff = None
 
@@ -282,6 +305,9 @@ def add_new_staff(request, staff_id=None):
 
             staff.save()
 
+            if profile_image:
+                refresh_profile_embedding(staff)
+
             # ---------- EMAIL FOR UPDATE ----------
             html_content = f"""
             <p>Dear <b>{name}</b>,</p>
@@ -323,6 +349,9 @@ def add_new_staff(request, staff_id=None):
             profile_image=profile_image,
         )
 
+        if profile_image:
+            refresh_profile_embedding(staff)
+
 
         # ---------------- EMAIL FOR INSERT ----------------
         html_content = f"""
@@ -432,10 +461,11 @@ def admin_attendance_management(request):
     week_start = today - timedelta(days=7)
     five_months_ago = today - timedelta(days=150)
 
-    # ATTENDANCE COUNTS FOR TODAY
-    active_count = Attendance.objects.filter(date=today, status='Active').count()
-    inactive_count = Attendance.objects.filter(date=today, status='Inactive').count()
-    late_count = Attendance.objects.filter(date=today, status='Late').count()
+    # ATTENDANCE COUNTS FOR TODAY (one aggregate over the (date, status, is_late) index)
+    attendance_counts = Attendance.objects.filter(date=today).status_counts()
+    active_count = attendance_counts['Active']
+    inactive_count = attendance_counts['Inactive']
+    late_count = attendance_counts['Late']
 
     # GET values
     status = request.GET.get('status')
@@ -460,7 +490,7 @@ def admin_attendance_management(request):
     # ---------------- STATUS FILTER ----------------
     # If status is empty (All) → NO filter applied
     if status:
-        attendance_list = attendance_list.filter(status=status)
+        attendance_list = attendance_list.with_status(status)
 
     # ---------------- STAFF FILTERS ----------------
     if staff_id:
@@ -1008,6 +1038,31 @@ def admin_KeyLogs_management(request):
 
 
 
+def latest_pk(model, time_field, day=None, **filters):
+    """Subquery: pk of the staff member's newest `model` row (on `day`, if given)."""
+    qs = model.objects.filter(staff=OuterRef('pk'), **filters)
+    if day is not None:
+        qs = qs.filter(**day_filter(time_field, day))
+    return Subquery(qs.order_by(f'-{time_field}', '-pk').values('pk')[:1])
+
+
+def latest_emotion_counts(day):
+    """[(emotion_type, staff count)] of each staff member's last emotion on `day`, in one query."""
+    return list(
+        Emotion.objects
+        .filter(**day_filter('timestamp', day))
+        .filter(pk=Subquery(
+            Emotion.objects
+            .filter(staff=OuterRef('staff'), **day_filter('timestamp', day))
+            .order_by('-timestamp', '-pk')
+            .values('pk')[:1]
+        ))
+        .values_list('emotion_type')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+
+
 # Admin emotion management view
 def admin_emotion_management(request):
     today = date.today()
@@ -1033,7 +1088,7 @@ def admin_emotion_management(request):
     if staff_name_q:
         staff_qs = staff_qs.filter(name__icontains=staff_name_q)
 
-    staff_qs = staff_qs.order_by('staff_id')
+    staff_qs = staff_qs.order_by_staff_id()
 
     # -----------------------------
     # TODAY EMOTION COUNTS (LATEST PER STAFF)
@@ -1047,19 +1102,9 @@ def admin_emotion_management(request):
         'Focused': 0,
     }
 
-    today_emotions = (
-        Emotion.objects
-        .filter(timestamp__date=today)
-        .order_by('staff', '-timestamp')
-    )
-
-    seen_staff = set()
-
-    for emo in today_emotions:
-        if emo.staff_id not in seen_staff:
-            seen_staff.add(emo.staff_id)
-            if emo.emotion_type in emotion_counts:
-                emotion_counts[emo.emotion_type] += 1
+    for emotion_type, count in latest_emotion_counts(today):
+        if emotion_type in emotion_counts:
+            emotion_counts[emotion_type] = count
 
     total_today_responses = sum(emotion_counts.values())
 
@@ -1075,22 +1120,9 @@ def admin_emotion_management(request):
     # -----------------------------
     # LAST WEEK POSITIVE %
     # -----------------------------
-    last_week_emotions = (
-        Emotion.objects
-        .filter(timestamp__date=last_week_day)
-        .order_by('staff', '-timestamp')
-    )
-
-    last_week_seen = set()
-    last_week_positive = 0
-
-    for emo in last_week_emotions:
-        if emo.staff_id not in last_week_seen:
-            last_week_seen.add(emo.staff_id)
-            if emo.emotion_type in ['Happy', 'Focused']:
-                last_week_positive += 1
-
-    last_week_total = len(last_week_seen)
+    last_week_counts = dict(latest_emotion_counts(last_week_day))
+    last_week_total = sum(last_week_counts.values())
+    last_week_positive = last_week_counts.get('Happy', 0) + last_week_counts.get('Focused', 0)
 
     last_week_positive_percent = 0
     if last_week_total > 0:
@@ -1106,66 +1138,47 @@ def admin_emotion_management(request):
     # -----------------------------
     # INDIVIDUAL REPORTS
     # -----------------------------
-    reports = []
-
-    for staff in staff_qs:
-
-        if filters_applied:
-            emotion_qs = Emotion.objects.filter(staff=staff)
-
-            if status:
-                emotion_qs = emotion_qs.filter(emotion_type=status)
-                if not emotion_qs.exists():
-                    continue
+    # Without filters only today's records are shown; with filters the latest
+    # ever (and for a status filter, the latest emotion of that type).
+    day = None if filters_applied else today
+    emotion_filter = {'emotion_type': status} if status else {}
+
+    staff_qs = staff_qs.annotate(
+        latest_emotion_id=latest_pk(Emotion, 'timestamp', day, **emotion_filter),
+        latest_productivity_id=latest_pk(Productivity, 'datetime', day),
+        latest_feedback_id=latest_pk(Feedback, 'created_at', day),
+        latest_issue_id=latest_pk(IssueReport, 'created_at', day),
+    )
+    if status:
+        staff_qs = staff_qs.filter(latest_emotion_id__isnull=False)
 
-            latest_emotion = emotion_qs.order_by('-timestamp').first()
-        else:
-            latest_emotion = Emotion.objects.filter(
-                staff=staff,
-                timestamp__date=today
-            ).order_by('-timestamp').first()
-
-        latest_productivity = (
-            Productivity.objects.filter(staff=staff)
-            .order_by('-datetime')
-            .first()
-            if filters_applied else
-            Productivity.objects.filter(staff=staff, datetime__date=today).first()
-        )
+    paginator = Paginator(staff_qs, getattr(settings, 'ADMIN_REPORTS_PER_PAGE', 25))
+    page_obj = paginator.get_page(request.GET.get('page'))
+    page_staff = list(page_obj)
 
-        latest_feedback = (
-            Feedback.objects.filter(staff=staff)
-            .order_by('-created_at')
-            .first()
-            if filters_applied else
-            Feedback.objects.filter(staff=staff, created_at__date=today)
-            .order_by('-created_at')
-            .first()
-        )
+    # One query per related table for the whole page
+    emotions = Emotion.objects.in_bulk([s.latest_emotion_id for s in page_staff if s.latest_emotion_id])
+    productivity = Productivity.objects.in_bulk([s.latest_productivity_id for s in page_staff if s.latest_productivity_id])
+    feedbacks = Feedback.objects.in_bulk([s.latest_feedback_id for s in page_staff if s.latest_feedback_id])
+    issues = IssueReport.objects.in_bulk([s.latest_issue_id for s in page_staff if s.latest_issue_id])
 
-        latest_issue = (
-            IssueReport.objects.filter(staff=staff)
-            .order_by('-created_at')
-            .first()
-            if filters_applied else
-            IssueReport.objects.filter(staff=staff, created_at__date=today)
-            .order_by('-created_at')
-            .first()
-        )
-
-        reports.append({
+    reports = [
+        {
             'staff': staff,
-            'emotion': latest_emotion,
-            'productivity': latest_productivity,
-            'feedback': latest_feedback,
-            'issue': latest_issue,
-        })
+            'emotion': emotions.get(staff.latest_emotion_id),
+            'productivity': productivity.get(staff.latest_productivity_id),
+            'feedback': feedbacks.get(staff.latest_feedback_id),
+            'issue': issues.get(staff.latest_issue_id),
+        }
+        for staff in page_staff
+    ]
 
     # -----------------------------
     # CONTEXT
     # -----------------------------
     context = {
         'reports': reports,
+        'page_obj': page_obj,
         'today': today,
         'filters_applied': filters_applied,
         'emotion_counts': emotion_counts,
@@ -1,10 +1,10 @@
 import pytz
 from django.utils import timezone
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, require_http_methods
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
@@ -13,7 +13,13 @@ from django.db.models import Q
 from datetime import timedelta
 from .models import Staff, Register, Attendance, GoogleMeet, WorkSchedule, Emotion, Feedback, IssueReport, Productivity
 # Import the utility function
-from .utils import verify_face_with_embedding, detect_emotion_from_base64_image
+from .utils import verify_face, detect_emotion
+from .face_templates import templates_for
+from .inference_limiter import InferenceBusy
+from .utils_face import decode_image_bytes, read_frame_upload, FrameUploadError
+from .emotion_schedule import next_capture_at, mark_captured, mark_queued, retry_interval, schedule_info, wait_message
+from .rollups import day_filter
+from . import emotion_jobs
 
 # ---------------- Timezone helpers ----------------
 INDIA_TZ = pytz.timezone("Asia/Kolkata")
@@ -67,7 +73,7 @@ def staff_dashboard(request):
     ).order_by('dob__month', 'dob__day')[:5]
 
     # ------------ Today's Meetings (by staff.job_type) ------------
-    todays_meets = GoogleMeet.objects.filter(meet_time__date=today, job_type=staff.job_type).order_by('meet_time')
+    todays_meets = GoogleMeet.objects.filter(job_type=staff.job_type, **day_filter('meet_time', today)).order_by('meet_time')
 
     # ✔ Count meetings for this staff
     todays_meet_count = todays_meets.count()
@@ -165,20 +171,23 @@ def staff_attendance(request):
         date__lte=today
     )
     
-    monthly_active_count = monthly_data.filter(status='Active').count()
-    monthly_inactive_count = monthly_data.filter(status='Inactive').count()
-    monthly_late_count = monthly_data.filter(status='Late').count()
+    monthly_counts = monthly_data.status_counts()
+    monthly_active_count = monthly_counts['Active']
+    monthly_inactive_count = monthly_counts['Inactive']
+    monthly_late_count = monthly_counts['Late']
     
     all_attendance_data = Attendance.objects.filter(
         staff=staff,
         date__year__gte=2020,
         date__year__lte=2030
-    )
+    ).order_by('date', 'check_in')
 
-    attendance_map = {
-        record.date.strftime('%Y-%m-%d'): record.status 
-        for record in all_attendance_data
-    }
+    # A day with any late session shows as Late, otherwise as its last session
+    attendance_map = {}
+    for record in all_attendance_data:
+        day = record.date.strftime('%Y-%m-%d')
+        if attendance_map.get(day) != 'Late':
+            attendance_map[day] = 'Late' if record.is_late else record.status
 
     # 4. Filtering Logic for the Table
     status_filter = request.GET.get('status')
@@ -203,7 +212,7 @@ def staff_attendance(request):
 
     # Apply Status Filter (only if 'All' is not selected)
     if status_filter:
-        attendance_records = attendance_records.filter(status=status_filter)
+        attendance_records = attendance_records.with_status(status_filter)
 
     # Final ordering (Newest first)
     attendance_records = attendance_records.order_by('-date')
@@ -234,7 +243,7 @@ def staff_WorkSchedule(request):
     today = today_india()
     next_week = today + timedelta(days=7)
 
-    todays_meets = GoogleMeet.objects.filter(meet_time__date=today, job_type=staff.job_type).order_by('meet_time')
+    todays_meets = GoogleMeet.objects.filter(job_type=staff.job_type, **day_filter('meet_time', today)).order_by('meet_time')
 
     tasks = WorkSchedule.objects.filter(staff=staff).order_by('-start_time')
 
@@ -308,7 +317,7 @@ def staff_emotion(request):
     today = date.today()
 
     # 2) Stat cards-il kaanikkan vendi TODAY'S counts mathram edukunu
-    emotions_today_query = Emotion.objects.filter(staff=staff, timestamp__date=today)
+    emotions_today_query = Emotion.objects.filter(staff=staff, **day_filter('timestamp', today))
     
     emotion_counts = {
         "Happy": emotions_today_query.filter(emotion_type="Happy").count(),
@@ -374,7 +383,7 @@ def save_admin_reply(request):
 
     return JsonResponse({"status": "error", "message": "Invalid request"})
 
-@require_POST
+@require_http_methods(["GET", "HEAD", "POST"])
 def record_emotion(request):
     # 1. Check the login status
     staff_id = request.session.get('staff_id')
@@ -382,34 +391,74 @@ def record_emotion(request):
         return JsonResponse({'status': 'error', 'message': 'Session expired'}, status=401)
 
     try:
-        data = json.loads(request.body)
-        image_b64 = data.get('image', '')
-
-        # 2. Check the time (1-hour gap)
-        one_hour_ago = timezone.now() - timedelta(hours=1)
-        if Emotion.objects.filter(staff__staff_id=staff_id, timestamp__gte=one_hour_ago).exists():
-            return JsonResponse({'status': 'skipped', 'message': 'Next update in 1 hour'})
+        # 2. Check the cooldown (cached; the body is not read for early frames)
+        next_at = next_capture_at(staff_id)
+        if next_at > timezone.now():
+            schedule = schedule_info(next_at)
+            response = JsonResponse({'status': 'skipped', 'message': wait_message(next_at), **schedule})
+            response['Retry-After'] = str(schedule['retry_after'])
+            return response
+
+        # GET/HEAD: eligibility probe, no frame needed
+        if request.method != 'POST':
+            return JsonResponse({'status': 'ready', **schedule_info(next_at)})
+
+        # Failed attempts can be retried after a short pause
+        retry = schedule_info(timezone.now() + retry_interval())
+
+        # Async mode: shed load before reading the frame when the queue is backed up
+        if emotion_jobs.is_enabled() and emotion_jobs.queue_full():
+            response = JsonResponse({'status': 'busy', 'message': 'Emotion queue is full', **retry}, status=503)
+            response['Retry-After'] = str(retry['retry_after'])
+            return response
+
+        # Raw image/jpeg body, multipart or JSON with a base64 data URL
+        try:
+            _, image = read_frame_upload(request)
+        except FrameUploadError as e:
+            return JsonResponse({'status': 'error', 'message': str(e), **retry}, status=e.status)
+
+        # Async mode: store the frame for process_emotion_jobs and return immediately
+        if emotion_jobs.is_enabled():
+            if not image:
+                return JsonResponse({'status': 'error', 'message': 'Invalid image', **retry}, status=400)
+            job = emotion_jobs.enqueue(staff_id, image)
+            next_at = mark_queued(staff_id)
+            return JsonResponse({'status': 'queued', 'job_id': job.job_id, **schedule_info(next_at)}, status=202)
+
+        # Decode the frame once; verification and emotion detection share it
+        frame = decode_image_bytes(image)
+        if frame is None:
+            return JsonResponse({'status': 'error', 'message': 'Invalid image', **retry}, status=400)
+        if not frame.quality.ok:
+            return JsonResponse({'status': 'rejected', 'reason': frame.quality.reason, 'message': frame.quality.message, **retry}, status=422)
 
         # 3. Ensure the same staff member is logged in
         reg_user = Register.objects.get(staff__staff_id=staff_id)
-        if not verify_face_with_embedding(image_b64, reg_user.face_embedding):
-            return JsonResponse({'status': 'error', 'message': 'Face verification failed'}, status=403)
+        matched, analysis = verify_face(frame, templates_for(reg_user.register_id))
+        if not matched:
+            return JsonResponse({'status': 'error', 'message': 'Face verification failed', **retry}, status=403)
 
-        # 4. Detect the emotion and save it
-        emotion_result = detect_emotion_from_base64_image(image_b64)
+        # 4. Detect the emotion on the face found during verification and save it
+        emotion_result = detect_emotion(frame, analysis.primary_box)
         
         if emotion_result:
             staff_obj = get_object_or_404(Staff, staff_id=staff_id)
-            Emotion.objects.create(
+            emotion = Emotion.objects.create(
                 staff=staff_obj,
                 emotion_type=emotion_result,
                 timestamp=timezone.now()
             )
-            return JsonResponse({'status': 'success', 'emotion': emotion_result})
+            next_at = mark_captured(staff_id, emotion.timestamp)
+            return JsonResponse({'status': 'success', 'emotion': emotion_result, **schedule_info(next_at)})
         
-        return JsonResponse({'status': 'error', 'message': 'Detection failed'})
+        return JsonResponse({'status': 'error', 'message': 'Detection failed', **retry})
 
     except Register.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'User not registered'}, status=404)
+    except InferenceBusy as e:
+        response = JsonResponse({'status': 'busy', 'message': str(e), **schedule_info(timezone.now() + timedelta(seconds=e.retry_after))}, status=503)
+        response['Retry-After'] = str(e.retry_after)
+        return response
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
\ No newline at end of file
@@ -64,6 +64,26 @@ function getCookie(name) {
     return cookieValue;
 }
 
+// Frame upload limits advertised by the server (defaults until the config loads)
+let frameLimits = { max_edge: 640, max_bytes: 1536 * 1024 };
+fetch('/accounts/api/face-config/')
+    .then(res => res.json())
+    .then(data => { frameLimits = data; })
+    .catch(err => console.log("Face config error:", err));
+
+// Encode the canvas as a JPEG Blob, lowering quality until it fits max_bytes
+function canvasToJpegBlob(canvas, quality = 0.8) {
+    return new Promise((resolve, reject) => {
+        canvas.toBlob(blob => {
+            if (!blob) return reject(new Error("Could not encode frame"));
+            if (blob.size > frameLimits.max_bytes && quality > 0.4) {
+                return canvasToJpegBlob(canvas, quality - 0.2).then(resolve, reject);
+            }
+            resolve(blob);
+        }, 'image/jpeg', quality);
+    });
+}
+
 // Open camera and start video stream
 function openCamera(mode) {
     currentMode = mode;
@@ -123,28 +143,32 @@ if (captureBtn) captureBtn.addEventListener('click', () => {
         return;
     }
 
-    // force a square or moderate size for reliability
-    const targetWidth = 480;
-    const targetHeight = Math.round(targetWidth * video.videoHeight / video.videoWidth);
+    // moderate size for reliability, never above the server's max edge
+    const scale = Math.min(480 / video.videoWidth, frameLimits.max_edge / Math.max(video.videoWidth, video.videoHeight));
+    const targetWidth = Math.round(video.videoWidth * scale);
+    const targetHeight = Math.round(video.videoHeight * scale);
 
     canvas.width = targetWidth;
     canvas.height = targetHeight;
     const ctx = canvas.getContext('2d');
     ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
 
-    // compress quality to reduce payload if needed (0.8)
-    const dataURL = canvas.toDataURL('image/jpeg', 0.8);
-
-    // quick debug
-    console.log("Captured length:", dataURL.length);
+    // Frames are uploaded as binary JPEG (no base64 / JSON wrapping)
+    let frameBlob = null;
+    canvasToJpegBlob(canvas)
+    .then(blob => {
+        frameBlob = blob;
+        // quick debug
+        console.log("Captured bytes:", blob.size);
 
-    fetch('/accounts/api/check-face/', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-            'X-CSRFToken': getCookie('csrftoken'),
-        },
-        body: JSON.stringify({ image: dataURL })
+        return fetch('/accounts/api/check-face/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'image/jpeg',
+                'X-CSRFToken': getCookie('csrftoken'),
+            },
+            body: blob
+        });
     })
     .then(res => res.json())
     .then(data => {
@@ -168,22 +192,22 @@ if (captureBtn) captureBtn.addEventListener('click', () => {
             const job_type = document.getElementById('reg-job')?.value || "";
             const profile_image = document.getElementById('profile-image-input')?.value || "";
 
+            const form = new FormData();
+            form.append('staff_ID', staffID);
+            form.append('name', name);
+            form.append('email', email);
+            form.append('role', role);
+            form.append('job_type', job_type);
+            form.append('image', frameBlob, 'frame.jpg');     // live captured
+            form.append('profile_image', profile_image);      // uploaded profile image
+
             fetch('/accounts/register/', {
                 method: 'POST',
                 headers: {
-                    "Content-Type": "application/json",
                     "X-CSRFToken": getCookie('csrftoken'),
                     "X-Requested-With": "XMLHttpRequest"
                 },
-                body: JSON.stringify({
-                    staff_ID: staffID,
-                    name: name,
-                    email: email,
-                    role: role,
-                    job_type: job_type,
-                    image: dataURL,             // live captured
-                    profile_image: profile_image // uploaded profile image
-                })
+                body: form
             })
             .then(res => res.json())
             .then(resp => {
@@ -196,7 +220,7 @@ if (captureBtn) captureBtn.addEventListener('click', () => {
 
                 // Success
                 alert("😎 Face captured successfully! Now click the REGISTER button.");
-                document.getElementById("captured-image-input").value = dataURL;
+                document.getElementById("captured-image-input").value = canvas.toDataURL('image/jpeg', 0.8);
                 closeCamera();
             });
         }
@@ -204,14 +228,17 @@ if (captureBtn) captureBtn.addEventListener('click', () => {
         // Login flow
         else if (currentMode === 'login') {
             const email = (document.getElementById('login-email') || {}).value || '';
+            const form = new FormData();
+            form.append('image', frameBlob, 'frame.jpg');
+            form.append('email', email);
+
             fetch('/accounts/api/face-login/', {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json',
                     'X-CSRFToken': getCookie('csrftoken'),
                     'X-Requested-With': 'XMLHttpRequest'
                 },
-                body: JSON.stringify({ image: dataURL, email: email })
+                body: form
             })
             .then(r => r.json())
             .then(resp => {
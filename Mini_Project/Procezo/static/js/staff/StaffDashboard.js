@@ -57,8 +57,9 @@ const context = canvas ? canvas.getContext('2d') : null;
 
 let isCameraOn = true;
 let stream = null;
-let captureIntervalId = null;
-const CAPTURE_INTERVAL_MS = 5000; // 5 seconds interval for emotion detection
+let captureTimeoutId = null;
+const CAPTURE_INTERVAL_MS = 5000; // fallback retry delay when the server gives no schedule
+const MAX_CAPTURE_DELAY_MS = 60 * 60 * 1000; // re-check at least once an hour
 const API_URL = '/accounts/record-emotion/'; // **Adjust this URL path as per your Django setup**
 
 
@@ -79,62 +80,97 @@ function getCookie(name) {
 }
 const csrftoken = getCookie('csrftoken');
 
+// Frame upload limits advertised by the server (defaults until the config loads)
+let frameLimits = { max_edge: 640, max_bytes: 1536 * 1024 };
+fetch('/accounts/api/face-config/')
+    .then(res => res.json())
+    .then(data => { frameLimits = data; })
+    .catch(error => console.error('Face config error:', error));
+
 
 // ======================= EMOTION CAPTURE FUNCTIONS ============================
 
-async function sendFrameForEmotionDetection(base64Image) {
-    if (!base64Image) return;
+async function sendFrameForEmotionDetection(imageBlob) {
+    if (!imageBlob) return;
 
     try {
+        // Raw JPEG body: no base64 / JSON overhead
         const response = await fetch(API_URL, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json',
+                'Content-Type': 'image/jpeg',
                 'X-CSRFToken': csrftoken, 
             },
-            body: JSON.stringify({ image: base64Image })
+            body: imageBlob
         });
 
         const data = await response.json();
         console.log('Emotion Detection Response:', data);
+        scheduleNextCapture(data);
 
     } catch (error) {
         console.error('Error sending frame to API:', error);
+        scheduleNextCapture(null);
+    }
+}
+
+// Sleep until the server says the next frame is wanted (retry_after seconds)
+function scheduleNextCapture(data) {
+    if (captureTimeoutId) {
+        clearTimeout(captureTimeoutId);
+    }
+    const delay = (data && typeof data.retry_after === 'number')
+        ? Math.min(data.retry_after * 1000, MAX_CAPTURE_DELAY_MS)
+        : CAPTURE_INTERVAL_MS;
+    captureTimeoutId = setTimeout(captureAndSendFrame, Math.max(delay, 1000));
+}
+
+// Ask whether a frame is due without uploading one
+async function checkCaptureEligibility() {
+    try {
+        const response = await fetch(API_URL, { method: 'GET' });
+        const data = await response.json();
+        scheduleNextCapture(data);
+    } catch (error) {
+        console.error('Error checking emotion schedule:', error);
+        scheduleNextCapture(null);
     }
 }
 
 function captureAndSendFrame() {
     // Safety check: Ensure camera is on and ready
     if (!isCameraOn || !videoElement || videoElement.videoWidth === 0 || !context || !canvas) {
+        if (isCameraOn) scheduleNextCapture(null);
         return;
     }
 
-    // Set canvas dimensions to match video
-    canvas.width = videoElement.videoWidth;
-    canvas.height = videoElement.videoHeight;
+    // Scale the canvas down to the server's max frame edge
+    const scale = Math.min(1, frameLimits.max_edge / Math.max(videoElement.videoWidth, videoElement.videoHeight));
+    canvas.width = Math.round(videoElement.videoWidth * scale);
+    canvas.height = Math.round(videoElement.videoHeight * scale);
 
     // Draw the current video frame onto the canvas
     context.drawImage(videoElement, 0, 0, canvas.width, canvas.height);
 
-    // Get the image data as a Base64 string (JPEG format)
-    const base64Image = canvas.toDataURL('image/jpeg', 0.8);
-
-    // Send the data to the Django API
-    sendFrameForEmotionDetection(base64Image);
+    // Encode as a JPEG Blob and send it to the Django API
+    canvas.toBlob(blob => {
+        if (blob && blob.size <= frameLimits.max_bytes) {
+            sendFrameForEmotionDetection(blob);
+        } else {
+            scheduleNextCapture(null);
+        }
+    }, 'image/jpeg', 0.8);
 }
 
 function startEmotionCapture() {
-    if (captureIntervalId) {
-        clearInterval(captureIntervalId);
-    }
-    captureIntervalId = setInterval(captureAndSendFrame, CAPTURE_INTERVAL_MS);
+    checkCaptureEligibility();
     console.log('Emotion capture started.');
 }
 
 function stopEmotionCapture() {
-    if (captureIntervalId) {
-        clearInterval(captureIntervalId);
-        captureIntervalId = null;
+    if (captureTimeoutId) {
+        clearTimeout(captureTimeoutId);
+        captureTimeoutId = null;
     }
     console.log('Emotion capture stopped.');
 }